@@ -0,0 +1,74 @@
+"""Measure fetch_many() throughput against a local server as the worker count grows.
+
+The server answers each request after a short delay to stand in for network latency.
+
+Run from the repository root:
+    python benchmarks/bench_fetch_many.py
+"""
+# Python imports
+import os
+import sys
+import threading
+import time
+
+if sys.version_info[0] < 3:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+LATENCY = 0.02
+URL_COUNT = 400
+ROBOTS_TXT = b"User-agent: *\nDisallow: /private\n"
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(ROBOTS_TXT)))
+        self.end_headers()
+        self.wfile.write(ROBOTS_TXT)
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(('localhost', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    base = 'http://localhost:%d' % server.server_address[1]
+    # Every URL appears twice to exercise deduplication.
+    urls = ['%s/site%d/robots.txt' % (base, i % (URL_COUNT // 2)) for i in range(URL_COUNT)]
+
+    print("%d URLs (%d unique), %dms server latency" % (URL_COUNT, URL_COUNT // 2,
+                                                        LATENCY * 1000))
+    print("%8s %10s %14s" % ("workers", "time (s)", "fetches/sec"))
+    for max_workers in (1, 4, 16, 64):
+        start = time.time()
+        results = list(robotexclusionrulesparser.fetch_many(urls, max_workers=max_workers))
+        elapsed = time.time() - start
+        assert len(results) == URL_COUNT
+        assert all([error is None for _, _, error in results])
+        print("%8d %10.3f %14.1f" % (max_workers, elapsed, URL_COUNT / elapsed))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
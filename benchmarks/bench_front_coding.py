@@ -0,0 +1,70 @@
+"""Compare the memory and lookup cost of large robots.txt files with and without front coding.
+
+The synthetic files list many product and category paths under a few directories, which is
+what the very large robots.txt files seen in real crawls mostly look like.
+
+Run from the repository root:
+    python benchmarks/bench_front_coding.py
+"""
+# Python imports
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+RULE_COUNTS = (1000, 10000, 50000)
+LOOKUP_COUNT = 20000
+DIRECTORIES = ("/catalog/products/", "/catalog/categories/", "/user/profiles/", "/search/")
+
+
+def make_robots_txt(rng, rule_count):
+    lines = ["User-agent: *"]
+    for _ in range(rule_count):
+        lines.append("Disallow: %s%s-%d/" % (rng.choice(DIRECTORIES),
+                                             rng.choice(("blue", "red", "large", "used")),
+                                             rng.randint(0, 10 ** 6)))
+
+    return "\n".join(lines)
+
+
+def measure(robots_txt, urls, min_rules):
+    robotexclusionrulesparser.FRONT_CODING_MIN_RULES = min_rules
+    gc.collect()
+    tracemalloc.start()
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse(robots_txt)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.time()
+    for url in urls:
+        parser.is_allowed("foobot", url)
+    elapsed = time.time() - start
+
+    return size, elapsed
+
+
+def main():
+    rng = random.Random(0)
+    print("%8s %14s %12s %12s" % ("rules", "store", "bytes/rule", "us/lookup"))
+    for rule_count in RULE_COUNTS:
+        robots_txt = make_robots_txt(rng, rule_count)
+        urls = ["%s%s-%d/index.html" % (rng.choice(DIRECTORIES), rng.choice(("blue", "red")),
+                                        rng.randint(0, 10 ** 6))
+                for _ in range(LOOKUP_COUNT)]
+        for name, min_rules in (("dict", None), ("front-coded", 1)):
+            size, elapsed = measure(robots_txt, urls, min_rules)
+            print("%8d %14s %12.1f %12.2f" % (rule_count, name, size / float(rule_count),
+                                              elapsed / LOOKUP_COUNT * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Measure the memory saved by sharing identical rules among parsers with a RulesInterner.
+
+The synthetic corpus mimics the duplication seen in real crawls: most hosts serve one of a few
+CMS or hosting-provider defaults, and many files repeat the same rules for several user agents.
+
+Run from the repository root:
+    python benchmarks/bench_interning.py
+"""
+# Python imports
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+HOST_COUNT = 20000
+
+WORDPRESS = "User-agent: *\nDisallow: /wp-admin/\nAllow: /wp-admin/admin-ajax.php\n"
+PARKED = "User-agent: *\nDisallow: /\n"
+ALLOW_ALL = "User-agent: *\nDisallow:\n"
+SHOP = "\n\n".join(["User-agent: %s\nDisallow: /cart\nDisallow: /checkout\nDisallow: /account\n"
+                    "Disallow: /search?*\nDisallow: /*?sort=\nDisallow: /*?filter=\n" % agent
+                    for agent in ("Googlebot", "Bingbot", "*")])
+TEMPLATES = (WORDPRESS, PARKED, ALLOW_ALL, SHOP)
+
+
+def make_unique_robots_txt(rng, i):
+    """Return a site-specific robots.txt whose groups repeat the same rules for several bots."""
+    rules = "".join(["Disallow: /site%d/dir%d/\n" % (i, rng.randint(0, 50))
+                     for _ in range(rng.randint(5, 30))])
+    agents = ("Googlebot", "Bingbot", "Slurp", "*")[:rng.randint(1, 4)]
+
+    return "\n".join(["User-agent: %s\n%s" % (agent, rules) for agent in agents])
+
+
+def make_corpus(rng):
+    corpus = []
+    for i in range(HOST_COUNT):
+        if rng.random() < 0.7:
+            corpus.append(rng.choice(TEMPLATES))
+        else:
+            corpus.append(make_unique_robots_txt(rng, i))
+
+    return corpus
+
+
+def measure(corpus, interner):
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    parsers = []
+    for robots_txt in corpus:
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.interner = interner
+        parser.parse(robots_txt)
+        parsers.append(parser)
+    elapsed = time.time() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return size, elapsed
+
+
+def main():
+    corpus = make_corpus(random.Random(0))
+
+    print("%d hosts" % HOST_COUNT)
+    print("%14s %12s %12s" % ("interner", "bytes/host", "us/parse"))
+    interner = robotexclusionrulesparser.RulesInterner()
+    for name, parser_interner in (("none", None), ("RulesInterner", interner)):
+        size, elapsed = measure(corpus, parser_interner)
+        print("%14s %12.0f %12.1f" % (name, size / float(HOST_COUNT),
+                                      elapsed / HOST_COUNT * 1e6))
+
+    print("dedup ratio: %.1f files and %.1f rulesets per distinct one" %
+          (interner.dedup_ratio,
+           interner.rulesets / float(interner.rulesets - interner.ruleset_hits)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Compare is_allowed_many() to calling is_allowed() once per URL.
+
+Run from the repository root:
+    python benchmarks/bench_is_allowed_many.py
+"""
+# Python imports
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+URL_COUNT = 100000
+
+
+def make_robots_txt(rng, rule_count, wildcard_count):
+    lines = ["User-agent: Googlebot", "Disallow: /", "", "User-agent: *"]
+    for i in range(rule_count):
+        directive = "Allow" if (i % 5 == 0) else "Disallow"
+        lines.append("%s: /section%d/%s" % (directive, rng.randint(0, 500),
+                                            "page%d" % i if (i % 3) else ""))
+    for i in range(wildcard_count):
+        lines.append("Disallow: /*?sessionid%d=*" % i)
+
+    return "\n".join(lines)
+
+
+def make_urls(rng):
+    return ["http://www.example.com/section%d/page%d?id=%d" %
+            (rng.randint(0, 600), rng.randint(0, 1000), i) for i in range(URL_COUNT)]
+
+
+def best_time(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+
+    return min(times)
+
+
+def main():
+    rng = random.Random(0)
+    urls = make_urls(rng)
+
+    print("%d URLs from one host per batch" % URL_COUNT)
+    print("%6s %10s %12s %12s %9s" % ("rules", "wildcards", "loop (s)", "batch (s)", "speedup"))
+    for rule_count, wildcard_count in ((10, 0), (200, 0), (5000, 0), (200, 5)):
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(make_robots_txt(rng, rule_count, wildcard_count))
+
+        expected = [parser.is_allowed("CrunchyFrogBot", url) for url in urls]
+        assert parser.is_allowed_many("CrunchyFrogBot", urls) == expected
+
+        loop_time = best_time(lambda: [parser.is_allowed("CrunchyFrogBot", url) for url in urls])
+        batch_time = best_time(lambda: parser.is_allowed_many("CrunchyFrogBot", urls))
+
+        print("%6d %10d %12.3f %12.3f %8.1fx" % (rule_count, wildcard_count, loop_time,
+                                                 batch_time, loop_time / batch_time))
+
+
+if __name__ == '__main__':
+    main()
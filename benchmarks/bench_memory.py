@@ -0,0 +1,71 @@
+"""Measure the memory used per host by parsers of typical and trivial robots.txt files.
+
+Run from the repository root:
+    python benchmarks/bench_memory.py
+"""
+# Python imports
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+HOST_COUNT = 5000
+
+
+def make_robots_txt(rng):
+    """Return a robots.txt of a typical size: a few rulesets with a few dozen rules in all."""
+    lines = ["Sitemap: http://example.com/sitemap.xml", ""]
+    for agent in ("Googlebot", "Bingbot", "*")[:rng.randint(1, 3)]:
+        lines.append("User-agent: %s" % agent)
+        for _ in range(rng.randint(5, 30)):
+            directive = rng.choice(("Allow", "Disallow", "Disallow"))
+            lines.append("%s: /dir%d/page%d.html" % (directive, rng.randint(0, 50),
+                                                     rng.randint(0, 50)))
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def measure(load, items):
+    """Return the bytes per item retained by the parsers that load() creates."""
+    gc.collect()
+    tracemalloc.start()
+    parsers = [load(item) for item in items]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(parsers) == len(items)
+
+    return size / float(len(items))
+
+
+def parse(s):
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse(s)
+    return parser
+
+
+def main():
+    rng = random.Random(0)
+    typical = [make_robots_txt(rng) for _ in range(HOST_COUNT)]
+    trivial = ["", "User-agent: *\nDisallow: /\n", "User-agent: *\nDisallow:\n"] * \
+        (HOST_COUNT // 3)
+    serialized = [parse(s).to_bytes() for s in typical]
+    from_bytes = robotexclusionrulesparser.RobotExclusionRulesParser.from_bytes
+
+    print("%d hosts" % HOST_COUNT)
+    print("%24s %12s" % ("robots.txt", "bytes/host"))
+    for name, load, items in (("typical, parse()", parse, typical),
+                              ("typical, from_bytes()", from_bytes, serialized),
+                              ("trivial, parse()", parse, trivial)):
+        print("%24s %12.0f" % (name, measure(load, items)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Measure how many rules minimize() removes from typical robots.txt files and what that saves.
+
+The synthetic corpus has the kinds of dead rules that real files are full of: duplicated
+lines, rules inside directories that are already disallowed, and whole lists of rules after
+"Disallow: /".
+
+Run from the repository root:
+    python benchmarks/bench_minimize.py
+"""
+# Python imports
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+HOST_COUNT = 2000
+LOOKUP_COUNT = 50000
+DIRECTORIES = ("/admin/", "/cgi-bin/", "/tmp/", "/private/", "/search", "/cart/", "/*.php$")
+
+
+def make_robots_txt(rng):
+    rules = []
+    for _ in range(rng.randint(5, 60)):
+        directory = rng.choice(DIRECTORIES)
+        if rng.random() < 0.5 and not directory.endswith("$"):
+            directory += "page%d.html" % rng.randint(0, 20)
+        rules.append("Disallow: %s" % directory)
+    if rng.random() < 0.2:
+        rules.insert(rng.randint(0, len(rules)), "Disallow: /")
+    rules.append("Allow: /")
+
+    return "User-agent: *\n" + "\n".join(rules)
+
+
+def measure(corpus, urls, minimize_rules):
+    gc.collect()
+    tracemalloc.start()
+    parsers = []
+    for robots_txt in corpus:
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.minimize_rules = minimize_rules
+        parser.parse(robots_txt)
+        parsers.append(parser)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.time()
+    for i, url in enumerate(urls):
+        parsers[i % HOST_COUNT].is_allowed("foobot", url)
+    elapsed = time.time() - start
+
+    return parsers, size, elapsed
+
+
+def main():
+    rng = random.Random(0)
+    corpus = [make_robots_txt(rng) for _ in range(HOST_COUNT)]
+    urls = ["%spage%d.html" % (rng.choice(DIRECTORIES).rstrip("$"), rng.randint(0, 40))
+            for _ in range(LOOKUP_COUNT)]
+
+    print("%d hosts" % HOST_COUNT)
+    print("%10s %12s %12s %12s" % ("minimize", "rules/host", "bytes/host", "us/lookup"))
+    for minimize_rules in (False, True):
+        parsers, size, elapsed = measure(corpus, urls, minimize_rules)
+        rules = sum([len(parser._RobotExclusionRulesParser__rulesets[0].rules)
+                     for parser in parsers])
+        print("%10s %12.1f %12.0f %12.2f" % (minimize_rules, rules / float(HOST_COUNT),
+                                             size / float(HOST_COUNT),
+                                             elapsed / LOOKUP_COUNT * 1e6))
+
+    eliminated = sum([parser.eliminated_rules for parser in parsers])
+    print("eliminated %.1f rules per host" % (eliminated / float(HOST_COUNT)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Measure parse() throughput on a large generated robots.txt.
+
+Run from the repository root:
+    python benchmarks/bench_parse.py
+"""
+# Python imports
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+LINE_COUNT = 100000
+
+
+def make_robots_txt(rng, line_count):
+    """Return a robots.txt with line_count lines in a realistic mix of directives, comments and
+    blank lines.
+    """
+    lines = []
+    for i in range(line_count):
+        choice = rng.random()
+        if choice < .02:
+            lines.append("")
+            lines.append("User-agent: bot%d" % rng.randint(0, 100))
+        elif choice < .07:
+            lines.append("# Comment number %d" % i)
+        elif choice < .10:
+            lines.append("Allow: /dir%d/page.html  # Trailing comment" % rng.randint(0, 1000))
+        elif choice < .11:
+            lines.append("Crawl-delay: %d" % rng.randint(1, 10))
+        elif choice < .12:
+            lines.append("Sitemap: http://example.com/sitemap%d.xml" % i)
+        else:
+            lines.append("Disallow: /dir%d/*.php$" % rng.randint(0, 1000))
+
+    return "\r\n".join(lines)
+
+
+def main():
+    robots_txt = make_robots_txt(random.Random(0), LINE_COUNT)
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+
+    elapsed = min(timeit.repeat(lambda: parser.parse(robots_txt), number=1, repeat=5))
+    print("%d lines (%d bytes): %.3fs, %.0f lines/sec" % (LINE_COUNT, len(robots_txt), elapsed,
+                                                          LINE_COUNT / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Compare the prefix index to a linear scan of plain Allow/Disallow rules.
+
+Run from the repository root:
+    python benchmarks/bench_prefix_index.py
+"""
+# Python imports
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+RULE_COUNTS = (10, 1000, 50000)
+URL_COUNT = 2000
+
+
+def make_robots_txt(rng, rule_count):
+    """Return a robots.txt with rule_count plain rules for the default user agent."""
+    lines = ["User-agent: *"]
+    for i in range(rule_count):
+        directive = "Allow" if (i % 7 == 0) else "Disallow"
+        depth = rng.randint(1, 4)
+        path = "/" + "/".join("dir%d" % rng.randint(0, 200) for _ in range(depth))
+        lines.append("%s: %s" % (directive, path))
+
+    return "\n".join(lines)
+
+
+def make_urls(rng):
+    return ["/" + "/".join("dir%d" % rng.randint(0, 250) for _ in range(rng.randint(1, 6))) +
+            "/index.html" for _ in range(URL_COUNT)]
+
+
+def time_lookups(robots_txt, urls, min_rules):
+    robotexclusionrulesparser.PREFIX_INDEX_MIN_RULES = min_rules
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse(robots_txt)
+
+    def run():
+        for url in urls:
+            parser.is_allowed("foobot", url)
+
+    return min(timeit.repeat(run, number=1, repeat=3)) / len(urls)
+
+
+def main():
+    rng = random.Random(0)
+    urls = make_urls(rng)
+    print("%8s %16s %16s %9s" % ("rules", "linear (us/url)", "indexed (us/url)", "speedup"))
+    for rule_count in RULE_COUNTS:
+        robots_txt = make_robots_txt(rng, rule_count)
+        linear = time_lookups(robots_txt, urls, None)
+        indexed = time_lookups(robots_txt, urls, 1)
+        print("%8d %16.2f %16.2f %8.1fx" % (rule_count, linear * 1e6, indexed * 1e6,
+                                            linear / indexed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compare loading parsers with from_bytes(), from_json() and pickle to parsing robots.txt files.
+
+Run from the repository root:
+    python benchmarks/bench_serialization.py
+"""
+# Python imports
+import os
+import pickle
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+HOST_COUNT = 2000
+
+
+def make_robots_txt(rng):
+    """Return a robots.txt of a typical size: a few rulesets with a few dozen rules in all."""
+    lines = ["Sitemap: http://example.com/sitemap.xml", ""]
+    for agent in ("Googlebot", "Bingbot", "*")[:rng.randint(1, 3)]:
+        lines.append("User-agent: %s" % agent)
+        for _ in range(rng.randint(5, 30)):
+            directive = rng.choice(("Allow", "Disallow", "Disallow"))
+            lines.append("%s: /dir%d/page%d.html" % (directive, rng.randint(0, 50),
+                                                     rng.randint(0, 50)))
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def main():
+    rng = random.Random(0)
+    robots_txts = [make_robots_txt(rng) for _ in range(HOST_COUNT)]
+    parsers = []
+    for robots_txt in robots_txts:
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(robots_txt)
+        parsers.append(parser)
+    rerp = robotexclusionrulesparser.RobotExclusionRulesParser
+
+    serialized = (
+        ("parse()", robots_txts, lambda s: rerp().parse(s)),
+        ("from_bytes()", [parser.to_bytes() for parser in parsers], rerp.from_bytes),
+        ("from_json()", [parser.to_json() for parser in parsers], rerp.from_json),
+        ("pickle", [pickle.dumps(parser, pickle.HIGHEST_PROTOCOL) for parser in parsers],
+         pickle.loads),
+    )
+
+    print("%d parsers" % HOST_COUNT)
+    print("%14s %12s %14s" % ("method", "avg. bytes", "us/parser"))
+    for name, items, load in serialized:
+        elapsed = min(timeit.repeat(lambda: [load(item) for item in items], number=1, repeat=3))
+        size = sum([len(item) for item in items]) / float(len(items))
+        print("%14s %12.0f %14.1f" % (name, size, elapsed / len(items) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Compare opening a snapshot of many hosts' rules to loading them with from_bytes(), and compare
+the speed of their answers.
+
+Run from the repository root:
+    python benchmarks/bench_snapshot.py
+"""
+# Python imports
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+HOST_COUNT = 20000
+QUERY_COUNT = 20000
+BIG_HOST_RULES = 50000
+
+
+def make_robots_txt(rng):
+    lines = []
+    for agent in ("Googlebot", "Bingbot", "*")[:rng.randint(1, 3)]:
+        lines.append("User-agent: %s" % agent)
+        for _ in range(rng.randint(5, 30)):
+            directive = rng.choice(("Allow", "Disallow", "Disallow"))
+            lines.append("%s: /dir%d/page%d.html" % (directive, rng.randint(0, 50),
+                                                     rng.randint(0, 50)))
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def main():
+    rng = random.Random(0)
+    parsers = []
+    for i in range(HOST_COUNT):
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(make_robots_txt(rng))
+        parsers.append(("http://host%d.example.com/robots.txt" % i, parser))
+    serialized = [(url, parser.to_bytes()) for url, parser in parsers]
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "robots.snapshot")
+    robotexclusionrulesparser.write_snapshot(path, parsers)
+
+    start = time.time()
+    snapshot = robotexclusionrulesparser.RobotsSnapshot(path)
+    print("%d hosts, snapshot is %d bytes" % (HOST_COUNT, os.path.getsize(path)))
+    print("open snapshot: %.4fs" % (time.time() - start))
+
+    start = time.time()
+    loaded = dict([(url, robotexclusionrulesparser.RobotExclusionRulesParser.from_bytes(data))
+                   for url, data in serialized])
+    print("from_bytes() all hosts: %.4fs" % (time.time() - start))
+
+    queries = [("http://host%d.example.com/dir%d/page%d.html" %
+                (rng.randint(0, HOST_COUNT - 1), rng.randint(0, 50), rng.randint(0, 50)))
+               for _ in range(QUERY_COUNT)]
+
+    def ask_snapshot():
+        for url in queries:
+            snapshot.is_allowed("Googlebot", url)
+
+    def ask_parsers():
+        for url in queries:
+            loaded[url.split("/dir")[0] + "/robots.txt"].is_allowed("Googlebot", url)
+
+    for name, function in (("snapshot", ask_snapshot), ("parsers", ask_parsers)):
+        elapsed = min(timeit.repeat(function, number=1, repeat=3))
+        print("%8s is_allowed(): %.1f us/query" % (name, elapsed / QUERY_COUNT * 1e6))
+
+    snapshot.close()
+
+    # One host with many rules: the cost of a query depends on how far down the rules it has to
+    # look before one matches.
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse("User-agent: *\n" + "".join(["Disallow: /catalog/item-%d/\n" % i
+                                              for i in range(BIG_HOST_RULES)]))
+    robotexclusionrulesparser.write_snapshot(path, [("http://big.example.com/", parser)])
+    snapshot = robotexclusionrulesparser.RobotsSnapshot(path)
+    print("%d rules on one host" % BIG_HOST_RULES)
+    for url_path in ("/catalog/item-0/", "/catalog/item-%d/" % (BIG_HOST_RULES - 1), "/other"):
+        url = "http://big.example.com" + url_path
+        elapsed = min(timeit.repeat(lambda: snapshot.is_allowed("Googlebot", url), number=10,
+                                    repeat=3)) / 10
+        print("%25s is_allowed(): %.1f us/query" % (url_path, elapsed * 1e6))
+
+    snapshot.close()
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Compare answering for a whole directory with is_subtree_allowed() to checking its URLs one by
+one with is_allowed().
+
+Run from the repository root:
+    python benchmarks/bench_subtree.py
+"""
+# Python imports
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+ROBOTS_TXT = "User-agent: *\n" + "".join(["Disallow: /archive/%d/\n" % year
+                                          for year in range(1990, 2020)]) + \
+             "Disallow: /*.pdf$\nAllow: /archive/2019/public/\n"
+URLS_PER_DIRECTORY = 10000
+REPEAT = 1000
+
+
+def main():
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse(ROBOTS_TXT)
+    prefix = "/archive/2005/"
+    urls = ["%spage%d.html" % (prefix, i) for i in range(URLS_PER_DIRECTORY)]
+
+    start = time.time()
+    for url in urls:
+        parser.is_allowed("foobot", url)
+    per_url = time.time() - start
+
+    start = time.time()
+    for _ in range(REPEAT):
+        verdict = parser.is_subtree_allowed("foobot", prefix)
+    per_subtree = (time.time() - start) / REPEAT
+    assert verdict == robotexclusionrulesparser.SUBTREE_DISALLOWED
+
+    print("%d URLs under %s" % (URLS_PER_DIRECTORY, prefix))
+    print("is_allowed() for each URL:  %10.1f us" % (per_url * 1e6))
+    print("is_subtree_allowed() once:  %10.1f us" % (per_subtree * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Show that the wildcard matcher's cost grows linearly with the URL length, even for patterns
+that made the old regex-based matcher backtrack polynomially, and compare matching many rules
+one at a time to matching them with the merged tree in _WildcardSet.
+
+Run from the repository root:
+    python benchmarks/bench_wildcards.py
+"""
+# Python imports
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Project imports
+import robotexclusionrulesparser  # noqa E402
+
+HOSTILE_PATH = "/a*b*c*d*e*f*z"
+
+# Each of these paths is timed against each of these URLs; none of them match.
+ADVERSARIAL_PATHS = ("/a*b*c*d*e*f*z",
+                     "/*a*a*a*a*a*a*a*a*a*a*b$",
+                     "*/*/*/*/*/*/*/*/*/*/*/*.php$")
+ADVERSARIAL_URLS = ("/" + "abcdef" * 2000,
+                    "/" + "a" * 10000,
+                    "/" + "x/" * 5000 + "index.html")
+
+
+def old_regex_match(path, url):
+    """The regex the matcher used before it was replaced."""
+    path = re.sub(r'\*+', '*', path)
+    pattern = ".*".join([re.escape(p) for p in path.split("*")])
+    return re.match(pattern, url)
+
+
+def glob_match(path, url):
+    segments, anchored = robotexclusionrulesparser._wildcard_segments(path)
+    return robotexclusionrulesparser._glob_match(segments, anchored, url)
+
+
+SESSION_RULE_COUNT = 40
+SESSION_URLS = ("/catalog/products/blue-widget/index.html?color=red&size=large",
+                "/catalog/index.html?sessionid%d=1" % (SESSION_RULE_COUNT - 1))
+REPEAT = 10000
+
+
+def time_one(func, url, path=HOSTILE_PATH):
+    start = time.time()
+    func(path, url)
+    return time.time() - start
+
+
+def main():
+    print("Pattern: %s against '/' + 'abcdef' * n (never matches)" % HOSTILE_PATH)
+    print("%8s %16s %16s" % ("len(url)", "old regex (ms)", "glob (ms)"))
+    for n in (5, 10, 20, 30):
+        url = "/" + "abcdef" * n
+        print("%8d %16.3f %16.3f" % (len(url), time_one(old_regex_match, url) * 1e3,
+                                     time_one(glob_match, url) * 1e3))
+    # The old regex would take years at these lengths.
+    for n in (1000, 10000, 100000):
+        url = "/" + "abcdef" * n
+        print("%8d %16s %16.3f" % (len(url), "-", time_one(glob_match, url) * 1e3))
+
+    print("")
+    print("Adversarial patterns")
+    print("%30s %8s %10s" % ("path", "len(url)", "glob (ms)"))
+    for path in ADVERSARIAL_PATHS:
+        for url in ADVERSARIAL_URLS:
+            print("%30s %8d %10.3f" % (path, len(url), time_one(glob_match, url, path) * 1e3))
+
+    # Each rule on its own versus the merged tree that is_url_allowed() uses.
+    paths = [(i, "/*?sessionid%d=*" % i) for i in range(SESSION_RULE_COUNT)]
+    rules = [(i, robotexclusionrulesparser._wildcard_segments(path)) for i, path in paths]
+    wildcards = robotexclusionrulesparser._WildcardSet(paths)
+
+    def one_at_a_time(url):
+        for i, (segments, anchored) in rules:
+            if robotexclusionrulesparser._glob_match(segments, anchored, url):
+                return i
+        return None
+
+    print("")
+    print("%d rules like /*?sessionid=*" % SESSION_RULE_COUNT)
+    print("%8s %22s %16s" % ("match", "one at a time (us)", "merged (us)"))
+    for url in SESSION_URLS:
+        times = []
+        for func in (one_at_a_time, wildcards.first_match):
+            start = time.time()
+            for _ in range(REPEAT):
+                match = func(url)
+            times.append((time.time() - start) / REPEAT * 1e6)
+        print("%8s %22.2f %16.2f" % (match, times[0], times[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -84,18 +84,49 @@ if PY_MAJOR_VERSION < 3:
     from urlparse import urlparse as urllib_urlparse
     from urlparse import urlunparse as urllib_urlunparse
     from urllib import unquote as urllib_unquote
+    from urlparse import urljoin as urllib_urljoin
+    import Queue as queue
+    import httplib as http_client
     import urllib2 as urllib_request
     import urllib2 as urllib_error
+    # fetch_async() isn't available under Python 2.
+    asyncio = None
 else:
     import urllib.request as urllib_request
     import urllib.error as urllib_error
     from urllib.parse import unquote as urllib_unquote
     from urllib.parse import urlparse as urllib_urlparse
     from urllib.parse import urlunparse as urllib_urlunparse
+    from urllib.parse import urljoin as urllib_urljoin
+    import queue
+    import http.client as http_client
+    import asyncio
 
 import re                              # noqa E402
 import time                            # noqa E402
 import calendar                        # noqa E402
+import operator                        # noqa E402
+import threading                       # noqa E402
+import socket                          # noqa E402
+import collections                     # noqa E402
+import copy                            # noqa E402
+import contextlib                      # noqa E402
+import zlib                            # noqa E402
+import codecs                          # noqa E402
+import struct                          # noqa E402
+import json                            # noqa E402
+import mmap                            # noqa E402
+import os                              # noqa E402
+import tempfile                        # noqa E402
+import weakref                         # noqa E402
+import array                           # noqa E402
+import bisect                          # noqa E402
+
+try:
+    import sqlite3
+except ImportError:
+    # Some Python builds leave it out. SQLiteRobotsStore isn't available.
+    sqlite3 = None
 import email.utils as email_utils      # noqa E402
 
 # flake8 note -- under Python3, flake8 complains about 'unicode' references so a couple of lines
@@ -116,19 +147,146 @@ _end_of_line_regex = re.compile(r"(?:\r\n)|\r|\n")
 _directive_regex = re.compile("(allow|disallow|user[-]?agent|sitemap|crawl-delay):[ \t]*(.*)",
                               re.IGNORECASE)
 
+# _tokenize_line() looks up the text before a line's first colon here before
+# resorting to _directive_regex. The values are the names used in
+# _RulesBuilder, so "useragent" maps to "user-agent".
+_DIRECTIVES = {"user-agent": "user-agent", "useragent": "user-agent", "allow": "allow",
+               "disallow": "disallow", "sitemap": "sitemap", "crawl-delay": "crawl-delay"}
+
 # This is the number of seconds in a week that I use to determine the default
 # expiration date defined in MK1996.
 SEVEN_DAYS = 60 * 60 * 24 * 7
 
+# These are the default floor and ceiling (in seconds) for the time between
+# fetching a robots.txt and its expiration. The floor keeps a server that
+# sends e.g. "Cache-Control: no-cache" from making a crawler refetch its
+# robots.txt before every request. None means no limit. Each parser has
+# min_ttl and max_ttl attributes that override these.
+MIN_TTL = 60
+MAX_TTL = None
+
+# When fetching a robots.txt fails (with a network error, a timeout, or a
+# response code other than 2xx, 304, 401, 403 or 404), the parser waits
+# BACKOFF_INITIAL seconds before trying again, then twice that after a
+# second consecutive failure, and so on up to BACKOFF_MAX. A Retry-After
+# header overrides this.
+BACKOFF_INITIAL = 60
+BACKOFF_MAX = 60 * 60 * 24
+
+# These are the choices for a parser's fallback attribute which controls
+# the rules in effect after a failed fetch. They're ignored if the parser
+# has no rules from a previous fetch or parse(), in which case everything
+# is disallowed.
+FALLBACK_DISALLOW_ALL = 1
+FALLBACK_KEEP_LAST_GOOD = 2
+
+# These are the answers of is_subtree_allowed(). SUBTREE_MIXED means that
+# some URLs in the subtree may be allowed and others not, so they have to
+# be checked one by one.
+SUBTREE_ALLOWED = 1
+SUBTREE_DISALLOWED = 2
+SUBTREE_MIXED = 3
+
 # This controls the max number of bytes read in as a robots.txt file. This
 # is just a bit of defensive programming in case someone accidentally sends
 # an ISO file in place of their robots.txt. (It happens...)  Suggested by
 # Dima Brodsky.
 MAX_FILESIZE = 100 * 1024   # 100k
 
+# Rulesets with at least this many plain (non-wildcard) rules get a prefix
+# index so that finding the first matching rule doesn't require checking
+# every rule. Set it to None to always use a linear scan.
+PREFIX_INDEX_MIN_RULES = 16
+
+# Rulesets with at least this many rules store their paths front-coded (see
+# _FrontCodedPaths) which takes much less memory but makes lookups somewhat
+# slower. It's meant for crawlers that cache very large robots.txt files or
+# very many hosts. None (the default) turns it off.
+FRONT_CODING_MIN_RULES = None
+_FRONT_CODING_BLOCK_SIZE = 16
+
+# fetch_async() parses robots.txt files at least this big in a worker thread
+# (via the event loop's default executor) so that it doesn't stall the event
+# loop. Smaller files are parsed directly because handing them to a thread
+# costs more than parsing them.
+ASYNC_PARSE_IN_EXECUTOR_SIZE = 16 * 1024
+
+# This is the maximum number of redirects that fetch_async() will follow. It's
+# the same limit that urllib applies for fetch().
+MAX_REDIRECTS = 10
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# This is the version of the format written by to_bytes() and to_json().
+# from_bytes() and from_json() reject anything else. Bump it when the format
+# changes.
+SERIALIZATION_VERSION = 1
+
+# The to_bytes() format is --
+#    - a header (magic number, version, flags, expiration date, response
+#      code, the number of sitemaps, rulesets and rules, and the size of
+#      the strings),
+#    - for each ruleset, the number of user agent names and rules,
+#    - for each ruleset, a byte that says if it has a crawl delay,
+#    - for each ruleset, the crawl delay (or 0),
+#    - for each rule, its type (_Ruleset.ALLOW or DISALLOW),
+#    - all the strings encoded as UTF-8 and separated by newlines: the
+#      source URL, the validators (if present), the sitemaps, and then for
+#      each ruleset its names followed by its rules' paths. Newlines can't
+#      appear in any of these.
+# All numbers are little-endian.
+_SERIALIZATION_MAGIC = b"RERP"
+_serialization_header = struct.Struct("<4sBBdiIIII")
+# These are the bits in the header's flags.
+_SERIALIZED_USE_LOCAL_TIME = 1
+_SERIALIZED_HAS_GOOD_RULES = 2
+_SERIALIZED_ETAG = 4
+_SERIALIZED_LAST_MODIFIED = 8
+
+# A snapshot (see write_snapshot() and RobotsSnapshot) is --
+#    - a header (magic number, version, number of hosts and number of slots
+#      in the hash table),
+#    - a hash table of 8-byte offsets (0 for an empty slot) of each host's
+#      record, indexed by the CRC-32 of the origin key with linear probing,
+#    - for each host, the origin key (2-byte length + ASCII) followed by the
+#      expiration date (a double), the number of rulesets and then each
+#      ruleset in the order in which they're consulted.
+# A ruleset is a header (its size in bytes, the number of rules, the size
+# of its names, a crawl delay flag and the crawl delay), the lower case
+# names (UTF-8, separated by newlines), a byte of _SNAPSHOT_* flags for each
+# rule, the 4-byte length of each rule's path, and then the paths (UTF-8).
+# All numbers are little-endian.
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_MAGIC = b"RERS"
+_snapshot_header = struct.Struct("<4sBxxxQQ")
+_snapshot_offset = struct.Struct("<Q")
+_snapshot_host = struct.Struct("<dI")
+_snapshot_ruleset = struct.Struct("<IIIBd")
+_snapshot_length = struct.Struct("<H")
+# RobotsSnapshot.is_allowed() reads this many rules' flags and lengths at once.
+_SNAPSHOT_RULES_PER_READ = 64
+# These are the bits in a rule's flags.
+_SNAPSHOT_ALLOW = 1
+_SNAPSHOT_WILDCARD = 2
+
+# These are the ports that RobotsRegistry assumes when a URL doesn't specify one.
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+if PY_MAJOR_VERSION < 3:
+    # intern() only accepts byte strings and the paths are Unicode.
+    def _intern_path(path):
+        return path
+else:
+    _intern_path = sys.intern
+
 # Control characters are everything < 0x20 and 0x7f.
 _control_characters_regex = re.compile(r"""[\000-\037]|\0177""")
 
+# This matches URLs that consist of an optional http(s) scheme and plain host
+# name followed by a path (and maybe a query) that has no fragment, no
+# parameters and none of the characters that urlparse() discards.
+_simple_url_regex = re.compile(r"(?:https?://[A-Za-z0-9.:@_~-]*)?(?P<path>/(?!/)[^#;\t\r\n]*)\Z")
+
 # Charset extraction regex for pulling the encoding (charset) out of a
 # content-type header.
 _charset_extraction_regex = re.compile(r"""charset=['"]?(?P<encoding>[^'"]*)['"]?""")
@@ -138,6 +296,9 @@ def _unquote_path(path):
     # MK1996 says, 'If a %xx encoded octet is encountered it is unencoded
     # prior to comparison, unless it is the "/" character, which has
     # special meaning in a path.'
+    if "%" not in path:
+        # Most paths don't have any encoded octets.
+        return path
     path = re.sub("%2[fF]", "\n", path)
     path = urllib_unquote(path)
     return path.replace("\n", "%2F")
@@ -149,9 +310,64 @@ def _scrub_data(s):
     # whitespace, (b) turning tabs into spaces (path and UA names should not
     # contain tabs), and (c) stripping control characters which, like tabs,
     # shouldn't be present. (See MK1996 section 3.3 "Formal Syntax".)
-    s = _control_characters_regex.sub("", s)
-    s = s.replace("\t", " ")
-    return s.strip()
+    # Tabs are control characters, so (b) happens as part of (c).
+    return _control_characters_regex.sub("", s).strip()
+
+
+def _tokenize_line(line):
+    """Classifies one line of a robots.txt (without its line ending).
+
+    Returns None for lines to ignore: comments and anything that's not one
+    of the directives in _DIRECTIVES. Returns (None, None) for an empty line,
+    which ends a ruleset. Otherwise returns (directive, data) where directive
+    is a value from _DIRECTIVES and data has been through _scrub_data().
+    """
+    i = line.find("#")
+    if i != -1:
+        # Remove comments
+        line = line[:i]
+    line = line.strip()
+
+    if not line:
+        # "Lines containing only a comment are discarded completely,
+        # and therefore do not indicate a record boundary." (MK1994)
+        # An empty line, on the other hand, indicates the end of a ruleset.
+        return None if (i != -1) else (None, None)
+
+    # Each non-empty line falls into one of six categories:
+    # 1) User-agent: blah blah blah
+    # 2) Disallow: blah blah blah
+    # 3) Allow: blah blah blah
+    # 4) Crawl-delay: blah blah blah
+    # 5) Sitemap: blah blah blah
+    # 6) Everything else
+    # 1 - 5 are interesting. Category 6 I discard as directed by the MK1994
+    # ("Unrecognised headers are ignored.")
+    # Note that 4 & 5 are specific to GYM2008 syntax, but respecting them
+    # here is not a problem. They're just additional information the the
+    # caller is free to ignore.
+    colon = line.find(":")
+    if colon == -1:
+        return None
+
+    directive = _DIRECTIVES.get(line[:colon].lower())
+    if directive:
+        data = line[colon + 1:]
+    else:
+        # The regex is slower but more generous. For instance, it doesn't
+        # insist that the directive is at the very beginning of the line
+        # which makes this code immune to confusion caused by byte order
+        # markers.
+        match = _directive_regex.search(line)
+        if not match:
+            return None
+        # The regex ignores case the Unicode way, so it also matches
+        # variants like "Di\u017fallow" (with a long s) that aren't in
+        # _DIRECTIVES. Like the parser always has, I treat them as Disallow.
+        directive = _DIRECTIVES.get(match.group(1).lower(), "disallow")
+        data = match.group(2)
+
+    return directive, _scrub_data(data)
 
 
 def _parse_content_type_header(header):
@@ -175,6 +391,723 @@ def _parse_content_type_header(header):
     return media_type.strip(), encoding.strip()
 
 
+def _parse_cache_control_header(header):
+    """Returns a dict of the directives in a Cache-Control header. Directive
+    names are lower case; directives without a value map to None.
+    """
+    directives = {}
+    if header:
+        for directive in header.split(","):
+            name, _, value = directive.partition("=")
+            name = name.strip().lower()
+            if name:
+                directives[name] = value.strip().strip('"') if value else None
+
+    return directives
+
+
+def _parse_seconds(value):
+    """Returns the delta-seconds value (RFC 7234 sec 1.2.1) as an int, or None
+    if it's missing or invalid.
+    """
+    if value and value.isdigit():
+        return int(value)
+
+    return None
+
+
+def _parse_retry_after_header(header, now):
+    """Returns the number of seconds (relative to now, a UTC timestamp) that
+    a Retry-After header specifies, or None if it's missing or invalid. The
+    header can be either a number of seconds or an HTTP date.
+    """
+    if not header:
+        return None
+    header = header.strip()
+    if header.isdigit():
+        return int(header)
+    date = email_utils.parsedate_tz(header)
+    if not date:
+        return None
+    if date[9] is None:
+        # See the comment about time zones in _handle_response().
+        date = date[:9] + (0,)
+
+    return max(email_utils.mktime_tz(date) - now, 0)
+
+
+def _wildcard_segments(path):
+    """Splits a GYM2008 path that contains wildcards (*) and/or an end-of-URL
+    anchor ($) into a 2-tuple of (literal segments, anchored).
+    """
+    # GYM2008-specific syntax applies here
+    # http://www.google.com/support/webmasters/bin/answer.py?hl=en&answer=40360
+    anchored = path.endswith("$")
+    if anchored:
+        path = path[:-1]
+    # Multiple wildcards characters mean the same as one wildcard so they can be
+    # condensed into one.
+    # ref: https://bitbucket.org/philip_semanchuk/robotexclusionrulesparser/issues/1
+    if "**" in path:
+        path = re.sub(r'\*+', '*', path)
+    return tuple(path.split("*")), anchored
+
+
+def _glob_match(segments, anchored, url):
+    """True if the URL matches the wildcard path described by segments and
+    anchored (see _wildcard_segments()).
+
+    This used to be done with a regex in which each * became .* but that
+    backtracks polynomially on patterns like /a*b*c*d*e*f* so a hostile
+    robots.txt could pin a CPU. Here each segment is matched at its leftmost
+    possible position and never reconsidered. That's safe because the
+    leftmost match leaves the most room for the segments that follow, so
+    the worst case is O(len(url) * len(segments)).
+
+    The results are identical to those of the old regex, including its
+    quirks -- a wildcard doesn't match a newline (which can only appear via
+    a %-encoded octet) and $ matches before a trailing newline.
+    """
+    if not url.startswith(segments[0]):
+        return False
+
+    position = len(segments[0])
+    last = len(segments) - 1
+
+    if anchored and not last:
+        # There are no wildcards, only the anchor.
+        return _glob_match_end(None, position, url)
+
+    for segment in segments[1:last] if anchored else segments[1:]:
+        i = url.find(segment, position)
+        if (i == -1) or (url.find("\n", position, i) != -1):
+            return False
+        position = i + len(segment)
+
+    if anchored:
+        return _glob_match_end(segments[last], position, url)
+
+    return True
+
+
+def _glob_match_end(tail, position, url):
+    """True if the rest of the URL from position matches *tail$ or, if tail
+    is None, $ (with the quirks described in _glob_match()).
+    """
+    url_length = len(url)
+    if tail is None:
+        return (position == url_length) or \
+               ((position == url_length - 1) and url.endswith("\n"))
+
+    ends = (url_length, url_length - 1) if url.endswith("\n") else (url_length, )
+    for end in ends:
+        i = end - len(tail)
+        if (i >= position) and url.startswith(tail, i) and \
+           (url.find("\n", position, i) == -1):
+            return True
+
+    return False
+
+
+class _GlobNode(object):
+    """A node of a _WildcardSet's tree. See _WildcardSet."""
+    __slots__ = ("segment", "index", "ends", "children", "first", "prefilter")
+
+    def __init__(self, segment):
+        self.segment = segment
+        # The index of the first unanchored rule whose segments end here, or
+        # None.
+        self.index = None
+        # (rule index, tail) tuples for the anchored rules whose segments,
+        # apart from the tail, end here. See _glob_match_end().
+        self.ends = []
+        # This maps segments to child nodes until finish() turns it into a
+        # tuple sorted by first.
+        self.children = {}
+        # The lowest rule index in this subtree.
+        self.first = None
+        self.prefilter = None
+
+    def finish(self, is_root):
+        """Is called for each node after all of its children are finished."""
+        self.ends = tuple(self.ends)
+        self.children = tuple(sorted(self.children.values(), key=operator.attrgetter("first")))
+        firsts = [index for index, _ in self.ends] + [child.first for child in self.children]
+        if self.index is not None:
+            firsts.append(self.index)
+        self.first = min(firsts)
+        if (len(self.children) >= _GLOB_PREFILTER_MIN_CHILDREN) and \
+           (max([len(child.segment) for child in self.children]) <= _GLOB_PREFILTER_MAX_LENGTH):
+            # Searching for all of the children's segments with one regex
+            # usually rules out all of the children in a single pass.
+            alternatives = "|".join([re.escape(child.segment) for child in self.children])
+            try:
+                regex = re.compile(alternatives)
+            except (RuntimeError, OverflowError, re.error):
+                regex = None
+            if regex:
+                self.prefilter = regex.match if is_root else regex.search
+
+
+# Nodes of a _WildcardSet with at least this many children check for all of
+# their segments at once before looking for each one, as long as the
+# segments are no longer than this. (Longer ones are faster to find one at a
+# time.)
+_GLOB_PREFILTER_MIN_CHILDREN = 4
+_GLOB_PREFILTER_MAX_LENGTH = 32
+
+
+class _WildcardSet(object):
+    """All of a ruleset's wildcard rules merged into a tree that finds the
+    first one that matches a URL.
+
+    _glob_match() matches a rule's segments one after another at their
+    leftmost positions, so how it matches the first few segments doesn't
+    depend on the rest. Rules that start with the same segments (e.g.
+    "/*?sessionid=" and "/*?sessionid=*&") share the nodes for them, and
+    those segments are matched once per URL for all of them. A node with
+    many children rules them all out with one regex search when none of
+    their segments are in the URL, which is the usual case for rules like
+    "Disallow: /*?sessionid=". The search is an alternation of literals, so
+    it can't backtrack.
+
+    The tree is walked in order of the lowest rule index in each subtree,
+    and subtrees that can't hold a lower index than the best match so far
+    are skipped. Each node's segment is searched for at most once, so the
+    worst case is still O(len(url) * segments) as for _glob_match().
+    """
+    __slots__ = ("root", )
+
+    def __init__(self, paths):
+        """paths is a list of (rule index, path) tuples in file order."""
+        self.root = _GlobNode("")
+        nodes = [self.root]
+        for index, path in paths:
+            segments, anchored = _wildcard_segments(path)
+            if not anchored:
+                tail = ()
+            elif len(segments) == 1:
+                # It's anchored but there are no wildcards.
+                tail = (None, )
+            else:
+                segments, tail = segments[:-1], segments[-1:]
+            node = self.root
+            for segment in segments:
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _GlobNode(segment)
+                    nodes.append(child)
+                node = child
+            # A rule that repeats an earlier path can't be the first match.
+            if not tail:
+                if node.index is None:
+                    node.index = index
+            elif tail[0] not in [end for _, end in node.ends]:
+                node.ends.append((index, tail[0]))
+
+        # Children are created after their parents. This doesn't recurse
+        # because hostile paths can have thousands of segments.
+        for node in reversed(nodes):
+            node.finish(node is self.root)
+
+    def first_match(self, url):
+        """Returns the index of the first rule that matches the URL, or None."""
+        best = None
+        # These are the nodes whose segments match, with the position in the
+        # URL after the segment.
+        stack = [(self.root, 0)]
+        while stack:
+            node, position = stack.pop()
+            if (best is not None) and (node.first >= best):
+                continue
+            if node.index is not None:
+                best = node.index if (best is None) else min(best, node.index)
+            for index, tail in node.ends:
+                if ((best is None) or (index < best)) and _glob_match_end(tail, position, url):
+                    best = index
+            if node.prefilter and not node.prefilter(url, position):
+                continue
+            matches = []
+            for child in node.children:
+                if (best is not None) and (child.first >= best):
+                    break
+                if node is self.root:
+                    # The first segment has to be at the start of the URL.
+                    if url.startswith(child.segment):
+                        matches.append((child, len(child.segment)))
+                else:
+                    i = url.find(child.segment, position)
+                    if (i != -1) and (url.find("\n", position, i) == -1):
+                        matches.append((child, i + len(child.segment)))
+            # The child with the lowest first index is popped first.
+            matches.reverse()
+            stack.extend(matches)
+
+        return best
+
+
+class _PrefixIndex(object):
+    """An index of plain (non-wildcard) paths that finds the first rule, in
+    file order, whose path is a prefix of a URL.
+
+    Rather than comparing the URL to every rule, the index looks up each of
+    the URL's prefixes whose length matches the length of at least one rule
+    path. The number of lookups is therefore bounded by the length of the
+    URL, not by the number of rules.
+    """
+    __slots__ = ("paths", "lengths")
+
+    def __init__(self, paths):
+        """paths is an iterable of (path, rule index) tuples in file order."""
+        # Maps each path to the index of the first rule with that path.
+        self.paths = {}
+        for path, index in paths:
+            if path not in self.paths:
+                self.paths[path] = index
+        self.lengths = tuple(sorted(set([len(path) for path in self.paths])))
+
+    def first_match(self, url):
+        """Returns the index of the first rule that matches the URL, or None."""
+        best = None
+        url_length = len(url)
+        paths = self.paths
+        for length in self.lengths:
+            if length > url_length:
+                break
+            index = paths.get(url[:length])
+            if (index is not None) and ((best is None) or (index < best)):
+                best = index
+
+        return best
+
+
+def _common_prefix_length(a, b, start=0):
+    """Returns the length of the longest common prefix of a and b[start:]."""
+    lo = 0
+    hi = min(len(a), len(b) - start)
+    if (not hi) or (a[0] != b[start]):
+        return 0
+    # a[:lo] matches and a[:hi + 1] doesn't.
+    while lo < hi:
+        middle = (lo + hi + 1) // 2
+        if b.startswith(a[:middle], start):
+            lo = middle
+        else:
+            hi = middle - 1
+
+    return lo
+
+
+class _FrontCodedPaths(object):
+    """The paths of a large ruleset, in file order, stored compactly.
+
+    The distinct paths are sorted and divided into blocks. The first path
+    of each block (its head) is stored whole and each of the others as the
+    length of the prefix it shares with the path before it plus the rest of
+    it (its suffix). Paths in a robots.txt share long prefixes, so the
+    suffixes are short. They're joined into one string.
+
+    This is a sequence of the paths in file order, but getting a path means
+    decoding part of a block. The matchers use floor() instead.
+    """
+    __slots__ = ("heads", "lcps", "ends", "suffixes", "order")
+
+    def __init__(self, paths):
+        """paths is a list of paths in file order."""
+        distinct = sorted(set(paths))
+        positions = dict([(path, i) for i, path in enumerate(distinct)])
+        # order maps each rule to the position of its path in sorted order.
+        self.order = array.array("I", [positions[path] for path in paths])
+        self.heads = []
+        # lcps holds the length of the prefix that each path shares with the
+        # one before it, and ends holds the offset of the end of each
+        # suffix. Both are 0 for heads.
+        self.lcps = array.array("I")
+        self.ends = array.array("I")
+        suffixes = []
+        end = 0
+        previous = ""
+        for i, path in enumerate(distinct):
+            if i % _FRONT_CODING_BLOCK_SIZE:
+                lcp = _common_prefix_length(previous, path)
+                suffixes.append(path[lcp:])
+                end += len(path) - lcp
+            else:
+                self.heads.append(path)
+                lcp = 0
+            self.lcps.append(lcp)
+            self.ends.append(end)
+            previous = path
+        self.suffixes = "".join(suffixes)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self._decode(self.order[i])
+
+    def __iter__(self):
+        paths = self.sorted_paths()
+        return iter([paths[i] for i in self.order])
+
+    def __eq__(self, other):
+        return isinstance(other, _FrontCodedPaths) and (self.heads == other.heads) and \
+            (self.suffixes == other.suffixes) and (self.lcps == other.lcps) and \
+            (self.order == other.order)
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __hash__(self):
+        return hash((tuple(self.heads), self.suffixes, len(self.order)))
+
+    def estimated_size(self):
+        """Returns roughly how many bytes of memory I use."""
+        size = sys.getsizeof(self.suffixes) + sys.getsizeof(self.heads)
+        size += sum([sys.getsizeof(head) for head in self.heads])
+
+        return size + 4 * (len(self.order) + (2 * len(self.lcps)))
+
+    def sorted_paths(self):
+        """Returns a list of the distinct paths in sorted order."""
+        paths = []
+        path = ""
+        for i in range(len(self.lcps)):
+            if i % _FRONT_CODING_BLOCK_SIZE:
+                path = path[:self.lcps[i]] + self.suffixes[self.ends[i - 1]:self.ends[i]]
+            else:
+                path = self.heads[i // _FRONT_CODING_BLOCK_SIZE]
+            paths.append(path)
+
+        return paths
+
+    def floor(self, s):
+        """Finds the greatest path that sorts before or equal to s. Returns
+        a 3-tuple of its position in sorted order (or -1 if there's no such
+        path), the length of the prefix it shares with s, and its length.
+
+        The block is scanned without decoding the paths. Because the paths
+        are sorted, a path that shares more with its predecessor than its
+        predecessor shares with s must sort before s, and one that shares
+        less must sort after s. Only when they share the same amount does
+        the suffix have to be compared to s.
+        """
+        block = bisect.bisect_right(self.heads, s) - 1
+        if block < 0:
+            return -1, 0, 0
+
+        head = self.heads[block]
+        # m is the length of the prefix that the path at position shares
+        # with s.
+        m = _common_prefix_length(head, s)
+        length = len(head)
+        position = block * _FRONT_CODING_BLOCK_SIZE
+        lcps = self.lcps
+        ends = self.ends
+        suffixes = self.suffixes
+        s_length = len(s)
+        for i in range(position + 1, min(position + _FRONT_CODING_BLOCK_SIZE, len(lcps))):
+            lcp = lcps[i]
+            if lcp < m:
+                break
+            start = ends[i - 1]
+            end = ends[i]
+            if lcp == m:
+                # Suffixes are never empty since the paths are distinct.
+                if (m == s_length) or (suffixes[start] > s[m]):
+                    break
+                if suffixes[start] == s[m]:
+                    suffix = suffixes[start:end]
+                    n = _common_prefix_length(suffix, s, m)
+                    if (n < end - start) and ((m + n == s_length) or (suffix[n] > s[m + n])):
+                        break
+                    m += n
+            position = i
+            length = lcp + end - start
+
+        return position, m, length
+
+    def _decode(self, position):
+        first = position - (position % _FRONT_CODING_BLOCK_SIZE)
+        path = self.heads[first // _FRONT_CODING_BLOCK_SIZE]
+        for i in range(first + 1, position + 1):
+            path = path[:self.lcps[i]] + self.suffixes[self.ends[i - 1]:self.ends[i]]
+
+        return path
+
+
+# This marks paths in a _FrontCodedIndex that no rule uses.
+_NO_RULE = 0xFFFFFFFF
+
+
+class _FrontCodedIndex(object):
+    """Does the same job as _PrefixIndex for a ruleset whose paths are
+    stored in a _FrontCodedPaths.
+
+    All of the paths that are prefixes of a URL are found by repeatedly
+    looking for the greatest path that sorts before or equal to the URL
+    (or what's left of it). If that path is a prefix, the next one can only
+    be a prefix of it. If not, the next one can only be a prefix of the
+    part that the path and the URL have in common. Either way the URL gets
+    shorter, and usually there are only a few steps.
+    """
+    __slots__ = ("store", "indexes")
+
+    def __init__(self, store, rule_indexes):
+        """store is a _FrontCodedPaths and rule_indexes is an ascending list
+        of the indexes of the rules to include.
+        """
+        self.store = store
+        # This maps each path's position in sorted order to the index of the
+        # first rule with that path.
+        self.indexes = array.array("I", [_NO_RULE]) * len(store.lcps)
+        for i in rule_indexes:
+            position = store.order[i]
+            if self.indexes[position] == _NO_RULE:
+                self.indexes[position] = i
+
+    @property
+    def paths(self):
+        """A dict that maps each path to the index of the first rule with
+        that path, like _PrefixIndex.paths. It's built on every call.
+        """
+        return dict([(path, i) for path, i in zip(self.store.sorted_paths(), self.indexes)
+                     if i != _NO_RULE])
+
+    def first_match(self, url):
+        """Returns the index of the first rule that matches the URL, or None."""
+        best = None
+        floor = self.store.floor
+        while True:
+            position, m, length = floor(url)
+            if position < 0:
+                break
+            if m == length:
+                # The path is a prefix of the URL.
+                i = self.indexes[position]
+                if (i != _NO_RULE) and ((best is None) or (i < best)):
+                    best = i
+                if not length:
+                    break
+                url = url[:length - 1]
+            else:
+                url = url[:m]
+
+        return best
+
+
+class _CompiledRules(object):
+    """The rules of a _Ruleset compiled for one syntax."""
+    __slots__ = ("verdicts", "plain", "prefix_index", "wildcard_paths", "wildcards",
+                 "batch_regex", "batch_best")
+
+    def __init__(self):
+        # verdicts holds the allowed value (1 or 0) for each rule index.
+        self.verdicts = bytearray()
+        # Plain rules are (rule index, path) tuples in file order. When
+        # there are enough of them to make it worthwhile, they're moved into
+        # prefix_index instead.
+        self.plain = []
+        self.prefix_index = None
+        self.wildcard_paths = []
+        self.wildcards = None
+        # These are built the first time they're needed. See
+        # are_urls_allowed().
+        self.batch_regex = None
+        self.batch_best = None
+
+    def add_plain_rule(self, path, allowed):
+        self.plain.append((len(self.verdicts), path))
+        self.verdicts.append(allowed)
+
+    def add_wildcard_rule(self, path, allowed):
+        self.wildcard_paths.append((len(self.verdicts), path))
+        self.verdicts.append(allowed)
+
+    def finish(self, paths=None):
+        """Builds the prefix index and wildcard set once all rules are added.
+        paths is the ruleset's _FrontCodedPaths, if it has one.
+        """
+        # Copying it drops the spare room that append() leaves at the end.
+        self.verdicts = bytearray(self.verdicts)
+        if (PREFIX_INDEX_MIN_RULES is not None) and (len(self.plain) >= PREFIX_INDEX_MIN_RULES):
+            if paths is None:
+                self.prefix_index = _PrefixIndex([(path, i) for i, path in self.plain])
+            else:
+                self.prefix_index = _FrontCodedIndex(paths, [i for i, _ in self.plain])
+            self.plain = ()
+        else:
+            self.plain = tuple(self.plain)
+
+        if self.wildcard_paths:
+            self.wildcards = _WildcardSet(self.wildcard_paths)
+        self.wildcard_paths = None
+
+    def is_url_allowed(self, url):
+        best = None
+        if self.wildcards:
+            best = self.wildcards.first_match(url)
+
+        if self.prefix_index:
+            i = self.prefix_index.first_match(url)
+            if (i is not None) and ((best is None) or (i < best)):
+                best = i
+        else:
+            # A plain rule only matters if it precedes the best wildcard rule.
+            for i, path in self.plain:
+                if (best is not None) and (i > best):
+                    break
+                if url.startswith(path):
+                    best = i
+                    break
+
+        return True if (best is None) else bool(self.verdicts[best])
+
+    def are_urls_allowed(self, urls):
+        """Returns a list of booleans, one for each of the (normalized) URLs.
+
+        The plain rules are matched against the whole batch with a single
+        call to findall(). See _build_prefix_regex().
+        """
+        if self.batch_regex is None:
+            self.batch_regex, self.batch_best = _build_prefix_regex(self._plain_paths())
+
+        joined = "\n".join(urls) + "\n"
+        if (not self.batch_regex) or (joined.count("\n") != len(urls)):
+            # The regex couldn't be built or some URLs contain newlines.
+            return [self.is_url_allowed(url) for url in urls]
+
+        best = map(self.batch_best.__getitem__, self.batch_regex.findall(joined))
+        verdicts = [bool(verdict) for verdict in self.verdicts] + [True]
+        if self.wildcards:
+            results = []
+            first_match = self.wildcards.first_match
+            for url, i in zip(urls, best):
+                j = first_match(url)
+                if (i is None) or ((j is not None) and (j < i)):
+                    i = j
+                results.append(True if (i is None) else verdicts[i])
+            return results
+        else:
+            # The last element of verdicts is for URLs that no rule matches.
+            return [verdicts[-1 if (i is None) else i] for i in best]
+
+    def _plain_paths(self):
+        """Returns a dict that maps each plain path to the index of the first
+        rule with that path.
+        """
+        if self.prefix_index:
+            return self.prefix_index.paths
+        else:
+            paths = {}
+            for i, path in self.plain:
+                paths.setdefault(path, i)
+            return paths
+
+
+def _build_prefix_regex(paths):
+    """Builds a regex that finds the first plain rule that matches each line
+    of a newline-delimited batch of URLs. paths is a dict that maps each
+    plain path to the index of the first rule with that path.
+
+    Returns a 2-tuple of (regex, best). The regex is the paths arranged as a
+    radix tree, so it greedily consumes the longest prefix of each line that
+    leads to a node of the tree and then the rest of the line. Every path
+    that is a prefix of the URL lies along the way to that node, so best
+    maps each node to the lowest rule index along the way (or None).
+    Because siblings in the tree begin with different characters, the regex
+    never has to backtrack.
+
+    Returns (False, None) if the tree is too deep for the re module.
+    """
+    # Paths with newlines can't match URLs without them, and URLs with
+    # newlines aren't matched in batches.
+    items = sorted([path for path in paths if "\n" not in path])
+    best = {}
+
+    def build_node(prefix, lo, hi, best_so_far):
+        # items[lo:hi] are the paths that begin with prefix.
+        if (lo < hi) and (items[lo] == prefix):
+            i = paths[prefix]
+            if (best_so_far is None) or (i < best_so_far):
+                best_so_far = i
+            lo += 1
+        best[prefix] = best_so_far
+
+        branches = []
+        n = len(prefix)
+        while lo < hi:
+            # Group the paths that share the next character and find the
+            # longest prefix that they all share.
+            c = items[lo][n]
+            end = lo
+            while (end < hi) and (items[end][n] == c):
+                end += 1
+            first = items[lo]
+            last = items[end - 1]
+            k = n + 1
+            while (k < min(len(first), len(last))) and (first[k] == last[k]):
+                k += 1
+            branches.append(re.escape(first[n:k]) + build_node(first[:k], lo, end, best_so_far))
+            lo = end
+
+        return "(?:%s)?" % "|".join(branches) if branches else ""
+
+    try:
+        regex = re.compile("(%s)[^\n]*\n" % build_node("", 0, len(items), None))
+    except (RuntimeError, OverflowError, re.error):
+        # RuntimeError covers Python 3's RecursionError.
+        return False, None
+
+    return regex, best
+
+
+def _is_wildcard_path(path):
+    """True if the path uses GYM2008 wildcard syntax."""
+    return ("*" in path) or path.endswith("$")
+
+
+def _normalize_url(url):
+    """Reduces a URL to the form that rules are compared against."""
+    m = _simple_url_regex.match(url)
+    if m and not url.endswith("?"):
+        # urlparse() and urlunparse() would reduce this URL to its path and
+        # query, so I can skip them.
+        url = m.group("path")
+    else:
+        # Schemes and host names are not part of the robots.txt protocol,
+        # so I ignore them. It is the caller's responsibility to make
+        # sure they match.
+        _, _, path, parameters, query, fragment = urllib_urlparse(url)
+        url = urllib_urlunparse(("", "", path, parameters, query, fragment))
+
+    return _unquote_path(url) if ("%" in url) else url
+
+
+def _normalize_urls(urls):
+    """Does the same as calling _normalize_url() on each URL in a list, but
+    much faster for the usual case of a batch of URLs from the same host.
+    """
+    m = _simple_url_regex.match(urls[0]) if urls else None
+    if m:
+        start = m.start("path")
+        origin = urls[0][:start]
+        # These tests check all of the URLs at once for the conditions that
+        # _simple_url_regex checks for one URL.
+        joined = "\n" + "\n".join(urls) + "\n"
+        if (joined.count("\n") == len(urls) + 1) and \
+           (joined.count("\n" + origin + "/") == len(urls)) and \
+           (("\n" + origin + "//") not in joined) and ("?\n" not in joined) and \
+           ("#" not in joined) and (";" not in joined) and ("\t" not in joined) and \
+           ("\r" not in joined):
+            paths = list(map(operator.itemgetter(slice(start, None)), urls)) if start else urls
+            if "%" in joined:
+                paths = [_unquote_path(path) if ("%" in path) else path for path in paths]
+            return paths
+
+    return [_normalize_url(url) for url in urls]
+
+
 class _Ruleset(object):
     """ _Ruleset represents a set of allow/disallow rules (and possibly a
     crawl delay) that apply to a set of user agents.
@@ -186,10 +1119,48 @@ class _Ruleset(object):
     ALLOW = 1
     DISALLOW = 2
 
+    # There's one of these for every user agent group of every robots.txt
+    # in a crawler's cache, so they're kept small. (RulesInterner needs the
+    # __weakref__.)
+    __slots__ = ("robot_names", "_rule_types", "_paths", "crawl_delay", "_compiled",
+                 "__weakref__")
+
     def __init__(self):
         self.robot_names = []
-        self.rules = []
+        # The rules are stored as the rule types (ALLOW or DISALLOW) and the
+        # paths in parallel. freeze() turns them into bytes and a tuple.
+        self._rule_types = bytearray()
+        self._paths = []
         self.crawl_delay = None
+        # _compiled maps each syntax to a _CompiledRules instance.
+        # It's built by compile() and is None until then.
+        self._compiled = None
+
+    def __getstate__(self):
+        # The compiled matchers are derived entirely from the rules, so
+        # there's no need to pickle them. This is the same as the state of
+        # the instances (with a __dict__) of older versions of this module.
+        return {"robot_names": list(self.robot_names),
+                "rules": list(self.rules),
+                "crawl_delay": self.crawl_delay}
+
+    def __setstate__(self, state):
+        self.robot_names = state["robot_names"]
+        self.rules = state["rules"]
+        self.crawl_delay = state.get("crawl_delay")
+
+    @property
+    def rules(self):
+        """A tuple of (rule type, path) tuples in file order. Assigning a
+        list of such tuples replaces the rules.
+        """
+        return tuple(zip(bytearray(self._rule_types), self._paths))
+
+    @rules.setter
+    def rules(self, rules):
+        self._rule_types = bytearray([rule_type for rule_type, _ in rules])
+        self._paths = [path for _, path in rules]
+        self._compiled = None
 
     def __str__(self):
         s = self.__unicode__()
@@ -211,22 +1182,54 @@ class _Ruleset(object):
         return s
 
     def add_robot_name(self, bot):
+        self._check_not_frozen()
         self.robot_names.append(bot)
 
     def add_allow_rule(self, path):
-        self.rules.append((self.ALLOW, _unquote_path(path)))
+        self._add_rule(self.ALLOW, path)
 
     def add_disallow_rule(self, path):
-        self.rules.append((self.DISALLOW, _unquote_path(path)))
+        self._add_rule(self.DISALLOW, path)
+
+    def _add_rule(self, rule_type, path):
+        self._check_not_frozen()
+        self._rule_types.append(rule_type)
+        self._paths.append(_unquote_path(path))
+        self._compiled = None
+
+    def _check_not_frozen(self):
+        # A frozen ruleset may be shared by many parsers (see RulesInterner),
+        # so changing it would change all of their rules.
+        if not isinstance(self._paths, list):
+            raise TypeError("The ruleset is frozen and can't be changed")
+
+    def freeze(self):
+        """Converts the lists that hold my user agents and rules to smaller,
+        immutable equivalents once no more rules will be added.
+        """
+        self.robot_names = tuple(self.robot_names)
+        self._rule_types = bytes(self._rule_types)
+        if not isinstance(self._paths, list):
+            # They're already frozen.
+            pass
+        elif (FRONT_CODING_MIN_RULES is not None) and \
+             (len(self._paths) >= FRONT_CODING_MIN_RULES):
+            self._paths = _FrontCodedPaths(self._paths)
+            # The compiled matchers may refer to the paths as strings.
+            self._compiled = None
+        else:
+            # Many paths (e.g. /cgi-bin/) appear in many robots.txt files.
+            # Interning them lets all of the rulesets share one copy.
+            self._paths = tuple([_intern_path(path) for path in self._paths])
 
     def is_not_empty(self):
-        return bool(len(self.rules)) and bool(len(self.robot_names))
+        return bool(len(self._paths)) and bool(len(self.robot_names))
 
     def is_default(self):
         return bool('*' in self.robot_names)
 
     def does_user_agent_match(self, user_agent):
-        match = False
+        user_agent = user_agent.lower()
 
         for robot_name in self.robot_names:
             # MK1994 says, "A case insensitive substring match of the name
@@ -235,398 +1238,501 @@ class _Ruleset(object):
             # record in /robots.txt that contains a User-Agent line whose
             # value contains the name token of the robot as a substring.
             # The name comparisons are case-insensitive."
-            match = match or (robot_name == '*') or  \
-                             (robot_name.lower() in user_agent.lower())
+            if (robot_name == '*') or (robot_name.lower() in user_agent):
+                return True
+
+        return False
+
+    def compile(self):
+        """Turns self.rules into ready-to-run matchers for each syntax so
+        that is_url_allowed() doesn't have to interpret the rules on every
+        call.
+        """
+        compiled = {MK1996: _CompiledRules(), GYM2008: _CompiledRules()}
+
+        for rule_type, path in self.rules:
+            allowed = (rule_type == self.ALLOW)
+
+            # A blank path means "nothing", so that effectively negates the
+            # rule type. e.g. "Disallow:   " means allow everything
+            plain_allowed = allowed if path else (not allowed)
 
-        return match
+            # Wildcards are taken literally under MK1996.
+            compiled[MK1996].add_plain_rule(path, plain_allowed)
+            if _is_wildcard_path(path):
+                compiled[GYM2008].add_wildcard_rule(path, allowed)
+            else:
+                compiled[GYM2008].add_plain_rule(path, plain_allowed)
+
+        paths = self._paths if isinstance(self._paths, _FrontCodedPaths) else None
+        for compiled_rules in compiled.values():
+            compiled_rules.finish(paths)
+
+        self._compiled = compiled
 
     def is_url_allowed(self, url, syntax=GYM2008):
-        allowed = True
+        if self._compiled is None:
+            self.compile()
 
-        # Schemes and host names are not part of the robots.txt protocol,
-        # so I ignore them. It is the caller's responsibility to make
-        # sure they match.
-        _, _, path, parameters, query, fragment = urllib_urlparse(url)
-        url = urllib_urlunparse(("", "", path, parameters, query, fragment))
+        return self._compiled[syntax].is_url_allowed(_normalize_url(url))
 
-        url = _unquote_path(url)
+    def are_urls_allowed(self, urls, syntax=GYM2008):
+        """Returns a list of booleans that say whether or not each URL is
+        allowed.
+        """
+        if self._compiled is None:
+            self.compile()
 
-        done = False
-        i = 0
-        while not done:
-            rule_type, path = self.rules[i]
+        return self._compiled[syntax].are_urls_allowed(_normalize_urls(urls))
 
-            if (syntax == GYM2008) and ("*" in path or path.endswith("$")):
-                # GYM2008-specific syntax applies here
-                # http://www.google.com/support/webmasters/bin/answer.py?hl=en&answer=40360
-                if path.endswith("$"):
-                    appendix = "$"
-                    path = path[:-1]
-                else:
-                    appendix = ""
-                # Multiple wildcards characters mean the same as one wildcard so they can be
-                # condensed into one. If I don't do this, I run the risk of creating a
-                # pathological regex.
-                # ref: https://bitbucket.org/philip_semanchuk/robotexclusionrulesparser/issues/1
-                path = re.sub(r'\*+', '*', path)
-                parts = path.split("*")
-                pattern = ".*".join([re.escape(p) for p in parts]) + appendix
-                if re.match(pattern, url):
-                    # Ding!
-                    done = True
-                    allowed = (rule_type == self.ALLOW)
-            else:
-                # Wildcards are either not present or are taken literally.
-                if url.startswith(path):
-                    # Ding!
-                    done = True
-                    allowed = (rule_type == self.ALLOW)
-                    # A blank path means "nothing", so that effectively
-                    # negates the value above.
-                    # e.g. "Disallow:   " means allow everything
-                    if not path:
-                        allowed = not allowed
+    def subtree_verdict(self, path_prefix, syntax=GYM2008):
+        """Returns one of the SUBTREE_* constants for the URLs that start
+        with the path prefix. See _subtree_verdict().
+        """
+        return _subtree_verdict(self.rules, _normalize_url(path_prefix), syntax)
 
-            i += 1
-            if i == len(self.rules):
-                done = True
 
-        return allowed
+class _InternedRulesets(list):
+    """The rulesets of a robots.txt as shared by all of the parsers that
+    parsed an identical one. It's a list only because tuples can't be weakly
+    referenced; it must not be changed.
+    """
+    __slots__ = ("__weakref__", )
 
 
-class RobotExclusionRulesParser(object):
-    """A parser for robots.txt files."""
+class RulesInterner(object):
+    """Lets parsers of identical robots.txt files share one copy of the
+    rules rather than each keeping its own.
+
+    Identical files are common: CMS defaults, parked domains and hosting
+    providers serve the same robots.txt for many hosts, and within a file
+    several User-agent groups often list the same rules. Parsers with the
+    same interner share their rules at three levels --
+     - Rulesets with the same user agents, crawl delay and rules are one
+       object.
+     - Rulesets with the same rules (but different user agents or crawl
+       delays) share their rules and compiled matchers.
+     - Parsers of robots.txt files with the same rulesets share the list of
+       rulesets.
+    Comparisons are by content after parsing, so files that differ only in
+    comments, whitespace, directive case or line endings are identical.
+
+    Shared rules are never changed in place. The interner only holds weak
+    references, so rules are freed once no parser uses them. It's safe to
+    use from multiple threads.
+    """
     def __init__(self):
-        self._source_url = ""
-        self.user_agent = None
-        self.use_local_time = True
-        self.expiration_date = self._now() + SEVEN_DAYS
-        self._response_code = 0
-        self._sitemaps = []
-        self.__rulesets = []
+        self._lock = threading.Lock()
+        # Maps tuples of interned rulesets to _InternedRulesets.
+        self._files = weakref.WeakValueDictionary()
+        # Maps (user agents, crawl delay, rules) tuples to rulesets.
+        self._rulesets = weakref.WeakValueDictionary()
+        # Maps tuples of rules to the first ruleset seen with those rules.
+        self._rules = weakref.WeakValueDictionary()
+        self._file_count = 0
+        self._file_hits = 0
+        self._ruleset_count = 0
+        self._ruleset_hits = 0
 
     @property
-    def source_url(self):
-        """The URL from which this robots.txt was fetched. Read only."""
-        return self._source_url
+    def files(self):
+        """The number of robots.txt files (i.e. sets of rulesets) passed to
+        intern(). Read only.
+        """
+        return self._file_count
 
     @property
-    def response_code(self):
-        """The remote server's response code. Read only."""
-        return self._response_code
+    def file_hits(self):
+        """The number of files that were identical to one already interned.
+        Read only.
+        """
+        return self._file_hits
 
     @property
-    def sitemap(self):
-        """Deprecated; use 'sitemaps' instead. Returns the sitemap URL present
-        in the robots.txt, if any. Defaults to None. Read only."""
-        raise DeprecationWarning("The sitemap property is deprecated. Use 'sitemaps' instead.")
+    def rulesets(self):
+        """The number of rulesets passed to intern(). Read only."""
+        return self._ruleset_count
 
     @property
-    def sitemaps(self):
-        """The sitemap URLs present in the robots.txt, if any. Defaults
-        to an empty list. Read only."""
-        # I return a copy of the list so the caller can manipulate the list
-        # without affecting self._sitemaps.
-        return self._sitemaps[:]
+    def ruleset_hits(self):
+        """The number of rulesets that were identical to one already
+        interned. Read only.
+        """
+        return self._ruleset_hits
 
     @property
-    def is_expired(self):
-        """True if the difference between now and the last call to fetch()
-        exceeds the robots.txt expiration. Read only.
+    def dedup_ratio(self):
+        """The number of files interned per distinct file (e.g. 4.0 means
+        that, on average, four parsers share each set of rules), or 1.0 if
+        nothing has been interned. Read only.
         """
-        return self.expiration_date <= self._now()
+        misses = self._file_count - self._file_hits
 
-    def _now(self):
-        if self.use_local_time:
-            return time.time()
-        else:
-            # What the heck is timegm() doing in the calendar module?!?
-            return calendar.timegm(time.gmtime())
+        return (float(self._file_count) / misses) if misses else 1.0
 
-    def is_allowed(self, user_agent, url, syntax=GYM2008):
-        """True if the user agent is permitted to visit the URL. The syntax
-        parameter can be GYM2008 (the default) or MK1996 for strict adherence
-        to the traditional standard.
+    def __len__(self):
+        """Returns the number of distinct files in use."""
+        return len(self._files)
+
+    def __reduce__(self):
+        # Locks and weak references can't be pickled. Parsers pickled
+        # together get a new (empty) interner in common.
+        return (self.__class__, ())
+
+    def intern(self, rulesets):
+        """Returns a list of rulesets identical to the one passed that's
+        shared with any other parser that has interned the same rules. The
+        rulesets passed are frozen and must not be used elsewhere.
         """
-        if PY_MAJOR_VERSION < 3:
-            # The robot rules are stored internally as Unicode. The two lines
-            # below ensure that the parameters passed to this function are
-            # also Unicode. If those lines were not present and the caller
-            # passed a non-Unicode user agent or URL string to this function,
-            # Python would silently convert it to Unicode before comparing it
-            # to the robot rules. Such conversions use the default encoding
-            # (usually US-ASCII) and if the string couldn't be converted using
-            # that encoding, Python would raise a UnicodeError later on in the
-            # guts of this code which would be confusing.
-            # Converting the strings to Unicode here doesn't make the problem
-            # go away but it does make the conversion explicit so that
-            # failures are easier to understand.
-            if not isinstance(user_agent, unicode):  # noqa
-                user_agent = user_agent.decode()
-            if not isinstance(url, unicode):  # noqa
-                url = url.decode()
+        with self._lock:
+            rulesets = tuple([self._intern_ruleset(ruleset) for ruleset in rulesets])
+            self._file_count += 1
+            shared = self._files.get(rulesets)
+            if shared is None:
+                shared = _InternedRulesets(rulesets)
+                self._files[rulesets] = shared
+            else:
+                self._file_hits += 1
+
+        return shared
+
+    def _intern_ruleset(self, ruleset):
+        ruleset.freeze()
+        rules = (ruleset._rule_types, ruleset._paths)
+        key = (ruleset.robot_names, ruleset.crawl_delay, rules)
+        self._ruleset_count += 1
+        shared = self._rulesets.get(key)
+        if shared is not None:
+            self._ruleset_hits += 1
+            return shared
+
+        shared = self._rules.get(rules)
+        if shared is None:
+            self._rules[rules] = ruleset
+        else:
+            if shared._compiled is None:
+                shared.compile()
+            ruleset._rule_types = shared._rule_types
+            ruleset._paths = shared._paths
+            ruleset._compiled = shared._compiled
+        self._rulesets[key] = ruleset
+
+        return ruleset
+
+
+class TrivialPolicy(object):
+    """A robots.txt policy that gives every user agent the same answer for
+    every URL, namely ALLOW_ALL or DISALLOW_ALL. Most hosts have one of these
+    -- there's no robots.txt (404), access is forbidden (401 and 403) or
+    the file contains nothing but "Disallow:".
+
+    A parser with such rules answers questions with one of these shared
+    policies rather than matching the user agent and URL against its rules.
+    They can be used on their own in place of a parser; a crawler's cache
+    can store them as a reference to one of two objects.
+    """
+    __slots__ = ("_allowed", "_name")
+
+    # A parser's trivial policy stands in for its rulesets, so it has the
+    # same crawl_delay attribute, is_url_allowed() and are_urls_allowed().
+    crawl_delay = None
+
+    def __init__(self, allowed, name):
+        self._allowed = allowed
+        self._name = name
 
+    def __repr__(self):
+        return "robotexclusionrulesparser." + self._name
+
+    def __reduce__(self):
+        # Unpickling returns the module-level singleton.
+        return self._name
+
+    def is_allowed(self, user_agent, url, syntax=GYM2008):
+        """True if the user agent is permitted to visit the URL. See
+        RobotExclusionRulesParser.is_allowed().
+        """
         if syntax not in (MK1996, GYM2008):
             raise ValueError("Syntax must be MK1996 or GYM2008")
 
-        for ruleset in self.__rulesets:
-            if ruleset.does_user_agent_match(user_agent):
-                return ruleset.is_url_allowed(url, syntax)
-
-        return True
+        return self.is_url_allowed(url, syntax)
 
     def get_crawl_delay(self, user_agent):
-        """Returns a float representing the crawl delay specified for this
-        user agent, or None if the crawl delay was unspecified or not a float.
-        """
-        # See is_allowed() comment about the explicit unicode conversion.
-        if (PY_MAJOR_VERSION < 3) and (not isinstance(user_agent, unicode)):  # noqa
-            user_agent = user_agent.decode()
+        """Returns None; trivial policies don't have crawl delays."""
+        return None
 
-        for ruleset in self.__rulesets:
-            if ruleset.does_user_agent_match(user_agent):
-                return ruleset.crawl_delay
+    def is_url_allowed(self, url, syntax=GYM2008):
+        if self._allowed:
+            return True
 
-    def fetch(self, url, timeout=None):
-        """Attempts to fetch the URL requested which should refer to a
-        robots.txt file, e.g. http://example.com/robots.txt.
+        # "Disallow: /" matches everything but the URLs whose paths are empty
+        # (e.g. http://example.com without the trailing slash). Nearly every
+        # URL matches _simple_url_regex which requires a path.
+        return not (_simple_url_regex.match(url) or _normalize_url(url).startswith("/"))
+
+    def are_urls_allowed(self, urls, syntax=GYM2008):
+        if self._allowed:
+            return [True] * len(urls)
+
+        return [self.is_url_allowed(url) for url in urls]
+
+    def is_subtree_allowed(self, user_agent, path_prefix, syntax=GYM2008):
+        """Returns one of the SUBTREE_* constants. See
+        RobotExclusionRulesParser.is_subtree_allowed().
         """
-        # ISO-8859-1 is the default encoding for text files per the specs for
-        # HTTP 1.0 (RFC 1945 sec 3.6.1) and HTTP 1.1 (RFC 2616 sec 3.7.1).
-        # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.7.1
-        encoding = "iso-8859-1"
-        content = ""
-        expires_header = None
-        content_type_header = None
-        self._response_code = 0
-        self._source_url = url
+        if syntax not in (MK1996, GYM2008):
+            raise ValueError("Syntax must be MK1996 or GYM2008")
 
-        if self.user_agent:
-            req = urllib_request.Request(url, None, {'User-Agent': self.user_agent})
-        else:
-            req = urllib_request.Request(url)
+        return self.subtree_verdict(path_prefix, syntax)
 
-        try:
-            if timeout:
-                f = urllib_request.urlopen(req, timeout=timeout)
-            else:
-                f = urllib_request.urlopen(req)
-
-            content = f.read(MAX_FILESIZE)
-            # As of Python 2.5, f.info() looks like it returns the HTTPMessage
-            # object created during the connection.
-            expires_header = f.info().get("expires")
-            content_type_header = f.info().get("Content-Type")
-            # As of Python 2.4, this file-like object reports the response
-            # code, too.
-            if hasattr(f, "code"):
-                self._response_code = f.code
+    def subtree_verdict(self, path_prefix, syntax=GYM2008):
+        if self._allowed:
+            return SUBTREE_ALLOWED
+
+        # Only URLs that don't start with "/" are allowed (see
+        # is_url_allowed()). URLs under a non-empty prefix start with "/"
+        # exactly when the prefix does.
+        path_prefix = _normalize_url(path_prefix)
+        if not path_prefix:
+            return SUBTREE_MIXED
+
+        return SUBTREE_DISALLOWED if path_prefix.startswith("/") else SUBTREE_ALLOWED
+
+
+ALLOW_ALL = TrivialPolicy(True, "ALLOW_ALL")
+DISALLOW_ALL = TrivialPolicy(False, "DISALLOW_ALL")
+
+# Trivial rules are tiny and very common, so parsers that don't have an
+# interner of their own share them via this one.
+_trivial_rules_interner = RulesInterner()
+
+
+def _find_trivial_policy(rulesets):
+    """Returns ALLOW_ALL or DISALLOW_ALL if the rulesets give that answer to
+    every user agent for every URL, or None.
+    """
+    for ruleset in rulesets:
+        if ruleset.crawl_delay is not None:
+            return None
+
+    # A rule allows everything if it's an Allow (with a path) or a Disallow
+    # without one. Note that "Allow:" without a path disallows everything.
+    rules = [ruleset.rules for ruleset in rulesets]
+    if all([bool(path) == (rule_type == _Ruleset.ALLOW)
+            for ruleset_rules in rules for rule_type, path in ruleset_rules]):
+        return ALLOW_ALL
+
+    # Every user agent has to match a ruleset (which is certain if one of
+    # them is the default) that starts with "Disallow: /". That leaves only
+    # URLs that don't start with "/" (e.g. "http://example.com?a=b") for the
+    # rules after it, so they mustn't be able to match those, which rules
+    # with blank, relative or wildcard paths can.
+    default = False
+    for ruleset, ruleset_rules in zip(rulesets, rules):
+        if (not ruleset_rules) or (ruleset_rules[0] != (_Ruleset.DISALLOW, "/")):
+            return None
+        for rule_type, path in ruleset_rules[1:]:
+            if (not path.startswith("/")) or _is_wildcard_path(path):
+                return None
+        default = default or ruleset.is_default()
+
+    return DISALLOW_ALL if default else None
+
+
+def _has_prefix_in(s, prefixes):
+    """True if s or any of its prefixes is in the set prefixes."""
+    if not prefixes:
+        return False
+
+    for length in range(len(s) + 1):
+        if s[:length] in prefixes:
+            return True
+
+    return False
+
+
+def _minimize_rules(rules):
+    """Returns a list of the (rule type, path) tuples in rules without those
+    that can't change the answer for any URL under MK1996 or GYM2008 --
+     - Rules that can only match URLs that an earlier rule matches too.
+       Because the first matching rule wins, they never apply. That covers
+       duplicates, rules inside a directory that's already disallowed, and
+       everything after a rule that matches every URL.
+     - Rules at the end that allow what they match, since URLs that don't
+       match any rule are allowed anyway.
+    A rule is only removed if that's certain under both syntaxes. Wildcard
+    rules are only recognized as covering other rules in the simplest cases
+    (e.g. "/foo*"), so some dead rules may remain.
+    """
+    # Under MK1996 every path is a prefix that matches the URLs that start
+    # with it. These hold the paths of the rules kept so far as a set of
+    # URLs that some earlier rule matches.
+    mk1996_prefixes = set()
+    # Under GYM2008 the plain paths (and wildcard paths that amount to a
+    # prefix, like "/foo*") are prefixes, paths like "/foo$" match just one
+    # URL, and the rest can only be compared to identical paths.
+    gym2008_prefixes = set()
+    gym2008_exact = set()
+    gym2008_patterns = set()
+    kept = []
+    for rule_type, path in rules:
+        if _is_wildcard_path(path):
+            segments, anchored = _wildcard_segments(path)
+            # Every URL that matches starts with the first segment.
+            literal = segments[0]
+            if (not anchored) and (not "".join(segments[1:])):
+                prefix = literal
             else:
-                self._response_code = 200
-            f.close()
-        except urllib_error.URLError:
-            # This is a slightly convoluted way to get the error instance,
-            # but it works under Python 2 & 3.
-            error_instance = sys.exc_info()
-            if len(error_instance) > 1:
-                error_instance = error_instance[1]
-            if hasattr(error_instance, "code"):
-                self._response_code = error_instance.code
+                prefix = None
+        else:
+            literal = prefix = path
 
-        # MK1996 section 3.4 says, "...robots should take note of Expires
-        # header set by the origin server. If no cache-control directives
-        # are present robots should default to an expiry of 7 days".
+        if _has_prefix_in(literal, gym2008_prefixes):
+            gym2008_shadowed = True
+        elif prefix is not None:
+            gym2008_shadowed = False
+        elif len(segments) == 1:
+            gym2008_shadowed = literal in gym2008_exact
+        else:
+            gym2008_shadowed = (segments, anchored) in gym2008_patterns
 
-        # This code is lazy and looks at the Expires header but not
-        # Cache-Control directives.
-        self.expiration_date = None
-        if self._response_code >= 200 and self._response_code < 300:
-            # All's well.
-            if expires_header:
-                self.expiration_date = email_utils.parsedate_tz(expires_header)
+        if gym2008_shadowed and _has_prefix_in(path, mk1996_prefixes):
+            continue
 
-                if self.expiration_date:
-                    # About time zones -- the call to parsedate_tz() returns a
-                    # 10-tuple with the time zone offset in the 10th element.
-                    # There are 3 valid formats for HTTP dates, and one of
-                    # them doesn't contain time zone information. (UTC is
-                    # implied since all HTTP header dates are UTC.) When given
-                    # a date that lacks time zone information, parsedate_tz()
-                    # returns None in the 10th element. mktime_tz() interprets
-                    # None in the 10th (time zone) element to mean that the
-                    # date is *local* time, not UTC.
-                    # Therefore, if the HTTP timestamp lacks time zone info
-                    # and I run that timestamp through parsedate_tz() and pass
-                    # it directly to mktime_tz(), I'll get back a local
-                    # timestamp which isn't what I want. To fix this, I simply
-                    # convert a time zone of None to zero. It's much more
-                    # difficult to explain than to fix. =)
-                    # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.3.1
-                    if self.expiration_date[9] is None:
-                        self.expiration_date = self.expiration_date[:9] + (0,)
+        kept.append((rule_type, path))
+        mk1996_prefixes.add(path)
+        if prefix is not None:
+            gym2008_prefixes.add(prefix)
+        elif len(segments) == 1:
+            gym2008_exact.add(literal)
+        else:
+            gym2008_patterns.add((segments, anchored))
 
-                    self.expiration_date = email_utils.mktime_tz(self.expiration_date)
-                    if self.use_local_time:
-                        # I have to do a little more converting to get this
-                        # UTC timestamp into localtime.
-                        self.expiration_date = time.mktime(time.gmtime(self.expiration_date))
-                # else:
-                    # The expires header was garbage.
+    # A rule allows what it matches if it's an Allow (with a path) or a
+    # Disallow without one. See _Ruleset.compile().
+    while kept and (bool(kept[-1][1]) == (kept[-1][0] == _Ruleset.ALLOW)):
+        kept.pop()
 
-        if not self.expiration_date:
-            self.expiration_date = self._now() + SEVEN_DAYS
+    return kept
 
-        if (self._response_code >= 200) and (self._response_code < 300):
-            # All's well.
-            media_type, encoding = _parse_content_type_header(content_type_header)
-            # RFC 2616 sec 3.7.1 --
-            # When no explicit charset parameter is provided by the sender,
-            # media subtypes  of the "text" type are defined to have a default
-            # charset value of "ISO-8859-1" when received via HTTP.
-            # http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.7.1
-            if not encoding:
-                encoding = "iso-8859-1"
-        elif self._response_code in (401, 403):
-            # 401 or 403 ==> Go away or I will taunt you a second time!
-            # (according to MK1996)
-            content = "User-agent: *\nDisallow: /\n"
-        elif self._response_code == 404:
-            # No robots.txt ==> everyone's welcome
-            content = ""
+
+def _subtree_verdict(rules, prefix, syntax):
+    """Returns SUBTREE_ALLOWED or SUBTREE_DISALLOWED if the (rule type, path)
+    tuples in rules give the same answer for every (normalized) URL that
+    starts with prefix, otherwise SUBTREE_MIXED.
+
+    Going through the rules in order, a rule that matches every URL in the
+    subtree decides the rest of them, one that matches some of them may
+    decide those, and URLs that no rule matches are allowed. The answer is
+    SUBTREE_MIXED whenever it's uncertain, e.g. when a wildcard rule
+    matches some of the URLs but an earlier one might match the same URLs.
+    """
+    verdicts = set()
+    # These are the paths of the earlier rules that match the URLs that
+    # start with them and are in the subtree. A later rule that can only
+    # match URLs that start with one of them can't apply.
+    inside = set()
+    for rule_type, path in rules:
+        allowed = (rule_type == _Ruleset.ALLOW)
+        if (syntax == GYM2008) and _is_wildcard_path(path):
+            segments, anchored = _wildcard_segments(path)
+            literal = segments[0]
+            if (not anchored) and _glob_match(segments, anchored, prefix):
+                # A rule that matches the prefix without an anchor matches
+                # whatever follows the prefix too.
+                verdicts.add(allowed)
+                break
+            is_prefix = not (anchored or "".join(segments[1:]))
         else:
-            # Uh-oh. I punt this up to the caller.
-            raise urllib_error.URLError(self._response_code)
+            if not path:
+                # See _Ruleset.compile().
+                allowed = not allowed
+            if prefix.startswith(path):
+                verdicts.add(allowed)
+                break
+            literal = path
+            is_prefix = True
 
-        if ((PY_MAJOR_VERSION == 2) and isinstance(content, str)) or \
-           ((PY_MAJOR_VERSION > 2) and (not isinstance(content, str))):
-            # This ain't Unicode yet! It needs to be.
+        # Every URL that the rule matches starts with literal.
+        if not (literal.startswith(prefix) or prefix.startswith(literal)):
+            # It doesn't match anything in the subtree.
+            continue
+        if _has_prefix_in(literal, inside):
+            continue
+        if is_prefix and (len(literal) > len(prefix)):
+            inside.add(literal)
+        verdicts.add(allowed)
+        if len(verdicts) > 1:
+            return SUBTREE_MIXED
+    else:
+        # Some URLs might not match any rule.
+        verdicts.add(True)
 
-            # Unicode decoding errors are another point of failure that I punt
-            # up to the caller.
-            try:
-                content = content.decode(encoding)
-            except UnicodeError:
-                msg = "Robots.txt contents are not in the encoding expected (%s)." % encoding
-                raise UnicodeError(msg)
-            except (LookupError, ValueError):
-                # LookupError ==> Python doesn't have a decoder for that encoding.
-                # One can also get a ValueError here if the encoding starts with
-                # a dot (ASCII 0x2e). See Python bug 1446043 for details. This
-                # bug was supposedly fixed in Python 2.5.
-                msg = """I don't understand the encoding "%s".""" % encoding
-                raise UnicodeError(msg)
-
-        # Now that I've fetched the content and turned it into Unicode, I
-        # can parse it.
-        self.parse(content)
+    if len(verdicts) > 1:
+        return SUBTREE_MIXED
 
-    def parse(self, s):
-        """Parses the passed string as a set of robots.txt rules."""
-        self._sitemaps = []
-        self.__rulesets = []
+    return SUBTREE_ALLOWED if verdicts.pop() else SUBTREE_DISALLOWED
 
-        if (PY_MAJOR_VERSION > 2) and (isinstance(s, bytes) or isinstance(s, bytearray)) or \
-           (PY_MAJOR_VERSION == 2) and (not isinstance(s, unicode)):  # noqa
-            s = s.decode("iso-8859-1")
 
-        # Normalize newlines.
-        s = _end_of_line_regex.sub("\n", s)
+class _RulesBuilder(object):
+    """Turns the text of a robots.txt into rulesets one line at a time so
+    that a file can be parsed as it arrives without holding more than one
+    line (plus the rules) in memory.
 
-        lines = s.split("\n")
+    feed() accepts text or bytes. Bytes are decoded incrementally with the
+    encoding passed to the constructor. Input beyond limit bytes (or
+    characters, for text) is ignored; None means no limit. Decoding errors
+    are raised as UnicodeError by close() which returns the rulesets and
+    sitemaps.
+    """
+    def __init__(self, encoding="iso-8859-1", limit=None):
+        self.encoding = encoding
+        self.limit = limit
+        self.size = 0
+        self.rulesets = []
+        self.sitemaps = []
+        self._decoder = None
+        self._error = None
+        # This is the end of the text fed so far, which might be the start
+        # of a line that continues in the next piece.
+        self._pending = ""
+        self._current_ruleset = None
+        self._previous_line_was_a_user_agent = False
 
-        previous_line_was_a_user_agent = False
-        current_ruleset = None
+    @property
+    def full(self):
+        """True if no more input will be accepted."""
+        return (self.limit is not None) and (self.size >= self.limit)
 
-        for line in lines:
-            line = line.strip()
+    def feed(self, data):
+        if self.full or (self._error is not None) or (not data):
+            return
 
-            if line and line[0] == '#':
-                # "Lines containing only a comment are discarded completely,
-                # and therefore do not indicate a record boundary." (MK1994)
-                pass
-            else:
-                # Remove comments
-                i = line.find("#")
-                if i != -1:
-                    line = line[:i]
+        if self.limit is not None:
+            data = data[:self.limit - self.size]
+        self.size += len(data)
 
-                line = line.strip()
+        if (PY_MAJOR_VERSION > 2) and (isinstance(data, bytes) or isinstance(data, bytearray)) or \
+           (PY_MAJOR_VERSION == 2) and (not isinstance(data, unicode)):  # noqa
+            # This ain't Unicode yet! It needs to be.
+            data = self._decode(data, False)
+            if data is None:
+                return
 
-                if not line:
-                    # An empty line indicates the end of a ruleset.
-                    if current_ruleset and current_ruleset.is_not_empty():
-                        self.__rulesets.append(current_ruleset)
+        self._add_text(data)
 
-                    current_ruleset = None
-                    previous_line_was_a_user_agent = False
-                else:
-                    # Each non-empty line falls into one of six categories:
-                    # 1) User-agent: blah blah blah
-                    # 2) Disallow: blah blah blah
-                    # 3) Allow: blah blah blah
-                    # 4) Crawl-delay: blah blah blah
-                    # 5) Sitemap: blah blah blah
-                    # 6) Everything else
-                    # 1 - 5 are interesting and I find them with the regex
-                    # below. Category 6 I discard as directed by the MK1994
-                    # ("Unrecognised headers are ignored.")
-                    # Note that 4 & 5 are specific to GYM2008 syntax, but
-                    # respecting them here is not a problem. They're just
-                    # additional information the the caller is free to ignore.
-                    matches = _directive_regex.findall(line)
-
-                    # Categories 1 - 5 produce two matches, #6 produces none.
-                    if matches:
-                        field, data = matches[0]
-                        field = field.lower()
-                        data = _scrub_data(data)
-
-                        # Matching "useragent" is a deviation from the
-                        # MK1994/96 which permits only "user-agent".
-                        if field in ("useragent", "user-agent"):
-                            if previous_line_was_a_user_agent:
-                                # Add this UA to the current ruleset
-                                if current_ruleset and data:
-                                    current_ruleset.add_robot_name(data)
-                            else:
-                                # Save the current ruleset and start a new one.
-                                if current_ruleset and current_ruleset.is_not_empty():
-                                    self.__rulesets.append(current_ruleset)
-                                # else:
-                                    # (is_not_empty() == False) ==> malformed
-                                    # robots.txt listed a UA line but provided
-                                    # no name or didn't provide any rules
-                                    # for a named UA.
-                                current_ruleset = _Ruleset()
-                                if data:
-                                    current_ruleset.add_robot_name(data)
-
-                            previous_line_was_a_user_agent = True
-                        elif field == "allow":
-                            previous_line_was_a_user_agent = False
-                            if current_ruleset:
-                                current_ruleset.add_allow_rule(data)
-                        elif field == "sitemap":
-                            previous_line_was_a_user_agent = False
-                            self._sitemaps.append(data)
-                        elif field == "crawl-delay":
-                            # Only Yahoo documents the syntax for Crawl-delay.
-                            # ref: http://help.yahoo.com/l/us/yahoo/search/webcrawler/slurp-03.html
-                            previous_line_was_a_user_agent = False
-                            if current_ruleset:
-                                try:
-                                    current_ruleset.crawl_delay = float(data)
-                                except ValueError:
-                                    # Invalid crawl-delay -- ignore.
-                                    pass
-                        else:
-                            # This is a disallow line
-                            previous_line_was_a_user_agent = False
-                            if current_ruleset:
-                                current_ruleset.add_disallow_rule(data)
-
-        if current_ruleset and current_ruleset.is_not_empty():
-            self.__rulesets.append(current_ruleset)
+    def close(self):
+        """Finishes parsing and returns a tuple of (rulesets, sitemaps). The
+        rulesets are ordered so that the defaults come last and are compiled.
+        """
+        if self._decoder and (self._error is None):
+            self._add_text(self._decode(b"", True) or "")
+        if self._error is not None:
+            raise self._error
+
+        self._add_line(self._pending)
+        self._pending = ""
+        self._end_ruleset()
 
         # Now that I have all the rulesets, I want to order them in a way
         # that makes comparisons easier later. Specifically, any ruleset that
@@ -634,29 +1740,2523 @@ class RobotExclusionRulesParser(object):
         # so that I only apply the default as a last resort. According to
         # MK1994/96, there should only be one ruleset that specifies * as the
         # user-agent, but you know how these things go.
-        not_defaults = [r for r in self.__rulesets if not r.is_default()]
-        defaults = [r for r in self.__rulesets if r.is_default()]
+        not_defaults = [r for r in self.rulesets if not r.is_default()]
+        defaults = [r for r in self.rulesets if r.is_default()]
 
-        self.__rulesets = not_defaults + defaults
+        rulesets = not_defaults + defaults
 
-    def __str__(self):
-        s = self.__unicode__()
-        if PY_MAJOR_VERSION == 2:
-            s = s.encode("utf-8")
+        # Compiling the rules here means is_allowed() only has to run
+        # precompiled matchers. They're frozen first so that the matchers
+        # use the frozen paths.
+        for ruleset in rulesets:
+            ruleset.freeze()
+            ruleset.compile()
 
-        return s
+        return rulesets, self.sitemaps
 
-    def __unicode__(self):
-        if self._sitemaps:
-            s = "Sitemaps: %s\n\n" % self._sitemaps
+    def _decode(self, data, final):
+        """Returns data decoded with my encoding, or None (after saving the
+        error for close() to raise) if that's not possible.
+        """
+        # Unicode decoding errors are another point of failure that I punt
+        # up to the caller.
+        try:
+            if not self._decoder:
+                self._decoder = codecs.getincrementaldecoder(self.encoding)()
+            return self._decoder.decode(data, final)
+        except UnicodeError:
+            msg = "Robots.txt contents are not in the encoding expected (%s)." % self.encoding
+            self._error = UnicodeError(msg)
+        except (LookupError, ValueError):
+            # LookupError ==> Python doesn't have a decoder for that encoding.
+            # One can also get a ValueError here if the encoding starts with
+            # a dot (ASCII 0x2e). See Python bug 1446043 for details. This
+            # bug was supposedly fixed in Python 2.5.
+            msg = """I don't understand the encoding "%s".""" % self.encoding
+            self._error = UnicodeError(msg)
+
+        return None
+
+    def _add_text(self, text):
+        text = self._pending + text
+        pending = ""
+        if text.endswith("\r"):
+            # This might be the first half of a CRLF split across two pieces.
+            # If so, treating it as a line end would add a blank line (and so
+            # end the ruleset) that isn't really there.
+            text, pending = text[:-1], "\r"
+        if "\r" in text:
+            # Normalize newlines.
+            text = _end_of_line_regex.sub("\n", text)
+
+        lines = text.split("\n")
+        self._pending = lines.pop() + pending
+        for line in lines:
+            self._add_line(line)
+
+    def _end_ruleset(self):
+        if self._current_ruleset and self._current_ruleset.is_not_empty():
+            self.rulesets.append(self._current_ruleset)
+        # else:
+            # (is_not_empty() == False) ==> malformed robots.txt listed a UA
+            # line but provided no name or didn't provide any rules for a
+            # named UA.
+
+    def _add_line(self, line):
+        token = _tokenize_line(line)
+        if token is None:
+            return
+
+        field, data = token
+        if field is None:
+            # An empty line indicates the end of a ruleset.
+            self._end_ruleset()
+
+            self._current_ruleset = None
+            self._previous_line_was_a_user_agent = False
+        elif field == "user-agent":
+            # Matching "useragent" is a deviation from the MK1994/96 which
+            # permits only "user-agent".
+            if self._previous_line_was_a_user_agent:
+                # Add this UA to the current ruleset
+                if self._current_ruleset and data:
+                    self._current_ruleset.add_robot_name(data)
+            else:
+                # Save the current ruleset and start a new one.
+                self._end_ruleset()
+                self._current_ruleset = _Ruleset()
+                if data:
+                    self._current_ruleset.add_robot_name(data)
+
+            self._previous_line_was_a_user_agent = True
+        elif field == "allow":
+            self._previous_line_was_a_user_agent = False
+            if self._current_ruleset:
+                self._current_ruleset.add_allow_rule(data)
+        elif field == "sitemap":
+            self._previous_line_was_a_user_agent = False
+            self.sitemaps.append(data)
+        elif field == "crawl-delay":
+            # Only Yahoo documents the syntax for Crawl-delay.
+            # ref: http://help.yahoo.com/l/us/yahoo/search/webcrawler/slurp-03.html
+            self._previous_line_was_a_user_agent = False
+            if self._current_ruleset:
+                try:
+                    self._current_ruleset.crawl_delay = float(data)
+                except ValueError:
+                    # Invalid crawl-delay -- ignore.
+                    pass
         else:
-            s = ""
-        if PY_MAJOR_VERSION < 3:
-            s = unicode(s)  # noqa
-        # I also need to string-ify each ruleset. The function for doing so
-        # varies under Python 2/3.
-        stringify = (unicode if (PY_MAJOR_VERSION == 2) else str)  # noqa
-        return s + '\n'.join([stringify(ruleset) for ruleset in self.__rulesets])
+            # This is a disallow line
+            self._previous_line_was_a_user_agent = False
+            if self._current_ruleset:
+                self._current_ruleset.add_disallow_rule(data)
+
+
+def _is_conditional(request_headers):
+    """True if the request headers make a request conditional."""
+    return ('If-None-Match' in request_headers) or ('If-Modified-Since' in request_headers)
+
+
+def _is_zlib_header(data):
+    """True if data starts with a zlib (RFC 1950) header."""
+    if len(data) < 2:
+        return False
+    first, second = bytearray(data[:2])
+
+    return ((first & 0x0f) == 8) and ((((first << 8) + second) % 31) == 0)
+
+
+class _BodyDecoder(object):
+    """Decodes an HTTP response body incrementally according to its
+    Content-Encoding (gzip, deflate or none) and keeps no more than limit
+    bytes of the decoded content. Since the limit applies to the decoded
+    size, a small compressed body can't expand into a huge one (a
+    "decompression bomb"). The limit also applies to the bytes read from
+    the wire.
+
+    If sink is a function, it's called with each piece of decoded content
+    instead of keeping them for the body property.
+
+    A zlib.error from corrupt data is raised as URLError.
+    """
+    def __init__(self, content_encoding, limit=MAX_FILESIZE, sink=None):
+        content_encoding = (content_encoding or "").strip().lower()
+        if content_encoding == "x-gzip":
+            content_encoding = "gzip"
+        # Encodings that I don't understand (and didn't ask for) are passed
+        # through undecoded, which is what fetch() always did.
+        self.content_encoding = content_encoding if content_encoding in ("gzip", "deflate") \
+            else None
+        self.limit = limit
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.done = False
+        self._chunks = []
+        self._sink = sink or self._chunks.append
+        self._decompressor = None
+        if self.content_encoding == "gzip":
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    @property
+    def body(self):
+        return b"".join(self._chunks)
+
+    def feed(self, data):
+        """Decodes the next piece of the body. Returns True once no more
+        input is needed because the limit has been reached or the
+        compressed stream is complete.
+        """
+        if self.done or not data:
+            return self.done
+
+        self.wire_bytes += len(data)
+        if (self.content_encoding == "deflate") and (not self._decompressor):
+            # "deflate" is supposed to be zlib format (RFC 7230 sec 4.2.2) but
+            # some servers send raw deflate data instead.
+            wbits = zlib.MAX_WBITS if _is_zlib_header(data) else -zlib.MAX_WBITS
+            self._decompressor = zlib.decompressobj(wbits)
+
+        remaining = self.limit - self.decoded_bytes
+        if self._decompressor:
+            try:
+                data = self._decompressor.decompress(data, remaining)
+            except zlib.error:
+                msg = "Robots.txt contents are not valid %s data." % self.content_encoding
+                raise urllib_error.URLError(msg)
+            # Python 2's decompressor doesn't have the eof attribute.
+            self.done = getattr(self._decompressor, "eof", False)
+        else:
+            data = data[:remaining]
+
+        self._sink(data)
+        self.decoded_bytes += len(data)
+        if (self.decoded_bytes >= self.limit) or (self.wire_bytes >= self.limit):
+            self.done = True
+
+        return self.done
+
+
+def _read_body(f, content_encoding, limit=MAX_FILESIZE, sink=None):
+    """Reads and decodes a response body from the file-like object f.
+    Returns a _BodyDecoder.
+    """
+    decoder = _BodyDecoder(content_encoding, limit, sink)
+    while not decoder.done:
+        data = f.read(min(16 * 1024, decoder.limit - decoder.wire_bytes))
+        if not data:
+            break
+        decoder.feed(data)
+
+    return decoder
+
+
+def _decode_chunked(body):
+    """Returns the body of an HTTP response sent with chunked transfer
+    encoding minus the chunk framing. Decoding stops quietly at the first
+    incomplete or malformed chunk since the body may have been truncated
+    at MAX_FILESIZE.
+    """
+    chunks = []
+    i = 0
+    while True:
+        j = body.find(b"\r\n", i)
+        if j == -1:
+            break
+        try:
+            # Chunk extensions (after a semicolon) are ignored.
+            size = int(body[i:j].split(b";")[0], 16)
+        except ValueError:
+            break
+        if not size:
+            break
+        chunks.append(body[j + 2:j + 2 + size])
+        i = j + 2 + size + 2
+
+    return b"".join(chunks)
+
+
+class _AsyncFetch(object):
+    """Performs one HTTP GET (following redirects) with asyncio streams on
+    behalf of RobotExclusionRulesParser.fetch_async().
+
+    The steps are chained with future callbacks rather than written as a
+    coroutine so that this module remains importable under Python 2.
+
+    The result future receives a (response code, body, headers, wire bytes)
+    tuple where headers is a dict keyed by lower case header names and body
+    is decoded according to the Content-Encoding. Connection failures give a
+    response code of 0, like fetch() gets from urllib.
+    """
+    def __init__(self, loop, url, request_headers, result, limit=MAX_FILESIZE):
+        self.loop = loop
+        self.limit = limit
+        self.request_headers = request_headers
+        self.result = result
+        self.redirects = 0
+        self.pending = None
+        self.writer = None
+        self.headers = None
+        self.body = []
+        self.remaining = 0
+        # If the caller gives up (e.g. on a timeout), abandon the request.
+        result.add_done_callback(self.on_result_done)
+
+        self.start(url)
+
+    def start(self, url):
+        self.url = url
+        parts = urllib_urlparse(url)
+        scheme = parts.scheme.lower()
+        try:
+            host = parts.hostname
+            port = parts.port or _DEFAULT_PORTS.get(scheme)
+        except ValueError:
+            # The port isn't a valid number.
+            host = None
+        if (scheme not in _DEFAULT_PORTS) or (not host):
+            # urllib also raises URLError for URLs it can't open.
+            self.fail(urllib_error.URLError("unknown url type: %s" % url))
+            return
+
+        path = urllib_urlunparse(("", "", parts.path or "/", parts.params, parts.query, ""))
+        netloc = parts.netloc.rpartition("@")[2]
+        request = ["GET %s HTTP/1.0" % path, "Host: %s" % netloc, "Connection: close"]
+        request += ["%s: %s" % item for item in self.request_headers.items()]
+        self.request = ("\r\n".join(request) + "\r\n\r\n").encode("iso-8859-1")
+
+        self.chain(asyncio.open_connection(host, port, ssl=(scheme == "https")),
+                   self.on_connect)
+
+    def chain(self, coroutine, callback):
+        self.pending = asyncio.ensure_future(coroutine)
+        self.pending.add_done_callback(lambda future: self.step(future, callback))
+
+    def step(self, future, callback):
+        self.pending = None
+        if self.result.done():
+            # The caller gave up.
+            return
+        try:
+            callback(future.result())
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            # The connection failed, the server hung up early or sent
+            # garbage. fetch() reports all of these as response code 0.
+            self.finish(0, b"")
+        except Exception:
+            self.fail(sys.exc_info()[1])
+
+    def on_connect(self, streams):
+        self.reader, self.writer = streams
+        self.writer.write(self.request)
+        self.chain(self.reader.readuntil(b"\r\n\r\n"), self.on_headers)
+
+    def on_headers(self, data):
+        lines = data.decode("iso-8859-1").split("\r\n")
+        # e.g. "HTTP/1.0 200 OK". int() raises ValueError if it's garbage.
+        response_code = int(lines[0].split()[1])
+        self.headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if value:
+                # Like http.client's get(), the first occurrence wins.
+                self.headers.setdefault(name.strip().lower(), value.strip())
+
+        location = self.headers.get("location")
+        if (response_code in _REDIRECT_CODES) and location and \
+           (self.redirects < MAX_REDIRECTS):
+            self.redirects += 1
+            self.close()
+            self.start(urllib_urljoin(self.url, location))
+            return
+
+        self.response_code = response_code
+        self.remaining = self.limit
+        if self.headers.get("content-length", "").isdigit():
+            self.remaining = min(self.remaining, int(self.headers["content-length"]))
+        self.decoder = _BodyDecoder(self.headers.get("content-encoding"), self.limit)
+        # A chunked body has to be reassembled before it can be decoded.
+        self.chunked = (self.headers.get("transfer-encoding", "").lower() == "chunked")
+
+        self.read_body()
+
+    def read_body(self):
+        if (self.remaining > 0) and (not self.decoder.done):
+            self.chain(self.reader.read(min(self.remaining, 64 * 1024)), self.on_body)
+        else:
+            self.on_body(b"")
+
+    def on_body(self, data):
+        if data:
+            self.remaining -= len(data)
+            if self.chunked:
+                self.body.append(data)
+            else:
+                self.decoder.feed(data)
+            self.read_body()
+        else:
+            # The server closed the connection or I have all I want.
+            if self.chunked:
+                self.decoder.feed(_decode_chunked(b"".join(self.body)))
+            self.finish(self.response_code, self.decoder.body, self.decoder.wire_bytes)
+
+    def finish(self, response_code, body, wire_bytes=0):
+        headers = self.headers or {}
+        self.close()
+        self.result.set_result((response_code, body, headers, wire_bytes))
+
+    def fail(self, error):
+        self.close()
+        self.result.set_exception(error)
+
+    def on_result_done(self, result):
+        if self.pending:
+            self.pending.cancel()
+        self.close()
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+
+def _copy_future_outcome(source, target):
+    """Gives target (a future) the same result, exception or cancellation as
+    source (a completed future) unless target is already done.
+    """
+    if target.done():
+        pass
+    elif source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class AgentPolicy(object):
+    """The rules of one robots.txt for one user agent, as returned by
+    RobotExclusionRulesParser.for_agent().
+
+    The user agent is matched to a ruleset once when the policy is created,
+    so the policy's methods don't have to do it again. A policy is
+    immutable; it keeps answering according to the rules that were in
+    effect when it was created even if the parser that created it parses a
+    new robots.txt. Check is_current to find out if that has happened.
+    """
+    __slots__ = ("_parser", "_version", "_user_agent", "_ruleset")
+
+    def __init__(self, parser, version, user_agent, ruleset):
+        self._parser = parser
+        self._version = version
+        self._user_agent = user_agent
+        # None means that no ruleset applies so everything is allowed.
+        self._ruleset = ruleset
+
+    @property
+    def user_agent(self):
+        """The user agent to which this policy applies. Read only."""
+        return self._user_agent
+
+    @property
+    def crawl_delay(self):
+        """A float representing the crawl delay specified for this user
+        agent, or None if the crawl delay was unspecified or not a float.
+        Read only.
+        """
+        return self._ruleset.crawl_delay if self._ruleset else None
+
+    @property
+    def version(self):
+        """The parser's version number when this policy was created. The
+        version changes each time the parser parses a robots.txt. Read only.
+        """
+        return self._version
+
+    @property
+    def is_current(self):
+        """False if the parser has parsed another robots.txt since this
+        policy was created. Read only.
+        """
+        return self._version == self._parser._version
+
+    def is_allowed(self, url, syntax=GYM2008):
+        """True if the user agent is permitted to visit the URL. See
+        RobotExclusionRulesParser.is_allowed().
+        """
+        # See RobotExclusionRulesParser.is_allowed() comment about the
+        # explicit unicode conversion.
+        if (PY_MAJOR_VERSION < 3) and (not isinstance(url, unicode)):  # noqa
+            url = url.decode()
+
+        if syntax not in (MK1996, GYM2008):
+            raise ValueError("Syntax must be MK1996 or GYM2008")
+
+        return self._ruleset.is_url_allowed(url, syntax) if self._ruleset else True
+
+    def is_allowed_many(self, urls, syntax=GYM2008):
+        """Returns a list of booleans that say whether or not the user agent
+        is permitted to visit each of the URLs. See
+        RobotExclusionRulesParser.is_allowed_many().
+        """
+        if PY_MAJOR_VERSION < 3:
+            urls = [url if isinstance(url, unicode) else url.decode() for url in urls]  # noqa
+        else:
+            urls = list(urls)
+
+        if syntax not in (MK1996, GYM2008):
+            raise ValueError("Syntax must be MK1996 or GYM2008")
+
+        return self._ruleset.are_urls_allowed(urls, syntax) if self._ruleset else \
+            [True] * len(urls)
+
+    def is_subtree_allowed(self, path_prefix, syntax=GYM2008):
+        """Returns one of the SUBTREE_* constants. See
+        RobotExclusionRulesParser.is_subtree_allowed().
+        """
+        if (PY_MAJOR_VERSION < 3) and (not isinstance(path_prefix, unicode)):  # noqa
+            path_prefix = path_prefix.decode()
+
+        if syntax not in (MK1996, GYM2008):
+            raise ValueError("Syntax must be MK1996 or GYM2008")
+
+        return self._ruleset.subtree_verdict(path_prefix, syntax) if self._ruleset else \
+            SUBTREE_ALLOWED
+
+
+class RobotExclusionRulesParser(object):
+    """A parser for robots.txt files."""
+    # A crawler may cache millions of these, so instances don't have a
+    # __dict__. (Instances of subclasses do unless they define __slots__.)
+    __slots__ = ("_source_url", "user_agent", "use_local_time", "expiration_date", "min_ttl",
+                 "max_ttl", "stale_while_revalidate", "fallback", "_consecutive_failures",
+                 "_backoff_until", "_has_good_rules", "_wire_bytes", "_decoded_bytes",
+                 "max_filesize", "_stream", "_response_code", "_sitemaps", "__rulesets",
+                 "_trivial_policy", "interner", "_version", "_etag", "_last_modified",
+                 "minimize_rules", "_eliminated_rules", "__weakref__")
+
+    def __init__(self):
+        self._source_url = ""
+        self.user_agent = None
+        self.use_local_time = True
+        self.expiration_date = self._now() + SEVEN_DAYS
+        # The limits on the time to live; see MIN_TTL and MAX_TTL.
+        self.min_ttl = MIN_TTL
+        self.max_ttl = MAX_TTL
+        # The number of seconds after expiration_date during which the
+        # server said it's OK to keep using these rules while fetching a
+        # fresh copy (Cache-Control: stale-while-revalidate).
+        self.stale_while_revalidate = 0
+        # This controls which rules apply after a failed fetch. It's one of
+        # FALLBACK_DISALLOW_ALL or FALLBACK_KEEP_LAST_GOOD.
+        self.fallback = FALLBACK_KEEP_LAST_GOOD
+        self._consecutive_failures = 0
+        self._backoff_until = None
+        # True if the current rules came from a successful fetch or parse()
+        # as opposed to being a fallback for a failed fetch.
+        self._has_good_rules = False
+        # The size of the last response body as sent by the server (maybe
+        # compressed) and after decoding.
+        self._wire_bytes = 0
+        self._decoded_bytes = 0
+        # The most bytes of a robots.txt that fetch() and feed() will read.
+        self.max_filesize = MAX_FILESIZE
+        # The _RulesBuilder for the pieces passed to feed().
+        self._stream = None
+        self._response_code = 0
+        self._sitemaps = ()
+        self.__rulesets = []
+        # This is ALLOW_ALL or DISALLOW_ALL if my rules amount to one of those,
+        # otherwise None.
+        self._trivial_policy = ALLOW_ALL
+        # If this is a RulesInterner, my rules are shared with other parsers
+        # that use it and have identical rules.
+        self.interner = None
+        # If this is True, rules that can't affect any answer are removed
+        # from every robots.txt I parse. See minimize().
+        self.minimize_rules = False
+        self._eliminated_rules = 0
+        # This changes every time parse() is called so that AgentPolicy
+        # instances can tell if they're out of date.
+        self._version = 0
+        # These are the validators from the response that provided the rules.
+        self._etag = None
+        self._last_modified = None
+
+    @property
+    def source_url(self):
+        """The URL from which this robots.txt was fetched. Read only."""
+        return self._source_url
+
+    @property
+    def response_code(self):
+        """The remote server's response code. Read only."""
+        return self._response_code
+
+    @property
+    def wire_bytes(self):
+        """The size of the body of the last fetch() response as it was sent
+        by the server, which may have compressed it. Read only.
+        """
+        return self._wire_bytes
+
+    @property
+    def decoded_bytes(self):
+        """The size of the body of the last fetch() response after
+        decompression (and truncation to MAX_FILESIZE). Read only.
+        """
+        return self._decoded_bytes
+
+    @property
+    def consecutive_failures(self):
+        """The number of times in a row that fetching this robots.txt has
+        failed. Read only.
+        """
+        return self._consecutive_failures
+
+    @property
+    def backoff_remaining(self):
+        """The number of seconds until fetch() will try again to fetch this
+        robots.txt after a failure, or 0 if it's not backing off. Read only.
+        """
+        if self._backoff_until is None:
+            return 0
+
+        return max(self._backoff_until - self._now(), 0)
+
+    @property
+    def etag(self):
+        """The ETag header from the response that provided the current
+        rules, or None. Read only.
+        """
+        return self._etag
+
+    @property
+    def last_modified(self):
+        """The Last-Modified header from the response that provided the
+        current rules, or None. Read only.
+        """
+        return self._last_modified
+
+    @property
+    def sitemap(self):
+        """Deprecated; use 'sitemaps' instead. Returns the sitemap URL present
+        in the robots.txt, if any. Defaults to None. Read only."""
+        raise DeprecationWarning("The sitemap property is deprecated. Use 'sitemaps' instead.")
+
+    @property
+    def sitemaps(self):
+        """The sitemap URLs present in the robots.txt, if any. Defaults
+        to an empty list. Read only."""
+        # I return a copy of the list so the caller can manipulate the list
+        # without affecting self._sitemaps (which is a tuple).
+        return list(self._sitemaps)
+
+    @property
+    def trivial_policy(self):
+        """ALLOW_ALL or DISALLOW_ALL if the rules give every user agent that
+        answer for every URL (e.g. there's no robots.txt), otherwise None.
+        Read only.
+        """
+        return self._trivial_policy
+
+    @property
+    def eliminated_rules(self):
+        """The number of rules that minimize() removed from the current
+        rules. Read only.
+        """
+        return self._eliminated_rules
+
+    @property
+    def is_expired(self):
+        """True if the difference between now and the last call to fetch()
+        exceeds the robots.txt expiration. Read only.
+        """
+        return self.expiration_date <= self._now()
+
+    @property
+    def is_usable_while_revalidating(self):
+        """True if this robots.txt is expired but the server permits using it
+        while a fresh copy is fetched (per Cache-Control's
+        stale-while-revalidate). Read only.
+        """
+        now = self._now()
+
+        return self.expiration_date <= now < self.expiration_date + self.stale_while_revalidate
+
+    def _now(self):
+        if self.use_local_time:
+            return time.time()
+        else:
+            # What the heck is timegm() doing in the calendar module?!?
+            return calendar.timegm(time.gmtime())
+
+    def is_allowed(self, user_agent, url, syntax=GYM2008):
+        """True if the user agent is permitted to visit the URL. The syntax
+        parameter can be GYM2008 (the default) or MK1996 for strict adherence
+        to the traditional standard.
+        """
+        if PY_MAJOR_VERSION < 3:
+            # The robot rules are stored internally as Unicode. The two lines
+            # below ensure that the parameters passed to this function are
+            # also Unicode. If those lines were not present and the caller
+            # passed a non-Unicode user agent or URL string to this function,
+            # Python would silently convert it to Unicode before comparing it
+            # to the robot rules. Such conversions use the default encoding
+            # (usually US-ASCII) and if the string couldn't be converted using
+            # that encoding, Python would raise a UnicodeError later on in the
+            # guts of this code which would be confusing.
+            # Converting the strings to Unicode here doesn't make the problem
+            # go away but it does make the conversion explicit so that
+            # failures are easier to understand.
+            if not isinstance(user_agent, unicode):  # noqa
+                user_agent = user_agent.decode()
+            if not isinstance(url, unicode):  # noqa
+                url = url.decode()
+
+        if syntax not in (MK1996, GYM2008):
+            raise ValueError("Syntax must be MK1996 or GYM2008")
+
+        ruleset = self._find_ruleset(user_agent)
+
+        return ruleset.is_url_allowed(url, syntax) if ruleset else True
+
+    def is_allowed_many(self, user_agent, urls, syntax=GYM2008):
+        """Returns a list of booleans that say whether or not the user agent
+        is permitted to visit each of the URLs. The answers are the same as
+        those of is_allowed(), but the user agent is resolved only once and
+        the URLs are matched as a batch, which is much faster than calling
+        is_allowed() for each URL.
+        """
+        # See is_allowed() comment about the explicit unicode conversion.
+        if PY_MAJOR_VERSION < 3:
+            if not isinstance(user_agent, unicode):  # noqa
+                user_agent = user_agent.decode()
+            urls = [url if isinstance(url, unicode) else url.decode() for url in urls]  # noqa
+        else:
+            urls = list(urls)
+
+        if syntax not in (MK1996, GYM2008):
+            raise ValueError("Syntax must be MK1996 or GYM2008")
+
+        ruleset = self._find_ruleset(user_agent)
+
+        return ruleset.are_urls_allowed(urls, syntax) if ruleset else [True] * len(urls)
+
+    def is_subtree_allowed(self, user_agent, path_prefix, syntax=GYM2008):
+        """Says whether the user agent is permitted to visit the URLs whose
+        paths start with path_prefix (e.g. "/archive/2019/"), which may also
+        be given as a URL. Returns SUBTREE_ALLOWED if is_allowed() would be
+        True for all of them, SUBTREE_DISALLOWED if it would be False for
+        all of them, or SUBTREE_MIXED if some of them might be allowed and
+        others not.
+
+        The answer comes from comparing the prefix to the rules, so it takes
+        about as long as a few calls to is_allowed(). It's conservative:
+        it's SUBTREE_MIXED if the rules are too complicated (e.g. some
+        wildcard rules) to be sure.
+        """
+        # See is_allowed() comment about the explicit unicode conversion.
+        if PY_MAJOR_VERSION < 3:
+            if not isinstance(user_agent, unicode):  # noqa
+                user_agent = user_agent.decode()
+            if not isinstance(path_prefix, unicode):  # noqa
+                path_prefix = path_prefix.decode()
+
+        if syntax not in (MK1996, GYM2008):
+            raise ValueError("Syntax must be MK1996 or GYM2008")
+
+        ruleset = self._find_ruleset(user_agent)
+
+        return ruleset.subtree_verdict(path_prefix, syntax) if ruleset else SUBTREE_ALLOWED
+
+    def get_crawl_delay(self, user_agent):
+        """Returns a float representing the crawl delay specified for this
+        user agent, or None if the crawl delay was unspecified or not a float.
+        """
+        # See is_allowed() comment about the explicit unicode conversion.
+        if (PY_MAJOR_VERSION < 3) and (not isinstance(user_agent, unicode)):  # noqa
+            user_agent = user_agent.decode()
+
+        ruleset = self._find_ruleset(user_agent)
+
+        return ruleset.crawl_delay if ruleset else None
+
+    def for_agent(self, user_agent):
+        """Returns an AgentPolicy that answers questions about this
+        robots.txt for the user agent without having to match the user agent
+        to a ruleset each time. Crawlers that always use the same user agent
+        should prefer this to calling is_allowed() repeatedly.
+        """
+        # See is_allowed() comment about the explicit unicode conversion.
+        if (PY_MAJOR_VERSION < 3) and (not isinstance(user_agent, unicode)):  # noqa
+            user_agent = user_agent.decode()
+
+        return AgentPolicy(self, self._version, user_agent, self._find_ruleset(user_agent))
+
+    def _find_ruleset(self, user_agent):
+        """Returns the ruleset that applies to the user agent or None."""
+        if self._trivial_policy is not None:
+            # It answers questions the same way as a ruleset (and faster).
+            return self._trivial_policy
+
+        for ruleset in self.__rulesets:
+            if ruleset.does_user_agent_match(user_agent):
+                return ruleset
+
+        return None
+
+    def fetch(self, url, timeout=None, transport=None):
+        """Attempts to fetch the URL requested which should refer to a
+        robots.txt file, e.g. http://example.com/robots.txt.
+
+        By default, each call opens a new connection with urllib. Pass an
+        HTTPConnectionPool as transport to reuse connections instead.
+
+        When refetching the same URL, the request is conditional on the
+        robots.txt having changed. If the server responds 304 (Not
+        Modified), only the expiration date is updated.
+
+        If the fetch fails, the exception is passed up to the caller as
+        before, but the parser also starts backing off: the expiration date
+        is set to the end of the backoff period (see BACKOFF_INITIAL and the
+        Retry-After header), the rules are replaced according to the
+        fallback attribute, and calling fetch() again for the same URL
+        raises BackoffError until the period ends.
+        """
+        content = ""
+        headers = {}
+        self._check_backoff(url)
+        request_headers = self._make_request_headers(url)
+        self._response_code = 0
+        self._source_url = url
+        self._wire_bytes = self._decoded_bytes = 0
+
+        try:
+            if transport:
+                # Like urlopen(), the transport follows redirects and raises
+                # URLError if it can't connect.
+                self._response_code, content, headers, self._wire_bytes = \
+                    transport.get(url, request_headers, timeout, self.max_filesize)
+                self._decoded_bytes = len(content)
+            else:
+                req = urllib_request.Request(url, None, request_headers)
+
+                if timeout:
+                    f = urllib_request.urlopen(req, timeout=timeout)
+                else:
+                    f = urllib_request.urlopen(req)
+
+                # As of Python 2.5, f.info() looks like it returns the
+                # HTTPMessage object created during the connection.
+                headers = f.info()
+                # As of Python 2.4, this file-like object reports the response
+                # code, too.
+                if hasattr(f, "code"):
+                    self._response_code = f.code
+                else:
+                    self._response_code = 200
+                sink = None
+                if (self._response_code >= 200) and (self._response_code < 300):
+                    # Parse the content as it arrives rather than waiting
+                    # for all of it. _handle_response() finishes the job.
+                    encoding = _parse_content_type_header(headers.get("content-type"))[1]
+                    content = _RulesBuilder(encoding or "iso-8859-1")
+                    sink = content.feed
+                decoder = _read_body(f, headers.get("content-encoding"), self.max_filesize, sink)
+                if sink is None:
+                    content = decoder.body
+                self._wire_bytes = decoder.wire_bytes
+                self._decoded_bytes = decoder.decoded_bytes
+                f.close()
+        except urllib_error.URLError:
+            # This is a slightly convoluted way to get the error instance,
+            # but it works under Python 2 & 3.
+            error_instance = sys.exc_info()
+            if len(error_instance) > 1:
+                error_instance = error_instance[1]
+            if hasattr(error_instance, "code"):
+                # This is an HTTPError which also has the response headers.
+                # urlopen() treats 304 as an error.
+                self._response_code = error_instance.code
+                headers = error_instance.info() or {}
+            else:
+                # Either I couldn't connect or the body couldn't be decoded.
+                self._response_code = 0
+                content = ""
+        except socket.error:
+            # This includes timeouts.
+            self._handle_failure({})
+            raise
+
+        self._handle_response(content, headers, _is_conditional(request_headers))
+
+    def fetch_async(self, url, timeout=None):
+        """The asyncio version of fetch(). Returns a future, so call it like
+        this from a coroutine --
+
+            await parser.fetch_async('http://example.com/robots.txt')
+
+        The behavior (including backoff after failures) is the same as
+        fetch() except that the timeout applies to the entire fetch rather
+        than to individual socket operations.
+        Large robots.txt files are parsed in the event loop's default
+        executor so they don't block the loop; see
+        ASYNC_PARSE_IN_EXECUTOR_SIZE.
+
+        Requires Python 3.5 or later.
+        """
+        if asyncio is None:
+            raise NotImplementedError("fetch_async() requires asyncio (Python 3.5 or later)")
+
+        loop = asyncio.get_event_loop()
+        self._check_backoff(url)
+        request_headers = self._make_request_headers(url)
+        conditional = _is_conditional(request_headers)
+        self._response_code = 0
+        self._source_url = url
+        self._wire_bytes = self._decoded_bytes = 0
+
+        response = loop.create_future()
+        _AsyncFetch(loop, url, request_headers, response, self.max_filesize)
+        if timeout:
+            response = asyncio.ensure_future(asyncio.wait_for(response, timeout))
+
+        done = loop.create_future()
+
+        def on_done(future):
+            # If the caller cancels, cancel the fetch too.
+            if future.cancelled():
+                response.cancel()
+
+        done.add_done_callback(on_done)
+
+        def parse_response(response_code, content, headers, wire_bytes):
+            self._response_code = response_code
+            self._wire_bytes = wire_bytes
+            self._decoded_bytes = len(content)
+            self._handle_response(content, headers, conditional)
+
+        def on_response(future):
+            if done.done():
+                return
+            if future.cancelled():
+                done.cancel()
+                return
+            error = future.exception()
+            if isinstance(error, asyncio.TimeoutError):
+                # Under Python < 3.11, asyncio's TimeoutError isn't the same
+                # as socket.timeout which is what fetch() raises.
+                error = socket.timeout("timed out")
+            if error is not None:
+                if isinstance(error, socket.error):
+                    self._handle_failure({})
+                done.set_exception(error)
+                return
+
+            args = future.result()
+            if len(args[1]) >= ASYNC_PARSE_IN_EXECUTOR_SIZE:
+                parsed = loop.run_in_executor(None, parse_response, *args)
+                parsed.add_done_callback(lambda parsed: _copy_future_outcome(parsed, done))
+            else:
+                try:
+                    parse_response(*args)
+                except Exception:
+                    done.set_exception(sys.exc_info()[1])
+                else:
+                    done.set_result(None)
+
+        response.add_done_callback(on_response)
+
+        return done
+
+    def _check_backoff(self, url):
+        """Raises BackoffError if a previous attempt to fetch the URL failed
+        and it's too soon to try again.
+        """
+        if url != self._source_url:
+            # Failures of some other URL don't count.
+            self._consecutive_failures = 0
+            self._backoff_until = None
+        elif self.backoff_remaining:
+            raise BackoffError(self.backoff_remaining)
+
+    def _handle_failure(self, headers):
+        """Records a failed fetch. This sets the expiration date to the end of
+        the backoff period and applies the fallback rules.
+        """
+        self._consecutive_failures += 1
+        delay = BACKOFF_INITIAL * (2 ** min(self._consecutive_failures - 1, 30))
+        retry_after = _parse_retry_after_header(headers.get("retry-after"), time.time())
+        if retry_after is not None:
+            delay = retry_after
+        delay = min(delay, BACKOFF_MAX)
+
+        self.expiration_date = self._now() + delay
+        self._backoff_until = self.expiration_date
+        self.stale_while_revalidate = 0
+
+        if (self.fallback == FALLBACK_DISALLOW_ALL) or (not self._has_good_rules):
+            self.parse("User-agent: *\nDisallow: /\n")
+            self._has_good_rules = False
+
+    def _make_request_headers(self, url):
+        """Returns a dict of the headers to send when fetching the URL."""
+        # robots.txt files are repetitive and compress well.
+        headers = {'Accept-Encoding': 'gzip, deflate'}
+        if self.user_agent:
+            headers['User-Agent'] = self.user_agent
+
+        # If I'm fetching the same robots.txt again, I ask the server to send
+        # it only if it has changed (RFC 7232).
+        if url == self._source_url:
+            if self._etag:
+                headers['If-None-Match'] = self._etag
+            if self._last_modified:
+                headers['If-Modified-Since'] = self._last_modified
+
+        return headers
+
+    def _handle_response(self, content, headers, conditional):
+        """Given the response to a request for a robots.txt (with the
+        response code already in self._response_code), sets the expiration
+        date and parses the content. headers can be anything with a get()
+        method that accepts lower case header names. This is shared by fetch()
+        and fetch_async().
+        """
+        # A 304 only makes sense if I asked for it.
+        not_modified = conditional and (self._response_code == 304)
+
+        # ISO-8859-1 is the default encoding for text files per the specs for
+        # HTTP 1.0 (RFC 1945 sec 3.6.1) and HTTP 1.1 (RFC 2616 sec 3.7.1).
+        # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.7.1
+        encoding = "iso-8859-1"
+
+        # MK1996 section 3.4 says, "...robots should take note of Expires
+        # header set by the origin server. If no cache-control directives
+        # are present robots should default to an expiry of 7 days".
+
+        # Per RFC 7234 sec 4.2.1, the Cache-Control directives s-maxage (a
+        # crawler's robots.txt cache is shared by all of its fetches) and
+        # max-age take precedence over Expires. no-cache and no-store mean
+        # the content has to be revalidated before it's used again.
+        self.expiration_date = None
+        self.stale_while_revalidate = 0
+        if (self._response_code >= 200 and self._response_code < 300) or not_modified:
+            # All's well.
+            cache_control = _parse_cache_control_header(headers.get("cache-control"))
+            ttl = None
+            if ("no-cache" in cache_control) or ("no-store" in cache_control):
+                ttl = 0
+            else:
+                ttl = _parse_seconds(cache_control.get("s-maxage"))
+                if ttl is None:
+                    ttl = _parse_seconds(cache_control.get("max-age"))
+                if ttl is not None:
+                    # The Age header says how long the response sat in
+                    # another cache (e.g. a proxy) before it got here.
+                    ttl = max(ttl - (_parse_seconds(headers.get("age")) or 0), 0)
+            self.stale_while_revalidate = \
+                _parse_seconds(cache_control.get("stale-while-revalidate")) or 0
+
+            expires_header = headers.get("expires")
+            if ttl is not None:
+                self.expiration_date = self._now() + ttl
+            elif expires_header:
+                self.expiration_date = email_utils.parsedate_tz(expires_header)
+
+                if self.expiration_date:
+                    # About time zones -- the call to parsedate_tz() returns a
+                    # 10-tuple with the time zone offset in the 10th element.
+                    # There are 3 valid formats for HTTP dates, and one of
+                    # them doesn't contain time zone information. (UTC is
+                    # implied since all HTTP header dates are UTC.) When given
+                    # a date that lacks time zone information, parsedate_tz()
+                    # returns None in the 10th element. mktime_tz() interprets
+                    # None in the 10th (time zone) element to mean that the
+                    # date is *local* time, not UTC.
+                    # Therefore, if the HTTP timestamp lacks time zone info
+                    # and I run that timestamp through parsedate_tz() and pass
+                    # it directly to mktime_tz(), I'll get back a local
+                    # timestamp which isn't what I want. To fix this, I simply
+                    # convert a time zone of None to zero. It's much more
+                    # difficult to explain than to fix. =)
+                    # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.3.1
+                    if self.expiration_date[9] is None:
+                        self.expiration_date = self.expiration_date[:9] + (0,)
+
+                    self.expiration_date = email_utils.mktime_tz(self.expiration_date)
+                    if self.use_local_time:
+                        # I have to do a little more converting to get this
+                        # UTC timestamp into localtime.
+                        self.expiration_date = time.mktime(time.gmtime(self.expiration_date))
+                # else:
+                    # The expires header was garbage.
+
+        if self.expiration_date is None:
+            self.expiration_date = self._now() + SEVEN_DAYS
+
+        # Keep the expiration within the limits set by min_ttl and max_ttl.
+        now = self._now()
+        if self.min_ttl is not None:
+            self.expiration_date = max(self.expiration_date, now + self.min_ttl)
+        if self.max_ttl is not None:
+            self.expiration_date = min(self.expiration_date, now + self.max_ttl)
+
+        if not_modified:
+            # The rules I have are still current, so there's nothing to
+            # download or parse. The server may have sent new validators.
+            self._consecutive_failures = 0
+            self._backoff_until = None
+            self._etag = headers.get("etag") or self._etag
+            self._last_modified = headers.get("last-modified") or self._last_modified
+            return
+
+        if (self._response_code >= 200) and (self._response_code < 300):
+            # All's well.
+            media_type, encoding = _parse_content_type_header(headers.get("content-type"))
+            # RFC 2616 sec 3.7.1 --
+            # When no explicit charset parameter is provided by the sender,
+            # media subtypes  of the "text" type are defined to have a default
+            # charset value of "ISO-8859-1" when received via HTTP.
+            # http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.7.1
+            if not encoding:
+                encoding = "iso-8859-1"
+        elif self._response_code in (401, 403):
+            # 401 or 403 ==> Go away or I will taunt you a second time!
+            # (according to MK1996)
+            content = "User-agent: *\nDisallow: /\n"
+        elif self._response_code == 404:
+            # No robots.txt ==> everyone's welcome
+            content = ""
+        else:
+            # Uh-oh. I punt this up to the caller, but first I make sure
+            # that the caller won't try again too soon.
+            self._handle_failure(headers)
+            raise urllib_error.URLError(self._response_code)
+
+        self._consecutive_failures = 0
+        self._backoff_until = None
+
+        if isinstance(content, _RulesBuilder):
+            # fetch() parsed the content as it arrived.
+            builder = content
+        else:
+            builder = _RulesBuilder(encoding)
+            builder.feed(content)
+        # This raises UnicodeError if the content couldn't be decoded.
+        self._use_rules(builder)
+
+        if (self._response_code >= 200) and (self._response_code < 300):
+            # parse() cleared these. I'll send them next time to revalidate.
+            self._etag = headers.get("etag")
+            self._last_modified = headers.get("last-modified")
+
+    def _estimated_size(self):
+        """Returns a rough estimate of the number of bytes of memory used by
+        this instance. RobotsRegistry uses it to enforce its byte budget.
+        """
+        # The constants are ballpark figures for the per-object overhead of
+        # the parser, each ruleset, and each rule (including its share of
+        # the compiled matchers).
+        size = 1000 + sum([sys.getsizeof(sitemap) for sitemap in self._sitemaps])
+        if self._trivial_policy is not None:
+            # Trivial rules are shared by all of the parsers that have them.
+            return size
+
+        for ruleset in self.__rulesets:
+            size += 500 + sum([sys.getsizeof(name) for name in ruleset.robot_names])
+            if isinstance(ruleset._paths, _FrontCodedPaths):
+                size += (20 * len(ruleset._paths)) + ruleset._paths.estimated_size()
+            else:
+                size += sum([100 + (2 * sys.getsizeof(path)) for path in ruleset._paths])
+
+        return size
+
+    def parse(self, s):
+        """Parses the passed string as a set of robots.txt rules. Bytes are
+        decoded as ISO-8859-1. Unlike feed(), this ignores max_filesize.
+        """
+        builder = _RulesBuilder()
+        builder.feed(s)
+        self._use_rules(builder)
+
+    def feed(self, data):
+        """Parses the next piece of a robots.txt file. data can be bytes
+        (decoded as ISO-8859-1) or text and may start or end anywhere,
+        including in the middle of a line. The pieces are parsed as they
+        arrive, but the rules in effect don't change until close() is
+        called. Data beyond max_filesize bytes is ignored.
+        """
+        if self._stream is None:
+            self._stream = _RulesBuilder(limit=self.max_filesize)
+        self._stream.feed(data)
+
+    def close(self):
+        """Finishes parsing the pieces passed to feed() and replaces the
+        current rules with the result. Raises UnicodeError if the pieces
+        couldn't be decoded, in which case the current rules are kept.
+        """
+        builder = self._stream or _RulesBuilder()
+        self._stream = None
+        self._use_rules(builder)
+
+    def parse_file(self, f, encoding="iso-8859-1"):
+        """Parses a robots.txt file from the file-like object f which may be
+        opened in binary mode (in which case its content is decoded with
+        the encoding passed) or text mode. The file is read and parsed in
+        pieces so memory use doesn't depend on its size, and reading stops
+        at max_filesize.
+        """
+        builder = _RulesBuilder(encoding, self.max_filesize)
+        while not builder.full:
+            size = 16 * 1024
+            if builder.limit is not None:
+                size = min(size, builder.limit - builder.size)
+            data = f.read(size)
+            if not data:
+                break
+            builder.feed(data)
+
+        self._use_rules(builder)
+
+    def _use_rules(self, builder):
+        """Replaces the current rules with the ones from a _RulesBuilder."""
+        rulesets, sitemaps = builder.close()
+        self._sitemaps = tuple(sitemaps)
+        self._set_rulesets(rulesets)
+        if self.minimize_rules:
+            self.minimize()
+        self._has_good_rules = True
+        # The validators describe the rules being replaced.
+        self._etag = None
+        self._last_modified = None
+
+    def minimize(self):
+        """Removes the rules that can't change the answer to any question,
+        e.g. duplicates and the rules after "Disallow: /" that it already
+        covers. The answers are the same as before under both MK1996 and
+        GYM2008, but there are fewer rules to keep in memory and compare
+        URLs against. Setting minimize_rules does this for every robots.txt
+        parsed.
+
+        Returns the number of rules removed; eliminated_rules holds the
+        total for the current rules.
+        """
+        count = 0
+        rulesets = []
+        for ruleset in self.__rulesets:
+            rules = ruleset.rules
+            kept = _minimize_rules(rules)
+            if len(kept) < len(rules):
+                count += len(rules) - len(kept)
+                # The ruleset may be shared (see RulesInterner), so it's
+                # replaced rather than changed.
+                minimized = _Ruleset()
+                minimized.robot_names = list(ruleset.robot_names)
+                minimized.crawl_delay = ruleset.crawl_delay
+                minimized.rules = kept
+                ruleset = minimized
+            rulesets.append(ruleset)
+
+        if count:
+            total = self._eliminated_rules + count
+            self._set_rulesets(rulesets)
+            self._eliminated_rules = total
+
+        return count
+
+    def _set_rulesets(self, rulesets):
+        """Replaces my rulesets and notes whether they're trivial."""
+        for ruleset in rulesets:
+            ruleset.freeze()
+        self.__rulesets = rulesets
+        self._trivial_policy = _find_trivial_policy(rulesets)
+        self._eliminated_rules = 0
+        self._intern_rules()
+        self._version += 1
+
+    def _intern_rules(self):
+        """Replaces my rules with shared ones if I have an interner (or if
+        they're trivial).
+        """
+        interner = self.interner
+        if (interner is None) and (self._trivial_policy is not None):
+            interner = _trivial_rules_interner
+        if interner is not None:
+            self.__rulesets = interner.intern(self.__rulesets)
+
+    def to_bytes(self):
+        """Returns the parsed rules and the details of the fetch that
+        provided them (source URL, response code, expiration date and
+        validators) in a compact binary format that from_bytes() can load
+        much faster than the robots.txt can be parsed. Unlike a pickle, it's
+        safe to load from an untrusted source.
+        """
+        flags = 0
+        if self.use_local_time:
+            flags |= _SERIALIZED_USE_LOCAL_TIME
+        if self._has_good_rules:
+            flags |= _SERIALIZED_HAS_GOOD_RULES
+        strings = [self._source_url]
+        if self._etag is not None:
+            flags |= _SERIALIZED_ETAG
+            strings.append(self._etag)
+        if self._last_modified is not None:
+            flags |= _SERIALIZED_LAST_MODIFIED
+            strings.append(self._last_modified)
+        strings += self._sitemaps
+
+        counts = []
+        crawl_delays = []
+        rule_types = bytearray()
+        for ruleset in self.__rulesets:
+            counts += [len(ruleset.robot_names), len(ruleset.rules)]
+            crawl_delays.append(ruleset.crawl_delay)
+            strings += ruleset.robot_names
+            for rule_type, path in ruleset.rules:
+                rule_types.append(rule_type)
+                strings.append(path)
+
+        count = len(strings)
+        strings = "\n".join(strings)
+        if strings.count("\n") != count - 1:
+            raise ValueError("Strings in a robots.txt parser can't contain newlines")
+        strings = strings.encode("utf-8")
+        header = _serialization_header.pack(_SERIALIZATION_MAGIC, SERIALIZATION_VERSION, flags,
+                                            self.expiration_date, self._response_code,
+                                            len(self._sitemaps), len(self.__rulesets),
+                                            len(rule_types), len(strings))
+        n = len(crawl_delays)
+
+        return b"".join([header,
+                         struct.pack("<%dI" % len(counts), *counts),
+                         bytes(bytearray([delay is not None for delay in crawl_delays])),
+                         struct.pack("<%dd" % n, *[delay or 0 for delay in crawl_delays]),
+                         bytes(rule_types),
+                         strings])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Returns a new parser with the rules and fetch details saved by
+        to_bytes(). Raises ValueError if data isn't in a format that this
+        version of the module understands.
+
+        The rules are compiled when they're first used rather than here.
+        """
+        try:
+            magic, version, flags, expiration_date, response_code, sitemap_count, \
+                ruleset_count, rule_count, strings_size = _serialization_header.unpack_from(data)
+            if magic != _SERIALIZATION_MAGIC:
+                raise ValueError("Not a serialized robots.txt parser")
+            if version != SERIALIZATION_VERSION:
+                raise ValueError("Unsupported serialization version %d" % version)
+
+            offset = _serialization_header.size
+            counts = struct.unpack_from("<%dI" % (2 * ruleset_count), data, offset)
+            offset += 8 * ruleset_count
+            has_crawl_delays = bytearray(data[offset:offset + ruleset_count])
+            offset += ruleset_count
+            crawl_delays = struct.unpack_from("<%dd" % ruleset_count, data, offset)
+            offset += 8 * ruleset_count
+            rule_types = bytearray(data[offset:offset + rule_count])
+            offset += rule_count
+            if len(data) != offset + strings_size:
+                raise ValueError("Serialized robots.txt parser is truncated or corrupt")
+            strings = data[offset:].decode("utf-8").split("\n")
+        except (struct.error, UnicodeError):
+            raise ValueError("Serialized robots.txt parser is truncated or corrupt")
+
+        has_etag = bool(flags & _SERIALIZED_ETAG)
+        has_last_modified = bool(flags & _SERIALIZED_LAST_MODIFIED)
+        string_count = 1 + has_etag + has_last_modified + sitemap_count + sum(counts)
+        if (len(strings) != string_count) or (len(rule_types) != rule_count) or \
+           rule_types.translate(None, b"\x01\x02"):
+            raise ValueError("Serialized robots.txt parser is truncated or corrupt")
+
+        i = 1
+        source_url = strings[0]
+        etag = last_modified = None
+        if has_etag:
+            etag = strings[i]
+            i += 1
+        if has_last_modified:
+            last_modified = strings[i]
+            i += 1
+        sitemaps = strings[i:i + sitemap_count]
+        i += sitemap_count
+
+        rulesets = []
+        j = 0
+        for k in range(ruleset_count):
+            name_count, rule_count = counts[2 * k], counts[(2 * k) + 1]
+            ruleset = _Ruleset()
+            ruleset.robot_names = strings[i:i + name_count]
+            i += name_count
+            ruleset.rules = list(zip(rule_types[j:j + rule_count], strings[i:i + rule_count]))
+            i += rule_count
+            j += rule_count
+            if has_crawl_delays[k]:
+                ruleset.crawl_delay = crawl_delays[k]
+            rulesets.append(ruleset)
+
+        return cls()._restore(source_url, response_code, expiration_date,
+                              bool(flags & _SERIALIZED_USE_LOCAL_TIME),
+                              bool(flags & _SERIALIZED_HAS_GOOD_RULES), etag, last_modified,
+                              sitemaps, rulesets)
+
+    def to_json(self):
+        """Returns the same information as to_bytes() as a JSON string."""
+        rule_names = {_Ruleset.ALLOW: "allow", _Ruleset.DISALLOW: "disallow"}
+        d = {"version": SERIALIZATION_VERSION,
+             "source_url": self._source_url,
+             "response_code": self._response_code,
+             "expiration_date": self.expiration_date,
+             "use_local_time": self.use_local_time,
+             "has_good_rules": self._has_good_rules,
+             "etag": self._etag,
+             "last_modified": self._last_modified,
+             "sitemaps": list(self._sitemaps),
+             "rulesets": [{"user_agents": ruleset.robot_names,
+                           "crawl_delay": ruleset.crawl_delay,
+                           "rules": [[rule_names[rule_type], path]
+                                     for rule_type, path in ruleset.rules]}
+                          for ruleset in self.__rulesets],
+             }
+
+        return json.dumps(d, separators=(",", ":"), sort_keys=True)
+
+    @classmethod
+    def from_json(cls, s):
+        """Returns a new parser with the rules and fetch details saved by
+        to_json(). Raises ValueError if s isn't in a format that this
+        version of the module understands.
+        """
+        rule_types = {"allow": _Ruleset.ALLOW, "disallow": _Ruleset.DISALLOW}
+        # json.loads() raises ValueError for invalid JSON.
+        d = json.loads(s)
+        try:
+            if d["version"] != SERIALIZATION_VERSION:
+                raise ValueError("Unsupported serialization version %s" % d["version"])
+            rulesets = []
+            for item in d["rulesets"]:
+                ruleset = _Ruleset()
+                ruleset.robot_names = list(item["user_agents"])
+                ruleset.crawl_delay = item["crawl_delay"]
+                ruleset.rules = [(rule_types[rule_type], path) for rule_type, path in item["rules"]]
+                rulesets.append(ruleset)
+
+            return cls()._restore(d["source_url"], d["response_code"], d["expiration_date"],
+                                  d["use_local_time"], d["has_good_rules"], d["etag"],
+                                  d["last_modified"], list(d["sitemaps"]), rulesets)
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError("Not a serialized robots.txt parser")
+
+    def _snapshot_record(self):
+        """Returns my rules in the format of a host in a snapshot, minus the
+        origin key. See write_snapshot().
+        """
+        parts = [_snapshot_host.pack(self.expiration_date, len(self.__rulesets))]
+        for ruleset in self.__rulesets:
+            names = "\n".join([name.lower() for name in ruleset.robot_names]).encode("utf-8")
+            flags = bytearray()
+            paths = []
+            for rule_type, path in ruleset.rules:
+                flag = _SNAPSHOT_ALLOW if (rule_type == _Ruleset.ALLOW) else 0
+                if _is_wildcard_path(path):
+                    flag |= _SNAPSHOT_WILDCARD
+                flags.append(flag)
+                paths.append(path.encode("utf-8"))
+            body = b"".join([names, bytes(flags),
+                             struct.pack("<%dI" % len(paths), *[len(path) for path in paths])] +
+                            paths)
+            parts.append(_snapshot_ruleset.pack(_snapshot_ruleset.size + len(body), len(paths),
+                                                len(names), ruleset.crawl_delay is not None,
+                                                ruleset.crawl_delay or 0))
+            parts.append(body)
+
+        return b"".join(parts)
+
+    def _restore(self, source_url, response_code, expiration_date, use_local_time,
+                 has_good_rules, etag, last_modified, sitemaps, rulesets):
+        """Sets my rules and fetch details from a serialized parser and
+        returns self.
+        """
+        self._source_url = source_url
+        self._response_code = response_code
+        self.expiration_date = expiration_date
+        self.use_local_time = use_local_time
+        self._has_good_rules = has_good_rules
+        self._etag = etag
+        self._last_modified = last_modified
+        self._sitemaps = tuple(sitemaps)
+        self._set_rulesets(rulesets)
+
+        return self
+
+    def __getstate__(self):
+        # This gathers my attributes for pickle and copy because I don't have
+        # a __dict__ (though a subclass might).
+        state = dict(getattr(self, "__dict__", {}))
+        for name in RobotExclusionRulesParser.__slots__:
+            if name.startswith("__"):
+                if name == "__weakref__":
+                    continue
+                name = "_RobotExclusionRulesParser" + name
+            state[name] = getattr(self, name)
+
+        return state
+
+    def __setstate__(self, state):
+        # Pickles made by older versions of this module may lack attributes
+        # that were added later, so they start with the default values.
+        RobotExclusionRulesParser.__init__(self)
+        for name, value in state.items():
+            setattr(self, name, value)
+        if "_trivial_policy" not in state:
+            self._trivial_policy = _find_trivial_policy(self.__rulesets)
+
+    def __str__(self):
+        s = self.__unicode__()
+        if PY_MAJOR_VERSION == 2:
+            s = s.encode("utf-8")
+
+        return s
+
+    def __unicode__(self):
+        if self._sitemaps:
+            s = "Sitemaps: %s\n\n" % list(self._sitemaps)
+        else:
+            s = ""
+        if PY_MAJOR_VERSION < 3:
+            s = unicode(s)  # noqa
+        # I also need to string-ify each ruleset. The function for doing so
+        # varies under Python 2/3.
+        stringify = (unicode if (PY_MAJOR_VERSION == 2) else str)  # noqa
+        return s + '\n'.join([stringify(ruleset) for ruleset in self.__rulesets])
+
+
+class BackoffError(urllib_error.URLError):
+    """Raised by fetch() (without contacting the server) when a previous
+    attempt to fetch the same robots.txt failed and the backoff period
+    hasn't ended. The backoff_remaining attribute is the number of seconds
+    until it does.
+    """
+    def __init__(self, backoff_remaining):
+        urllib_error.URLError.__init__(self, "Fetching this robots.txt failed; retry in %d "
+                                             "seconds" % backoff_remaining)
+        self.backoff_remaining = backoff_remaining
+
+
+class _SingleFlight(object):
+    """Collapses concurrent calls that have the same key into one call.
+
+    The first thread to call do() with a given key runs the function. Other
+    threads that call do() with that key while it's running wait for it to
+    finish and then get the same result (or exception).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # _flights maps each key to [event, result, exception] for the call
+        # that's in progress.
+        self._flights = {}
+
+    def do(self, key, function):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = (flight is None)
+            if leader:
+                flight = [threading.Event(), None, None]
+                self._flights[key] = flight
+
+        if leader:
+            try:
+                flight[1] = function()
+            except Exception:
+                flight[2] = sys.exc_info()[1]
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight[0].set()
+        else:
+            flight[0].wait()
+
+        if flight[2] is not None:
+            raise flight[2]
+
+        return flight[1]
+
+
+def _canonical_origin(url):
+    """Returns a (scheme, host, port) tuple that identifies the origin of the
+    URL. The scheme and host are lower case, the host is IDNA encoded and the
+    port is always present, so equivalent URLs give equal tuples. Raises
+    ValueError if the URL isn't an absolute http(s) URL.
+    """
+    parts = urllib_urlparse(url)
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS:
+        raise ValueError("URL must be an absolute http or https URL")
+
+    # hostname is already lower case and stripped of IPv6 brackets.
+    host = parts.hostname
+    if not host:
+        raise ValueError("URL must include a host name")
+    if (PY_MAJOR_VERSION < 3) and (not isinstance(host, unicode)):  # noqa
+        host = host.decode("utf-8")
+    # A trailing dot names the same host ("example.com." is fully qualified).
+    host = host.rstrip(".")
+    if ":" not in host:
+        try:
+            host = host.encode("idna").decode("ascii")
+        except UnicodeError:
+            raise ValueError("Invalid host name")
+
+    # Under Python 3.6+, this raises ValueError for ports that are out of range.
+    port = parts.port or _DEFAULT_PORTS[scheme]
+
+    return scheme, host, port
+
+
+def _robots_txt_url(origin):
+    """Returns the URL of the robots.txt for the (scheme, host, port) origin."""
+    scheme, host, port = origin
+    if ":" in host:
+        host = "[%s]" % host
+    if port != _DEFAULT_PORTS[scheme]:
+        host = "%s:%d" % (host, port)
+
+    return "%s://%s/robots.txt" % (scheme, host)
+
+
+class RobotsRegistry(object):
+    """A cache of robots.txt files for many hosts.
+
+    The registry maps each origin (scheme, host and port) to a
+    RobotExclusionRulesParser. It fetches a host's robots.txt the first time
+    it's asked about that host and again once the parser is_expired. When the
+    registry holds more than max_entries parsers or their estimated size
+    exceeds max_bytes, it discards the least recently used ones.
+
+    If the server sent Cache-Control: stale-while-revalidate, an expired
+    parser is returned for that long while a background thread fetches a
+    fresh copy.
+
+    If store is a SQLiteRobotsStore (or anything with the same get() and
+    put() methods), the registry looks there before fetching a robots.txt
+    that it doesn't have, and saves everything it fetches there. Stored
+    parsers that have expired are revalidated rather than fetched from
+    scratch. A store lets the registry survive restarts and be shared by
+    many processes.
+
+    If interner is a RulesInterner, parsers of identical robots.txt files
+    share their rules, which saves a lot of memory when many hosts serve the
+    same file.
+
+    The registry is safe to use from multiple threads. Fetches happen
+    outside of its lock, so a slow host doesn't hold up queries about other
+    hosts.
+    """
+    def __init__(self, user_agent=None, max_entries=None, max_bytes=None, timeout=None,
+                 parser_factory=RobotExclusionRulesParser, transport=None, store=None,
+                 interner=None):
+        # user_agent is sent in the User-Agent header when fetching.
+        self.user_agent = user_agent
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # timeout and transport are passed to RobotExclusionRulesParser.fetch().
+        self.timeout = timeout
+        self.transport = transport
+        # parser_factory is called with no arguments to create each parser.
+        self.parser_factory = parser_factory
+        self.store = store
+        # If this is a RulesInterner, it's given to every parser.
+        self.interner = interner
+        self._lock = threading.Lock()
+        # Concurrent fetches of the same origin share one download.
+        self._single_flight = _SingleFlight()
+        # _refreshing is the set of origins being refreshed in the background.
+        self._refreshing = set()
+        # _entries maps origins to (parser, estimated size) tuples in least to
+        # most recently used order.
+        self._entries = collections.OrderedDict()
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def hits(self):
+        """The number of lookups answered from the cache. Read only."""
+        return self._hits
+
+    @property
+    def misses(self):
+        """The number of lookups that required a fetch, including refetches
+        of expired entries. Read only.
+        """
+        return self._misses
+
+    @property
+    def evictions(self):
+        """The number of parsers discarded to stay within max_entries or
+        max_bytes. Read only.
+        """
+        return self._evictions
+
+    @property
+    def total_bytes(self):
+        """The estimated size of all of the cached parsers. Read only."""
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, url):
+        return _canonical_origin(url) in self._entries
+
+    def get(self, url):
+        """Returns the parser for the robots.txt that applies to the URL,
+        fetching the robots.txt if necessary. The URL must be absolute.
+
+        When a fetch fails and the parser starts backing off (see
+        RobotExclusionRulesParser.fetch()), the parser and its fallback rules
+        are returned and cached until the backoff period ends. Other errors
+        are passed up to the caller. If several threads ask about the same
+        origin at once, only one fetches it and the others wait.
+        """
+        origin = _canonical_origin(url)
+
+        stale = False
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(origin)
+            if entry and not entry[0].is_expired:
+                self._hits += 1
+                self._touch(origin, entry)
+                return entry[0]
+            if entry and entry[0].is_usable_while_revalidating:
+                # The server permits using the expired copy while I fetch a
+                # fresh one in the background.
+                stale = True
+                self._hits += 1
+                self._touch(origin, entry)
+                refresh = (origin not in self._refreshing)
+                if refresh:
+                    self._refreshing.add(origin)
+            elif entry or (self.store is None):
+                self._misses += 1
+
+        previous = entry[0] if entry else None
+
+        if (entry is None) and (self.store is not None):
+            # Another process (or this one, before a restart) may have
+            # fetched it already.
+            previous = self.store.get(url)
+            if previous and self.user_agent:
+                previous.user_agent = self.user_agent
+            if previous and (self.interner is not None):
+                previous.interner = self.interner
+                previous._intern_rules()
+            if previous and not previous.is_expired:
+                with self._lock:
+                    self._hits += 1
+                self.add(url, previous)
+                return previous
+            with self._lock:
+                self._misses += 1
+
+        if refresh:
+            thread = threading.Thread(target=self._refresh, args=(url, origin, previous))
+            thread.daemon = True
+            thread.start()
+        if stale:
+            return previous
+
+        return self._single_flight.do(origin, lambda: self._fetch(url, origin, previous))
+
+    def _refresh(self, url, origin, previous):
+        # Runs in a background thread to replace a parser that is in its
+        # stale-while-revalidate period.
+        try:
+            self._single_flight.do(origin, lambda: self._fetch(url, origin, previous))
+        except Exception:
+            # The stale copy remains in use until stale-while-revalidate runs
+            # out. After that, get() fetches in the foreground and the caller
+            # sees the error.
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(origin)
+
+    def _fetch(self, url, origin, previous):
+        if previous:
+            # Refetching a copy of the expired parser lets fetch() revalidate
+            # it (and keep its rules if they haven't changed) without
+            # disturbing threads that are still using the original.
+            parser = copy.copy(previous)
+        else:
+            parser = self.parser_factory()
+            if self.user_agent:
+                parser.user_agent = self.user_agent
+            if self.interner is not None:
+                parser.interner = self.interner
+        try:
+            parser.fetch(_robots_txt_url(origin), self.timeout, self.transport)
+        except (urllib_error.URLError, socket.error):
+            if not parser.backoff_remaining:
+                raise
+            # The parser is backing off and its rules are the fallback. I
+            # cache it so that lookups don't retry the fetch until the
+            # backoff period ends.
+
+        self.add(url, parser)
+        if self.store is not None:
+            self.store.put(url, parser)
+
+        return parser
+
+    def add(self, url, parser):
+        """Stores the parser as the robots.txt for the URL's origin,
+        replacing any parser already there.
+        """
+        origin = _canonical_origin(url)
+        size = parser._estimated_size()
+
+        with self._lock:
+            self._discard(origin)
+            self._entries[origin] = (parser, size)
+            self._total_bytes += size
+            self._evict()
+
+    def backoff_remaining(self, url):
+        """Returns the number of seconds until the registry will try again to
+        fetch the robots.txt for the URL's origin after a failure, or 0 if
+        it's not backing off. This never fetches anything.
+        """
+        origin = _canonical_origin(url)
+
+        with self._lock:
+            entry = self._entries.get(origin)
+
+        return entry[0].backoff_remaining if entry else 0
+
+    def discard(self, url):
+        """Removes the URL's origin from the registry if it's present."""
+        origin = _canonical_origin(url)
+
+        with self._lock:
+            self._discard(origin)
+
+    def clear(self):
+        """Removes everything from the registry. The counters are unchanged."""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def is_allowed(self, user_agent, url, syntax=GYM2008):
+        """True if the user agent is permitted to visit the URL according to
+        the robots.txt for the URL's origin.
+        """
+        return self.get(url).is_allowed(user_agent, url, syntax)
+
+    def is_subtree_allowed(self, user_agent, url, syntax=GYM2008):
+        """Returns one of the SUBTREE_* constants for the URLs that start with
+        the URL according to the robots.txt for its origin. See
+        RobotExclusionRulesParser.is_subtree_allowed().
+        """
+        return self.get(url).is_subtree_allowed(user_agent, url, syntax)
+
+    def get_crawl_delay(self, user_agent, url):
+        """Returns the crawl delay that the robots.txt for the URL's origin
+        specifies for this user agent. See
+        RobotExclusionRulesParser.get_crawl_delay().
+        """
+        return self.get(url).get_crawl_delay(user_agent)
+
+    def _touch(self, origin, entry):
+        # Marks the entry as the most recently used. Python 2's OrderedDict
+        # doesn't have move_to_end().
+        if PY_MAJOR_VERSION < 3:
+            del self._entries[origin]
+            self._entries[origin] = entry
+        else:
+            self._entries.move_to_end(origin)
+
+    def _discard(self, origin):
+        entry = self._entries.pop(origin, None)
+        if entry:
+            self._total_bytes -= entry[1]
+
+    def _over_budget(self):
+        if (self.max_entries is not None) and (len(self._entries) > self.max_entries):
+            return True
+
+        return (self.max_bytes is not None) and (self._total_bytes > self.max_bytes)
+
+    def _evict(self):
+        # Discards least recently used entries until the registry is within
+        # its limits. The most recently added entry is never discarded, even
+        # if it alone exceeds max_bytes.
+        while (len(self._entries) > 1) and self._over_budget():
+            _, (_, size) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._evictions += 1
+
+
+def _origin_key(url):
+    """Returns a string that identifies the URL's origin, e.g.
+    'http://example.com:80'. Snapshots and stores are keyed by it.
+    """
+    return "%s://%s:%d" % _canonical_origin(url)
+
+
+def _snapshot_slot(key, slot_count):
+    """Returns the hash table slot where the search for key begins."""
+    return (zlib.crc32(key) & 0xffffffff) % slot_count
+
+
+def write_snapshot(path, parsers):
+    """Writes the rules of many parsers to a snapshot file that
+    RobotsSnapshot can answer questions from without loading it. parsers is
+    an iterable of (url, parser) tuples where the URL identifies the origin
+    (scheme, host and port) that the parser's rules are for, e.g. a
+    dict's items() or [(parser.source_url, parser) for parser in parsers].
+    If an origin appears more than once, the last parser wins.
+
+    The file is written under a temporary name and then renamed, so readers
+    that have the old file open keep seeing the old rules and new readers
+    never see a partially written file.
+    """
+    records = collections.OrderedDict()
+    for url, parser in parsers:
+        records[_origin_key(url).encode("ascii")] = parser._snapshot_record()
+
+    # The table is at most half full so that probe sequences stay short.
+    slot_count = max(2 * len(records), 1)
+    slots = [0] * slot_count
+    blobs = []
+    offset = _snapshot_header.size + (_snapshot_offset.size * slot_count)
+    for key, record in records.items():
+        slot = _snapshot_slot(key, slot_count)
+        while slots[slot]:
+            slot = (slot + 1) % slot_count
+        slots[slot] = offset
+        blob = _snapshot_length.pack(len(key)) + key + record
+        blobs.append(blob)
+        offset += len(blob)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_snapshot_header.pack(_SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(records),
+                                          slot_count))
+            f.write(struct.pack("<%dQ" % slot_count, *slots))
+            for blob in blobs:
+                f.write(blob)
+        os.chmod(temp_path, 0o644)
+        # On POSIX, rename() atomically replaces the old file.
+        if PY_MAJOR_VERSION < 3:
+            os.rename(temp_path, path)
+        else:
+            os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+class RobotsSnapshot(object):
+    """Read-only access to the rules in a file written by write_snapshot().
+
+    The file is memory mapped and questions are answered directly from the
+    mapped bytes, so opening a snapshot costs the same regardless of its
+    size and processes that open the same file share one copy of it in
+    memory (via the operating system's page cache).
+
+    The answers are the same as the answers of the parsers that were
+    written to the snapshot. Each query scans the rules of one host in
+    order until one matches, so it's not as fast as a parser for hosts with
+    many rules. The user agent names of the most recently queried hosts
+    (up to cached_hosts of them) are kept in memory.
+
+    Raises ValueError if the file isn't a snapshot in a format that this
+    version of the module understands.
+    """
+    def __init__(self, path, cached_hosts=1000):
+        self.cached_hosts = cached_hosts
+        # This maps the offsets of host records to the decoded headers and
+        # names of their rulesets. See _rulesets().
+        self._rulesets_cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self._count, self._slot_count = \
+                _snapshot_header.unpack_from(self._map)
+        except struct.error:
+            magic = version = None
+        if magic != _SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError("Not a robots.txt snapshot")
+        if version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError("Unsupported snapshot version %d" % version)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, url):
+        return self._find(url) is not None
+
+    def close(self):
+        """Unmaps the file. The snapshot can't be used afterwards."""
+        self._map.close()
+
+    def is_allowed(self, user_agent, url, syntax=GYM2008):
+        """True if the user agent is permitted to visit the URL according to
+        the rules for the URL's origin. The URL must be absolute. Raises
+        KeyError if the snapshot doesn't have rules for the origin.
+        """
+        if syntax not in (MK1996, GYM2008):
+            raise ValueError("Syntax must be MK1996 or GYM2008")
+
+        offset, header = self._find_ruleset(user_agent, url)
+        if offset is None:
+            return True
+
+        # See RobotExclusionRulesParser.is_allowed() comment about the
+        # explicit unicode conversion.
+        if (PY_MAJOR_VERSION < 3) and (not isinstance(url, unicode)):  # noqa
+            url = url.decode()
+        url = _normalize_url(url)
+        encoded_url = url.encode("utf-8")
+
+        # The rules are read from the map a few at a time so that a query
+        # doesn't copy all of a host's rules when an early one matches.
+        m = self._map
+        rule_count = header[1]
+        flags_offset = offset + _snapshot_ruleset.size + header[2]
+        lengths_offset = flags_offset + rule_count
+        start = lengths_offset + (4 * rule_count)
+        for i in range(0, rule_count, _SNAPSHOT_RULES_PER_READ):
+            count = min(_SNAPSHOT_RULES_PER_READ, rule_count - i)
+            flags = bytearray(m[flags_offset + i:flags_offset + i + count])
+            lengths = struct.unpack_from("<%dI" % count, m, lengths_offset + (4 * i))
+            paths = m[start:start + sum(lengths)]
+            start += len(paths)
+            path_start = 0
+            for flag, length in zip(flags, lengths):
+                path_end = path_start + length
+                if (flag & _SNAPSHOT_WILDCARD) and (syntax == GYM2008):
+                    segments, anchored = \
+                        _wildcard_segments(paths[path_start:path_end].decode("utf-8"))
+                    if _glob_match(segments, anchored, url):
+                        return bool(flag & _SNAPSHOT_ALLOW)
+                elif encoded_url[:length] == paths[path_start:path_end]:
+                    # A blank path means "nothing", so that effectively negates
+                    # the rule type. e.g. "Disallow:   " means allow everything
+                    return bool(flag & _SNAPSHOT_ALLOW) == bool(length)
+                path_start = path_end
+
+        return True
+
+    def get_crawl_delay(self, user_agent, url):
+        """Returns the crawl delay for the user agent from the rules for the
+        URL's origin, or None. Raises KeyError if the snapshot doesn't have
+        rules for the origin.
+        """
+        offset, header = self._find_ruleset(user_agent, url)
+        if (offset is None) or (not header[3]):
+            return None
+
+        return header[4]
+
+    def get_expiration_date(self, url):
+        """Returns the expiration date of the rules for the URL's origin.
+        Raises KeyError if the snapshot doesn't have rules for the origin.
+        """
+        offset = self._find(url)
+        if offset is None:
+            raise KeyError(url)
+
+        return _snapshot_host.unpack_from(self._map, offset)[0]
+
+    def _find(self, url):
+        """Returns the offset of the host record for the URL's origin (just
+        past its key) or None.
+        """
+        key = _origin_key(url).encode("ascii")
+        m = self._map
+        if not self._count:
+            return None
+        slot = _snapshot_slot(key, self._slot_count)
+        while True:
+            offset = _snapshot_offset.unpack_from(m, _snapshot_header.size +
+                                                  (slot * _snapshot_offset.size))[0]
+            if not offset:
+                return None
+            length = _snapshot_length.unpack_from(m, offset)[0]
+            offset += _snapshot_length.size
+            if m[offset:offset + length] == key:
+                return offset + length
+            slot = (slot + 1) % self._slot_count
+
+    def _find_ruleset(self, user_agent, url):
+        """Returns a tuple of (offset, header) for the ruleset that applies to
+        the user agent where header is the unpacked ruleset header, or
+        (None, None) if no ruleset applies.
+        """
+        offset = self._find(url)
+        if offset is None:
+            raise KeyError(url)
+
+        if (PY_MAJOR_VERSION < 3) and (not isinstance(user_agent, unicode)):  # noqa
+            user_agent = user_agent.decode()
+        # Names are stored in lower case.
+        user_agent = user_agent.lower().encode("utf-8")
+
+        for ruleset_offset, header, names in self._rulesets(offset):
+            # See _Ruleset.does_user_agent_match().
+            for name in names:
+                if (name == b"*") or (name in user_agent):
+                    return ruleset_offset, header
+
+        return None, None
+
+    def _rulesets(self, offset):
+        """Returns a tuple of (offset, header, names) for each ruleset of the
+        host record at offset, where header is the unpacked ruleset header
+        and names is a tuple of the ruleset's (encoded) user agent names.
+        """
+        with self._lock:
+            rulesets = self._rulesets_cache.get(offset)
+            if rulesets is not None:
+                # Python 2's OrderedDict doesn't have move_to_end().
+                if PY_MAJOR_VERSION < 3:
+                    del self._rulesets_cache[offset]
+                    self._rulesets_cache[offset] = rulesets
+                else:
+                    self._rulesets_cache.move_to_end(offset)
+                return rulesets
+
+        m = self._map
+        ruleset_count = _snapshot_host.unpack_from(m, offset)[1]
+        ruleset_offset = offset + _snapshot_host.size
+        rulesets = []
+        for _ in range(ruleset_count):
+            header = _snapshot_ruleset.unpack_from(m, ruleset_offset)
+            start = ruleset_offset + _snapshot_ruleset.size
+            names = tuple(m[start:start + header[2]].split(b"\n"))
+            rulesets.append((ruleset_offset, header, names))
+            ruleset_offset += header[0]
+        rulesets = tuple(rulesets)
+
+        with self._lock:
+            self._rulesets_cache[offset] = rulesets
+            while len(self._rulesets_cache) > max(self.cached_hosts, 0):
+                self._rulesets_cache.popitem(last=False)
+
+        return rulesets
+
+
+class SQLiteRobotsStore(object):
+    """A persistent store of parsers in an SQLite database, keyed by origin
+    (scheme, host and port). Give one to a RobotsRegistry so that the
+    robots.txt files it fetches survive restarts.
+
+    The database uses write-ahead logging (WAL), so any number of processes
+    can use the same file at once; readers don't block the writer and vice
+    versa. timeout is the number of seconds to wait for another process's
+    write to finish. An instance is safe to share among threads.
+
+    The rules are stored in the to_bytes() format alongside columns for the
+    response code, expiration date and validators. The expiration date is
+    indexed so that expiring_within() is fast. parser_class is the class
+    whose from_bytes() loads parsers.
+
+    Requires the sqlite3 module, which some Python builds omit.
+    """
+    # This is stored in the database's user_version. Bump it when the schema
+    # changes.
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path, timeout=30, parser_class=RobotExclusionRulesParser):
+        if sqlite3 is None:
+            raise NotImplementedError("SQLiteRobotsStore requires the sqlite3 module")
+
+        self.parser_class = parser_class
+        self._lock = threading.Lock()
+        # isolation_level=None means that I manage transactions myself.
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode, NORMAL is durable except against power loss, which
+        # costs no more than refetching some robots.txt files.
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction() as cursor:
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                cursor.execute("""CREATE TABLE IF NOT EXISTS robots (
+                                      origin TEXT PRIMARY KEY,
+                                      url TEXT NOT NULL,
+                                      rules BLOB NOT NULL,
+                                      response_code INTEGER NOT NULL,
+                                      expiration_date REAL NOT NULL,
+                                      etag TEXT,
+                                      last_modified TEXT)""")
+                cursor.execute("""CREATE INDEX IF NOT EXISTS robots_expiration_date
+                                  ON robots (expiration_date)""")
+                cursor.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+            elif version != self.SCHEMA_VERSION:
+                self.close()
+                raise ValueError("Unsupported store schema version %d" % version)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM robots").fetchone()[0]
+
+    def __contains__(self, url):
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM robots WHERE origin = ?",
+                                           (_origin_key(url), )).fetchone()
+
+        return row is not None
+
+    def close(self):
+        """Closes the database. The store can't be used afterwards."""
+        with self._lock:
+            self._connection.close()
+
+    def get(self, url):
+        """Returns a new parser for the URL's origin, or None if the store
+        doesn't have one. The parser may have expired.
+        """
+        return self.get_many([url]).get(url)
+
+    def get_many(self, urls):
+        """Returns a dict that maps each of the URLs to a new parser for its
+        origin. URLs with the same origin share a parser. URLs whose origins
+        aren't in the store are left out.
+        """
+        origins = {}
+        for url in urls:
+            origins.setdefault(_origin_key(url), []).append(url)
+
+        keys = list(origins)
+        rows = []
+        with self._lock:
+            # SQLite limits the number of parameters in a statement.
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                sql = "SELECT origin, rules FROM robots WHERE origin IN (%s)" % \
+                      ",".join("?" * len(chunk))
+                rows += self._connection.execute(sql, chunk).fetchall()
+
+        parsers = {}
+        for origin, rules in rows:
+            parser = self.parser_class.from_bytes(bytes(rules))
+            for url in origins[origin]:
+                parsers[url] = parser
+
+        return parsers
+
+    def put(self, url, parser):
+        """Stores the parser as the robots.txt for the URL's origin,
+        replacing any parser already there.
+        """
+        self.put_many([(url, parser)])
+
+    def put_many(self, items):
+        """Stores parsers from an iterable of (url, parser) tuples in a
+        single transaction. This is much faster than calling put() for each.
+        """
+        rows = []
+        for url, parser in items:
+            origin = _origin_key(url)
+            rows.append((origin, _robots_txt_url(_canonical_origin(url)),
+                         sqlite3.Binary(parser.to_bytes()), parser.response_code,
+                         parser.expiration_date, parser.etag, parser.last_modified))
+
+        with self._transaction() as cursor:
+            cursor.executemany("INSERT OR REPLACE INTO robots VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete(self, url):
+        """Removes the URL's origin from the store if it's present."""
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM robots WHERE origin = ?", (_origin_key(url), ))
+
+    def expiring_within(self, seconds, limit=None):
+        """Returns a list of (robots.txt URL, expiration date) tuples for the
+        parsers that expire within the number of seconds given (including
+        those that have already expired), soonest first. limit caps the
+        length of the list.
+        """
+        sql = "SELECT url, expiration_date FROM robots WHERE expiration_date < ? " \
+              "ORDER BY expiration_date"
+        parameters = (time.time() + seconds, )
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters += (limit, )
+        with self._lock:
+            return [tuple(row) for row in self._connection.execute(sql, parameters).fetchall()]
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so that two
+        # processes can't both read and then fail to upgrade to writing.
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            else:
+                cursor.execute("COMMIT")
+
+
+# fetch_many() uses this so that simultaneous calls share downloads.
+_fetch_many_single_flight = _SingleFlight()
+
+
+def fetch_many(urls, max_workers=8, timeout=None, user_agent=None,
+               parser_factory=RobotExclusionRulesParser, transport=None):
+    """Fetches many robots.txt files concurrently using a pool of up to
+    max_workers threads. This is a generator that yields a
+    (url, parser, exception) tuple for each of the URLs as the fetches
+    complete, so the order isn't necessarily the same as the order of the
+    URLs. For a successful fetch, exception is None. Otherwise parser is None
+    and exception is the error that fetch() raised.
+
+    A URL that appears more than once is fetched only once, and so is a URL
+    that another thread is already fetching via fetch_many() with the same
+    user agent and parser factory; the callers share the parser.
+
+    timeout and transport are passed to each parser's fetch(), user_agent
+    is sent in the User-Agent header, and parser_factory is called with no
+    arguments to create each parser. An HTTPConnectionPool transport with
+    max_idle_per_host of at least max_workers lets workers reuse connections.
+    """
+    # counts maps each URL to the number of times it appears in urls.
+    counts = collections.OrderedDict()
+    for url in urls:
+        counts[url] = counts.get(url, 0) + 1
+
+    pending = queue.Queue()
+    for url in counts:
+        pending.put(url)
+    done = queue.Queue()
+
+    def fetch_one(url):
+        parser = parser_factory()
+        if user_agent:
+            parser.user_agent = user_agent
+        parser.fetch(url, timeout, transport)
+
+        return parser
+
+    def work():
+        while True:
+            try:
+                url = pending.get_nowait()
+            except queue.Empty:
+                return
+            key = (url, user_agent, parser_factory)
+            try:
+                parser = _fetch_many_single_flight.do(key, lambda: fetch_one(url))
+            except Exception:
+                done.put((url, None, sys.exc_info()[1]))
+            else:
+                done.put((url, parser, None))
+
+    for _ in range(min(max_workers, len(counts))):
+        worker = threading.Thread(target=work)
+        worker.daemon = True
+        worker.start()
+
+    for _ in range(len(counts)):
+        result = done.get()
+        for _ in range(counts[result[0]]):
+            yield result
+
+
+class HTTPConnectionPool(object):
+    """A pool of persistent (keep-alive) HTTP connections for fetching
+    robots.txt files. Pass one as the transport argument of
+    RobotExclusionRulesParser.fetch(), fetch_many() or RobotsRegistry to
+    avoid the cost of TCP (and TLS) setup on every fetch.
+
+    Connections are pooled per origin. If proxy is specified (e.g.
+    'http://proxy.example.com:3128'), all requests go through it; plain HTTP
+    requests share one set of connections to the proxy and HTTPS requests
+    are tunneled via CONNECT with connections pooled per origin.
+
+    The pool keeps at most max_idle_per_host idle connections per origin (or
+    to the proxy) and at most max_idle in total. Connections that have been
+    idle for more than idle_timeout seconds are closed rather than reused.
+    The pool is safe to share among threads; a connection is only ever used
+    by one thread at a time.
+    """
+    def __init__(self, max_idle_per_host=4, max_idle=100, idle_timeout=30, proxy=None):
+        if (max_idle_per_host < 0) or (max_idle < 0):
+            raise ValueError("max_idle_per_host and max_idle must not be negative")
+        self.max_idle_per_host = max_idle_per_host
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._proxy = None
+        if proxy:
+            parts = urllib_urlparse(proxy)
+            self._proxy = (parts.hostname, parts.port or 80)
+        self._lock = threading.Lock()
+        # _idle maps each key to a list of (connection, time it became idle)
+        # tuples, oldest first.
+        self._idle = {}
+        self._idle_count = 0
+
+    def get(self, url, headers=None, timeout=None, max_filesize=MAX_FILESIZE):
+        """Sends a GET request for the URL, following redirects the same way
+        urlopen() does, and returns a tuple of (response code, content,
+        headers, wire bytes). The content is decoded according to its
+        Content-Encoding and is at most max_filesize bytes, wire bytes is
+        the size of the body as received, and headers is the response's
+        HTTPMessage. Raises URLError if it can't connect.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._get(url, headers or {}, timeout, max_filesize)
+            location = response[2].get("location")
+            if (response[0] not in _REDIRECT_CODES) or (not location):
+                break
+            url = urllib_urljoin(url, location)
+
+        return response
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+            self._idle_count = 0
+
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def _get(self, url, headers, timeout, max_filesize):
+        parts = urllib_urlparse(url)
+        scheme = parts.scheme.lower()
+        if (scheme not in _DEFAULT_PORTS) or (not parts.hostname):
+            raise urllib_error.URLError("unknown url type: %s" % url)
+        host = parts.hostname
+        port = parts.port or _DEFAULT_PORTS[scheme]
+
+        if self._proxy and (scheme == "http"):
+            # Plain HTTP requests to a proxy use the full URL and can share
+            # connections regardless of origin.
+            key = self._proxy
+            path = urllib_urlunparse(parts[:5] + ("", ))
+        else:
+            key = (scheme, host, port)
+            path = urllib_urlunparse(("", "", parts.path or "/", parts.params, parts.query, ""))
+
+        connection = self._checkout(key)
+        reused = (connection is not None)
+        while True:
+            if connection is None:
+                connection = self._connect(scheme, host, port, timeout)
+            elif connection.sock:
+                connection.sock.settimeout(timeout if timeout else socket.getdefaulttimeout())
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                decoder = _read_body(response, response.getheader("content-encoding"),
+                                     max_filesize)
+                break
+            except (socket.timeout, urllib_error.URLError):
+                # URLError here means the body couldn't be decoded.
+                connection.close()
+                raise
+            except (socket.error, http_client.HTTPException):
+                connection.close()
+                if reused:
+                    # The server probably closed the connection while it
+                    # was idle. GET is idempotent so it's safe to try again
+                    # on a new connection.
+                    reused = False
+                    connection = None
+                else:
+                    raise urllib_error.URLError(sys.exc_info()[1])
+
+        # A connection can only be reused if the server is willing and I
+        # read the whole response.
+        if response.will_close or not response.isclosed():
+            connection.close()
+        else:
+            self._checkin(key, connection)
+
+        return response.status, decoder.body, response.msg, decoder.wire_bytes
+
+    def _connect(self, scheme, host, port, timeout):
+        kwargs = {"timeout": timeout} if timeout else {}
+        if self._proxy:
+            if scheme == "https":
+                connection = http_client.HTTPSConnection(self._proxy[0], self._proxy[1], **kwargs)
+                connection.set_tunnel(host, port)
+            else:
+                connection = http_client.HTTPConnection(self._proxy[0], self._proxy[1], **kwargs)
+        elif scheme == "https":
+            connection = http_client.HTTPSConnection(host, port, **kwargs)
+        else:
+            connection = http_client.HTTPConnection(host, port, **kwargs)
+
+        return connection
+
+    def _checkout(self, key):
+        # Returns the most recently used idle connection for the key, or
+        # None if there aren't any that are fresh enough.
+        stale = []
+        connection = None
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                candidate, idle_since = connections.pop()
+                self._idle_count -= 1
+                if time.time() - idle_since <= self.idle_timeout:
+                    connection = candidate
+                    break
+                stale.append(candidate)
+            if (not connections) and (key in self._idle):
+                del self._idle[key]
+
+        for candidate in stale:
+            candidate.close()
+
+        return connection
+
+    def _checkin(self, key, connection):
+        closing = []
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            # Expired connections are at the front of the list.
+            now = time.time()
+            while connections and (now - connections[0][1] > self.idle_timeout):
+                closing.append(connections.pop(0)[0])
+                self._idle_count -= 1
+            if connections and (len(connections) >= self.max_idle_per_host):
+                closing.append(connections.pop(0)[0])
+                self._idle_count -= 1
+            if (len(connections) < self.max_idle_per_host) and \
+               (self._idle_count < self.max_idle):
+                connections.append((connection, now))
+                self._idle_count += 1
+            else:
+                closing.append(connection)
+            if not connections:
+                del self._idle[key]
+
+        for connection in closing:
+            connection.close()
 
 
 class RobotFileParserLookalike(RobotExclusionRulesParser):
@@ -16,10 +16,12 @@ if PY_MAJOR_VERSION < 3:
     import urllib2 as urllib_error
     import urllib2 as urllib_request
     import SocketServer as socketserver
+    asyncio = None
 else:
     import urllib.error as urllib_error
     import urllib.request as urllib_request
     import socketserver
+    import asyncio
 
 # Project imports
 import robotexclusionrulesparser  # noqa E402
@@ -80,6 +82,7 @@ class TestFetchFailures(unittest.TestCase):
         """Test handling of response code 401 (Unauthorized) - everything disallowed"""
         self.parser.fetch(HOST_NAME + "/response_code/{}/robots.txt".format(401))
 
+        self.assertTrue(self.parser.trivial_policy is robotexclusionrulesparser.DISALLOW_ALL)
         self.assertFalse(self.parser.is_allowed("NigelBot", "/"))
         self.assertFalse(self.parser.is_allowed("StigBot", "/foo/bar.html"))
         self.assertFalse(self.parser.is_allowed("BruceBruceBruceBot", "/index.html"))
@@ -88,6 +91,7 @@ class TestFetchFailures(unittest.TestCase):
         """Test handling of response code 403 (Forbidden) - everything disallowed"""
         self.parser.fetch(HOST_NAME + "/response_code/{}/robots.txt".format(403))
 
+        self.assertTrue(self.parser.trivial_policy is robotexclusionrulesparser.DISALLOW_ALL)
         self.assertFalse(self.parser.is_allowed("NigelBot", "/"))
         self.assertFalse(self.parser.is_allowed("StigBot", "/foo/bar.html"))
         self.assertFalse(self.parser.is_allowed("BruceBruceBruceBot", "/index.html"))
@@ -96,6 +100,7 @@ class TestFetchFailures(unittest.TestCase):
         """Test handling of response code 404 (Not Found) - everything allowed"""
         self.parser.fetch(HOST_NAME + "/response_code/{}/robots.txt".format(404))
 
+        self.assertTrue(self.parser.trivial_policy is robotexclusionrulesparser.ALLOW_ALL)
         self.assertTrue(self.parser.is_allowed("foobot", "/"))
         self.assertTrue(self.parser.is_allowed("javla-foobot", "/stuff"))
         self.assertTrue(self.parser.is_allowed("anybot", "/TotallySecretStuff"))
@@ -238,3 +243,604 @@ class TestTimeout(unittest.TestCase):
 
         # No exception should be raised.
         self.parser.fetch(url, 2)
+
+
+class TestEncoding(unittest.TestCase):
+    """Exercise fetch()'s decoding of robots.txt files according to the Content-Type charset."""
+    def test_encodings(self):
+        """Test decoding of robots.txt files in various encodings"""
+        for encoding in ('utf-8', 'iso-8859-1', 'utf-16'):
+            parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+            parser.fetch(HOST_NAME + "/encoding/{}/robots.txt".format(encoding))
+
+            self.assertFalse(parser.is_allowed(u"BättreBot", "/stuff"))
+            self.assertTrue(parser.is_allowed(u"BästaBot", "/stuff"))
+
+
+def run_fetch_async(parser, url, timeout=None):
+    """Run parser.fetch_async() to completion in a new event loop."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(parser.fetch_async(url, timeout))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+@unittest.skipIf(PY_MAJOR_VERSION < 3, 'fetch_async() requires asyncio')
+class TestFetchAsync(unittest.TestCase):
+    """Ensure fetch_async() behaves like fetch()."""
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.parser.use_local_time = False
+
+    def test_non_existent_domain(self):
+        """Test handling of non-existent domain"""
+        url = 'http://ThisDomainIsGuaranteedNotToExistPerRfc2606.invalid'
+
+        with self.assertRaises(urllib_error.URLError):
+            run_fetch_async(self.parser, url)
+
+    def test_response_codes(self):
+        """Test handling of response codes 401, 403 and 404"""
+        for response_code, allowed in ((401, False), (403, False), (404, True)):
+            run_fetch_async(self.parser,
+                            HOST_NAME + "/response_code/{}/robots.txt".format(response_code))
+            self.assertEqual(self.parser.response_code, response_code)
+            self.assertEqual(self.parser.is_allowed("NigelBot", "/foo/bar.html"), allowed)
+
+    def test_other_code_handling(self):
+        """Test handling of other response codes, e.g. 500 (Server Error)"""
+        for response_code in (410, 500, 503):
+            url = HOST_NAME + "/response_code/{}/robots.txt".format(response_code)
+            with self.assertRaises(urllib_error.URLError):
+                run_fetch_async(self.parser, url)
+
+    def test_expires_header(self):
+        """Test that fetch_async() honors the Expires header like fetch() does"""
+        expires = datetime.datetime.utcnow() + datetime.timedelta(minutes=90)
+        url = HOST_NAME + "/expires/{}/rfc1123/robots.txt".format(
+            expires.strftime('%Y-%m-%d-%H-%M-%S'))
+        run_fetch_async(self.parser, url)
+
+        self.assertEqual(self.parser.expiration_date,
+                         calendar.timegm(expires.replace(microsecond=0).timetuple()))
+
+    def test_encodings(self):
+        """Test decoding of robots.txt files in various encodings"""
+        for encoding in ('utf-8', 'iso-8859-1', 'utf-16'):
+            run_fetch_async(self.parser, HOST_NAME + "/encoding/{}/robots.txt".format(encoding))
+
+            self.assertFalse(self.parser.is_allowed(u"BättreBot", "/stuff"))
+            self.assertTrue(self.parser.is_allowed(u"BästaBot", "/stuff"))
+
+    def test_redirects(self):
+        """Test that redirects are followed up to the same limit that urllib uses"""
+        url = HOST_NAME + "/redirect/{}/robots.txt"
+        run_fetch_async(self.parser, url.format(robotexclusionrulesparser.MAX_REDIRECTS))
+        self.assertEqual(self.parser.response_code, 200)
+        self.assertEqual(self.parser.source_url,
+                         url.format(robotexclusionrulesparser.MAX_REDIRECTS))
+        self.assertFalse(self.parser.is_allowed("FooBot", "/private0"))
+
+        with self.assertRaises(urllib_error.URLError):
+            run_fetch_async(self.parser, url.format(robotexclusionrulesparser.MAX_REDIRECTS + 1))
+
+    def test_big_robots_txt(self):
+        """Test a robots.txt big enough to be parsed in the executor and truncated"""
+        run_fetch_async(self.parser, HOST_NAME + "/big/10000/robots.txt")
+
+        self.assertFalse(self.parser.is_allowed("FooBot", "/private0"))
+        self.assertFalse(self.parser.is_allowed("FooBot", "/private4000"))
+        # Content beyond MAX_FILESIZE is ignored.
+        self.assertFalse("Disallow: /private9999\n" in str(self.parser))
+
+        expected = robotexclusionrulesparser.RobotExclusionRulesParser()
+        expected.fetch(HOST_NAME + "/big/10000/robots.txt")
+        self.assertEqual(str(self.parser), str(expected))
+
+    def test_timeout(self):
+        """Test that a timeout raises socket.timeout"""
+        with self.assertRaises(socket.timeout):
+            run_fetch_async(self.parser, HOST_NAME + "/sleep/1/robots.txt", 0.2)
+
+    def test_non_expiring_timeout(self):
+        """Exercise fetch_async() when the timeout does not expire"""
+        run_fetch_async(self.parser, HOST_NAME + "/sleep/0.2/robots.txt", 2)
+
+        self.assertEqual(self.parser.response_code, 200)
+
+
+class TestFetchMany(unittest.TestCase):
+    """Exercise fetch_many()."""
+    def test_results(self):
+        """Test that every URL gets a result, including duplicates and failures"""
+        url = HOST_NAME + "/response_code/{}/robots.txt"
+        urls = [url.format(404), url.format(401), url.format(500), url.format(404),
+                'http://ThisDomainIsGuaranteedNotToExistPerRfc2606.invalid']
+
+        results = list(robotexclusionrulesparser.fetch_many(urls, max_workers=3, timeout=5))
+
+        self.assertEqual(sorted([result[0] for result in results]), sorted(urls))
+        results = dict([(result[0], result[1:]) for result in results])
+
+        parser, error = results[url.format(404)]
+        self.assertTrue(parser.is_allowed("foobot", "/"))
+        self.assertEqual(parser.response_code, 404)
+        parser, error = results[url.format(401)]
+        self.assertFalse(parser.is_allowed("foobot", "/"))
+        for failure in (url.format(500), urls[-1]):
+            parser, error = results[failure]
+            self.assertEqual(parser, None)
+            self.assertTrue(isinstance(error, urllib_error.URLError))
+
+    def test_duplicates_share_a_parser(self):
+        """Test that a URL listed more than once is fetched once"""
+        url = HOST_NAME + "/big/3/robots.txt"
+
+        results = list(robotexclusionrulesparser.fetch_many([url] * 5, user_agent="FooBot"))
+
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all([parser is results[0][1] for _, parser, _ in results]))
+        self.assertEqual(results[0][1].user_agent, "FooBot")
+        self.assertFalse(results[0][1].is_allowed("FooBot", "/private2"))
+
+    def test_no_urls(self):
+        """Test that an empty list of URLs yields nothing"""
+        self.assertEqual(list(robotexclusionrulesparser.fetch_many([])), [])
+
+
+class TestHTTPConnectionPool(unittest.TestCase):
+    """Exercise fetch() with an HTTPConnectionPool transport against a keep-alive server."""
+    @classmethod
+    def setUpClass(cls):
+        cls.server = socketserver.ThreadingTCPServer(("localhost", 0),
+                                                     utils_for_tests.KeepAliveHTTPRequestHandler)
+        cls.server.daemon_threads = True
+        cls.host_name = 'http://localhost:{}'.format(cls.server.server_address[1])
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever)
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.server_thread.join()
+
+    def setUp(self):
+        utils_for_tests.KeepAliveHTTPRequestHandler.requests = []
+        self.pool = robotexclusionrulesparser.HTTPConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _fetch(self, url, timeout=None):
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.fetch(url, timeout, self.pool)
+
+        return parser
+
+    def _connection_count(self):
+        return len(set([port for port, _ in utils_for_tests.KeepAliveHTTPRequestHandler.requests]))
+
+    def test_connection_reuse(self):
+        """Test that consecutive fetches share a connection"""
+        for i in range(5):
+            parser = self._fetch(self.host_name + "/big/{}/robots.txt".format(i + 1))
+            self.assertFalse(parser.is_allowed("FooBot", "/private{}".format(i)))
+        self.assertEqual(len(utils_for_tests.KeepAliveHTTPRequestHandler.requests), 5)
+        self.assertEqual(self._connection_count(), 1)
+
+    def test_same_results_as_urlopen(self):
+        """Test that response codes, redirects, Expires and encodings are handled like fetch()"""
+        paths = ["/response_code/404/robots.txt", "/response_code/403/robots.txt",
+                 "/encoding/utf-16/robots.txt", "/redirect/3/robots.txt",
+                 "/expires/2030-01-01-00-00-00/rfc1123/robots.txt"]
+        for path in paths:
+            expected = robotexclusionrulesparser.RobotExclusionRulesParser()
+            expected.fetch(self.host_name + path)
+            parser = self._fetch(self.host_name + path)
+            self.assertEqual(parser.response_code, expected.response_code)
+            # The default expiration date depends on when the fetch happened.
+            self.assertAlmostEqual(parser.expiration_date, expected.expiration_date, delta=5)
+            self.assertEqual(str(parser), str(expected))
+
+        with self.assertRaises(urllib_error.URLError):
+            self._fetch(self.host_name + "/response_code/500/robots.txt")
+        with self.assertRaises(urllib_error.URLError):
+            url = "/redirect/{}/robots.txt".format(robotexclusionrulesparser.MAX_REDIRECTS + 1)
+            self._fetch(self.host_name + url)
+        with self.assertRaises(urllib_error.URLError):
+            self._fetch('http://ThisDomainIsGuaranteedNotToExistPerRfc2606.invalid')
+
+    def test_http_1_0_server(self):
+        """Test that connections to a server that doesn't support keep-alive aren't pooled"""
+        parser = self._fetch(HOST_NAME + "/response_code/404/robots.txt")
+        self.assertEqual(parser.response_code, 404)
+        self.assertEqual(self.pool._idle_count, 0)
+
+    def test_server_closed_idle_connection(self):
+        """Test that a request is retried when the server has closed an idle connection"""
+        self._fetch(self.host_name + "/big/1/robots.txt")
+        time.sleep(utils_for_tests.KeepAliveHTTPRequestHandler.timeout + 0.3)
+        parser = self._fetch(self.host_name + "/big/2/robots.txt")
+
+        self.assertFalse(parser.is_allowed("FooBot", "/private1"))
+        self.assertEqual(self._connection_count(), 2)
+
+    def test_idle_timeout(self):
+        """Test that connections idle for longer than idle_timeout aren't reused"""
+        self.pool.idle_timeout = 0
+        self._fetch(self.host_name + "/big/1/robots.txt")
+        time.sleep(0.01)
+        self._fetch(self.host_name + "/big/1/robots.txt")
+
+        self.assertEqual(self._connection_count(), 2)
+
+    def test_pool_limits(self):
+        """Test that the number of idle connections is bounded"""
+        self.pool.max_idle_per_host = 2
+        urls = [self.host_name + "/sleep/0.1/robots.txt{}".format(i) for i in range(8)]
+
+        results = list(robotexclusionrulesparser.fetch_many(urls, max_workers=8,
+                                                            transport=self.pool))
+
+        self.assertTrue(all([error is None for _, _, error in results]))
+        self.assertEqual(self.pool._idle_count, 2)
+
+    def test_no_idle_connections(self):
+        """Test that max_idle_per_host=0 closes every connection after use"""
+        self.pool.close()
+        self.pool = robotexclusionrulesparser.HTTPConnectionPool(max_idle_per_host=0)
+        for i in range(2):
+            parser = self._fetch(self.host_name + "/big/1/robots.txt")
+            self.assertFalse(parser.is_allowed("FooBot", "/private0"))
+            self.assertEqual(self.pool._idle_count, 0)
+        self.assertEqual(self._connection_count(), 2)
+
+        self.assertRaises(ValueError, robotexclusionrulesparser.HTTPConnectionPool,
+                          max_idle_per_host=-1)
+
+    def test_proxy(self):
+        """Test that requests for different origins share a connection to the proxy"""
+        pool = robotexclusionrulesparser.HTTPConnectionPool(proxy=self.host_name)
+        for host in ("a.invalid", "b.invalid"):
+            parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+            parser.fetch("http://{}/big/1/robots.txt".format(host), transport=pool)
+            self.assertFalse(parser.is_allowed("FooBot", "/private0"))
+        pool.close()
+
+        requests = utils_for_tests.KeepAliveHTTPRequestHandler.requests
+        self.assertEqual([path for _, path in requests], ["http://a.invalid/big/1/robots.txt",
+                                                          "http://b.invalid/big/1/robots.txt"])
+        self.assertEqual(self._connection_count(), 1)
+
+
+class TestConditionalFetch(unittest.TestCase):
+    """Exercise revalidation of a robots.txt with ETag and Last-Modified."""
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+
+    def _fetch(self, url):
+        self.parser.fetch(url)
+
+    def _check_revalidation(self, validators, expected_request):
+        url = HOST_NAME + "/conditional/{}/robots.txt".format(validators)
+        self._fetch(url)
+        self.assertEqual(self.parser.response_code, 200)
+        self.assertEqual(utils_for_tests.MyHTTPRequestHandler.last_conditional_request,
+                         (None, None))
+
+        policy = self.parser.for_agent("FooBot")
+        self.parser.expiration_date = 0
+        self._fetch(url)
+
+        self.assertEqual(utils_for_tests.MyHTTPRequestHandler.last_conditional_request,
+                         expected_request)
+        self.assertEqual(self.parser.response_code, 304)
+        self.assertFalse(self.parser.is_expired)
+        # The rules weren't parsed again.
+        self.assertTrue(policy.is_current)
+        self.assertFalse(self.parser.is_allowed("FooBot", "/private1"))
+        self.assertTrue(self.parser.is_allowed("FooBot", "/public"))
+
+    def test_etag(self):
+        """Test revalidation with If-None-Match"""
+        self._check_revalidation('etag', ('"v1"', None))
+        self.assertEqual(self.parser.etag, '"v1"')
+        self.assertEqual(self.parser.last_modified, None)
+
+    def test_last_modified(self):
+        """Test revalidation with If-Modified-Since"""
+        self._check_revalidation('last_modified', (None, 'Wed, 21 Oct 2015 07:28:00 GMT'))
+        self.assertEqual(self.parser.etag, None)
+        self.assertEqual(self.parser.last_modified, 'Wed, 21 Oct 2015 07:28:00 GMT')
+
+    def test_both(self):
+        """Test revalidation with both validators"""
+        self._check_revalidation('both', ('"v1"', 'Wed, 21 Oct 2015 07:28:00 GMT'))
+
+    def test_different_url(self):
+        """Test that validators aren't sent to a different URL"""
+        self._fetch(HOST_NAME + "/conditional/etag/robots.txt")
+        self._fetch(HOST_NAME + "/conditional/both/robots.txt")
+
+        self.assertEqual(self.parser.response_code, 200)
+        self.assertEqual(utils_for_tests.MyHTTPRequestHandler.last_conditional_request,
+                         (None, None))
+
+    def test_parse_clears_validators(self):
+        """Test that validators are forgotten when the rules are replaced by parse()"""
+        url = HOST_NAME + "/conditional/both/robots.txt"
+        self._fetch(url)
+        self.parser.parse("User-agent: *\nDisallow: /\n")
+        self.assertEqual((self.parser.etag, self.parser.last_modified), (None, None))
+        self._fetch(url)
+
+        self.assertEqual(self.parser.response_code, 200)
+
+    def test_unexpected_304(self):
+        """Test that a 304 in response to an unconditional request is an error"""
+        with self.assertRaises(urllib_error.URLError):
+            self._fetch(HOST_NAME + "/response_code/304/robots.txt")
+
+
+@unittest.skipIf(PY_MAJOR_VERSION < 3, 'fetch_async() requires asyncio')
+class TestConditionalFetchAsync(TestConditionalFetch):
+    """Exercise revalidation with fetch_async()."""
+    def _fetch(self, url):
+        run_fetch_async(self.parser, url)
+
+
+class TestConditionalFetchPooled(TestConditionalFetch):
+    """Exercise revalidation with an HTTPConnectionPool transport."""
+    def setUp(self):
+        TestConditionalFetch.setUp(self)
+        self.pool = robotexclusionrulesparser.HTTPConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _fetch(self, url):
+        self.parser.fetch(url, transport=self.pool)
+
+
+class TestContentEncoding(unittest.TestCase):
+    """Exercise fetch()'s decoding of gzip and deflate responses."""
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+
+    def _fetch(self, url):
+        self.parser.fetch(url)
+
+    def _fetch_compressed(self, compression, count=1000):
+        self._fetch(HOST_NAME + "/compressed/{}/{}/robots.txt".format(compression, count))
+
+    def test_compressions(self):
+        """Test that gzip, deflate and raw deflate bodies are decoded"""
+        for compression in ('gzip', 'deflate', 'raw_deflate'):
+            self._fetch_compressed(compression)
+            self.assertFalse(self.parser.is_allowed("FooBot", "/private999"))
+            self.assertTrue(self.parser.is_allowed("FooBot", "/public"))
+            self.assertTrue(self.parser.wire_bytes < self.parser.decoded_bytes)
+
+    def test_decompression_bomb(self):
+        """Test that a body that decompresses to more than MAX_FILESIZE is truncated"""
+        self._fetch_compressed('bomb', 10)
+        self.assertFalse(self.parser.is_allowed("FooBot", "/private9"))
+        self.assertEqual(self.parser.decoded_bytes, robotexclusionrulesparser.MAX_FILESIZE)
+        self.assertTrue(self.parser.wire_bytes < robotexclusionrulesparser.MAX_FILESIZE)
+
+    def test_corrupt(self):
+        """Test that a body that can't be decompressed raises URLError"""
+        with self.assertRaises(urllib_error.URLError):
+            self._fetch_compressed('corrupt')
+
+    def test_max_filesize(self):
+        """Test that the parser's max_filesize limits the decoded content"""
+        self.parser.max_filesize = 1000
+        for compression in ('gzip', 'raw_deflate'):
+            self._fetch_compressed(compression)
+            self.assertEqual(self.parser.decoded_bytes, 1000)
+            self.assertFalse(self.parser.is_allowed("FooBot", "/private0"))
+            self.assertFalse("Disallow: /private999\n" in str(self.parser))
+
+    def test_identity(self):
+        """Test that uncompressed bodies are counted the same on the wire and decoded"""
+        self._fetch(HOST_NAME + "/big/10/robots.txt")
+        self.assertEqual(self.parser.wire_bytes, self.parser.decoded_bytes)
+        self.assertTrue(self.parser.decoded_bytes > 0)
+
+
+@unittest.skipIf(PY_MAJOR_VERSION < 3, 'fetch_async() requires asyncio')
+class TestContentEncodingAsync(TestContentEncoding):
+    """Exercise decoding of gzip and deflate responses with fetch_async()."""
+    def _fetch(self, url):
+        run_fetch_async(self.parser, url)
+
+
+class TestContentEncodingPooled(TestContentEncoding):
+    """Exercise decoding of gzip and deflate responses with an HTTPConnectionPool transport."""
+    def setUp(self):
+        TestContentEncoding.setUp(self)
+        self.pool = robotexclusionrulesparser.HTTPConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _fetch(self, url):
+        self.parser.fetch(url, transport=self.pool)
+
+
+class TestCacheControl(unittest.TestCase):
+    """Exercise the Cache-Control header's influence on the expiration date."""
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.parser.use_local_time = False
+
+    def _get_ttl(self, cache_control, age='-'):
+        """Fetch with the Cache-Control and Age headers given and return the time to live."""
+        self.parser.fetch(HOST_NAME + "/cache_control/{}/{}/robots.txt".format(cache_control, age))
+
+        return self.parser.expiration_date - calendar.timegm(time.gmtime())
+
+    def test_max_age(self):
+        """Test that max-age takes precedence over Expires"""
+        self.assertAlmostEqual(self._get_ttl('max-age=3600'), 3600, delta=5)
+
+    def test_s_maxage(self):
+        """Test that s-maxage takes precedence over max-age"""
+        self.assertAlmostEqual(self._get_ttl('max-age=3600,s-maxage=7200'), 7200, delta=5)
+
+    def test_age(self):
+        """Test that the Age header is subtracted from max-age"""
+        self.assertAlmostEqual(self._get_ttl('max-age=3600', 600), 3000, delta=5)
+
+    def test_no_cache(self):
+        """Test that no-cache and no-store expire immediately, subject to min_ttl"""
+        self.assertAlmostEqual(self._get_ttl('max-age=3600,no-cache'),
+                               robotexclusionrulesparser.MIN_TTL, delta=5)
+        self.parser.min_ttl = None
+        self.assertAlmostEqual(self._get_ttl('no-store'), 0, delta=5)
+        self.assertTrue(self.parser.is_expired)
+
+    def test_invalid_max_age(self):
+        """Test that an invalid max-age is ignored in favor of Expires"""
+        self.assertAlmostEqual(self._get_ttl('max-age=soon'), 24 * 60 * 60, delta=5)
+
+    def test_max_ttl(self):
+        """Test that max_ttl puts a ceiling on the time to live"""
+        self.parser.max_ttl = 600
+        self.assertAlmostEqual(self._get_ttl('max-age=3600'), 600, delta=5)
+        # It also applies to the seven day default.
+        self.parser.fetch(HOST_NAME + "/response_code/404/robots.txt")
+        self.assertAlmostEqual(self.parser.expiration_date - calendar.timegm(time.gmtime()), 600,
+                               delta=5)
+
+    def test_stale_while_revalidate(self):
+        """Test that stale-while-revalidate is recorded"""
+        self._get_ttl('max-age=3600,stale-while-revalidate=30')
+        self.assertEqual(self.parser.stale_while_revalidate, 30)
+        self.assertFalse(self.parser.is_usable_while_revalidating)
+
+        self.parser.expiration_date = calendar.timegm(time.gmtime()) - 10
+        self.assertTrue(self.parser.is_usable_while_revalidating)
+        self.parser.expiration_date -= 30
+        self.assertFalse(self.parser.is_usable_while_revalidating)
+
+
+class TestBackoff(unittest.TestCase):
+    """Exercise the backoff and fallback rules after failed fetches."""
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.url = HOST_NAME + "/response_code/500/robots.txt"
+
+    def _fail(self, url=None):
+        with self.assertRaises(urllib_error.URLError):
+            self.parser.fetch(url or self.url)
+
+    def _end_backoff(self):
+        self.parser._backoff_until = self.parser.expiration_date = self.parser._now() - 1
+
+    def test_exponential_backoff(self):
+        """Test that the backoff period doubles with each consecutive failure"""
+        initial = robotexclusionrulesparser.BACKOFF_INITIAL
+        for failures in (1, 2, 3):
+            self._fail()
+            self.assertEqual(self.parser.consecutive_failures, failures)
+            self.assertAlmostEqual(self.parser.backoff_remaining, initial * 2 ** (failures - 1),
+                                   delta=5)
+            self.assertAlmostEqual(self.parser.expiration_date - self.parser._now(),
+                                   initial * 2 ** (failures - 1), delta=5)
+            self._end_backoff()
+
+        # Success resets the count.
+        self.parser.fetch(HOST_NAME + "/big/1/robots.txt")
+        self.assertEqual((self.parser.consecutive_failures, self.parser.backoff_remaining), (0, 0))
+
+    def test_backoff_error(self):
+        """Test that fetching again during the backoff period raises BackoffError"""
+        self._fail()
+        with self.assertRaises(robotexclusionrulesparser.BackoffError) as context:
+            self.parser.fetch(self.url)
+        self.assertTrue(context.exception.backoff_remaining > 0)
+        # BackoffError doesn't count as another failure.
+        self.assertEqual(self.parser.consecutive_failures, 1)
+
+        # A different URL isn't affected.
+        self._fail(HOST_NAME + "/response_code/503/robots.txt")
+        self.assertEqual(self.parser.consecutive_failures, 1)
+
+    def test_retry_after(self):
+        """Test that Retry-After overrides the exponential backoff"""
+        self._fail(HOST_NAME + "/retry_after/7/robots.txt")
+        self.assertAlmostEqual(self.parser.backoff_remaining, 7, delta=2)
+
+        self._fail(HOST_NAME + "/retry_after/date/robots.txt")
+        self.assertAlmostEqual(self.parser.backoff_remaining, 60 * 60, delta=5)
+
+    def test_fallback_without_good_rules(self):
+        """Test that a parser with no rules disallows everything after a failure"""
+        self._fail()
+        self.assertFalse(self.parser.is_allowed("FooBot", "/foo.html"))
+
+    def test_keep_last_good(self):
+        """Test that FALLBACK_KEEP_LAST_GOOD keeps the rules in effect"""
+        self.parser.fetch(HOST_NAME + "/big/1/robots.txt")
+        self._fail()
+        self.assertFalse(self.parser.is_allowed("FooBot", "/private0"))
+        self.assertTrue(self.parser.is_allowed("FooBot", "/public"))
+        self.assertTrue(self.parser.is_allowed("BarBot", "/private0"))
+
+    def test_not_modified_resets_backoff(self):
+        """Test that a 304 after a failure resets the count of consecutive failures"""
+        url = HOST_NAME + "/conditional/etag/robots.txt"
+        self.parser.fetch(url)
+        handler = utils_for_tests.MyHTTPRequestHandler
+        try:
+            for _ in range(2):
+                handler.conditional_response_code = 503
+                self._fail(url)
+                self.assertEqual(self.parser.consecutive_failures, 1)
+                self.assertAlmostEqual(self.parser.backoff_remaining,
+                                       robotexclusionrulesparser.BACKOFF_INITIAL, delta=5)
+                self._end_backoff()
+
+                # The validators survived the failure, so this is a revalidation.
+                handler.conditional_response_code = None
+                self.parser.fetch(url)
+                self.assertEqual(self.parser.response_code, 304)
+                self.assertEqual((self.parser.consecutive_failures,
+                                  self.parser.backoff_remaining), (0, 0))
+        finally:
+            handler.conditional_response_code = None
+
+    def test_disallow_all(self):
+        """Test that FALLBACK_DISALLOW_ALL replaces the rules"""
+        self.parser.fallback = robotexclusionrulesparser.FALLBACK_DISALLOW_ALL
+        self.parser.fetch(HOST_NAME + "/big/1/robots.txt")
+        self._fail()
+        self.assertFalse(self.parser.is_allowed("BarBot", "/public"))
+
+        # After the backoff period, a successful fetch restores normal service.
+        self._end_backoff()
+        self.parser.fetch(self.url.replace("500", "404"))
+        self.assertTrue(self.parser.is_allowed("BarBot", "/public"))
+
+    def test_network_error(self):
+        """Test that network errors start a backoff period"""
+        self._fail('http://ThisDomainIsGuaranteedNotToExistPerRfc2606.invalid')
+        self.assertEqual(self.parser.consecutive_failures, 1)
+        self.assertTrue(self.parser.backoff_remaining > 0)
+
+    @unittest.skipIf(PY_MAJOR_VERSION < 3, 'fetch_async() requires asyncio')
+    def test_timeout(self):
+        """Test that timeouts start a backoff period"""
+        url = HOST_NAME + "/sleep/1/robots.txt"
+        with self.assertRaises(socket.timeout):
+            run_fetch_async(self.parser, url, 0.2)
+        self.assertEqual(self.parser.consecutive_failures, 1)
+
+        with self.assertRaises(robotexclusionrulesparser.BackoffError):
+            run_fetch_async(self.parser, url, 0.2)
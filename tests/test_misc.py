@@ -13,3 +13,20 @@ class TestSitemapDeprecation(unittest.TestCase):
         """Ensure the 'sitemap' attribute is deprecated"""
         with self.assertRaises(DeprecationWarning):
             self.parser.sitemap
+
+
+class TestCacheControlParsing(unittest.TestCase):
+    def test_directives(self):
+        """Ensure Cache-Control directives are parsed with and without values"""
+        parse = robotexclusionrulesparser._parse_cache_control_header
+        self.assertEqual(parse(None), {})
+        self.assertEqual(parse('Max-Age=60, no-cache,  private="x"'),
+                         {'max-age': '60', 'no-cache': None, 'private': 'x'})
+        self.assertEqual(parse('s-maxage="120",,'), {'s-maxage': '120'})
+
+    def test_seconds(self):
+        """Ensure delta-seconds values are validated"""
+        parse = robotexclusionrulesparser._parse_seconds
+        self.assertEqual(parse('60'), 60)
+        for value in (None, '', '-1', '1.5', 'soon'):
+            self.assertEqual(parse(value), None)
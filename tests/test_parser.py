@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 # Python imports
 import sys
+import os
+import random
+import pickle
+import io
+import gc
+import copy
+import bisect
 PY_MAJOR_VERSION = sys.version_info[0]
 import unittest  # noqa E402
 
@@ -11,6 +18,9 @@ else:
 
 # Project imports
 import robotexclusionrulesparser   # noqa E402
+# I add this file's directory to sys.path so that I can find my utils module.
+sys.path.insert(0, os.path.dirname(__file__))
+import utils_for_tests             # noqa E402
 
 
 class TestStandardLibraryParserComparison(unittest.TestCase):
@@ -505,3 +515,1117 @@ Disallow: /
         self.assertFalse(self.parser.is_allowed("FOOBOT", "/"))
         self.assertFalse(self.parser.is_allowed("FoOBoT", "/"))
         self.assertFalse(self.parser.is_allowed("foobot", "/"))
+
+
+class TestCompiledRules(unittest.TestCase):
+    """Verify that compiled rulesets give the same answers as interpreting the rules directly"""
+    def _make_ruleset(self, rules):
+        ruleset = robotexclusionrulesparser._Ruleset()
+        ruleset.add_robot_name("*")
+        ruleset.rules = list(rules)
+        ruleset.compile()
+        return ruleset
+
+    def test_differential(self):
+        """Compare compiled rulesets to the reference implementation on random rules"""
+        rng = random.Random(42)
+        for _ in range(200):
+            rules = utils_for_tests.make_random_rules(rng, rng.randint(1, 12))
+            ruleset = self._make_ruleset(rules)
+            for url in utils_for_tests.make_random_urls(rng, 30):
+                for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+                    self.assertEqual(ruleset.is_url_allowed(url, syntax),
+                                     utils_for_tests.reference_is_url_allowed(rules, url, syntax),
+                                     (rules, url, syntax))
+
+    def test_add_rule_invalidates(self):
+        """Ensure adding a rule after compilation is reflected in the answers"""
+        ruleset = self._make_ruleset([(robotexclusionrulesparser._Ruleset.DISALLOW, "/a")])
+        self.assertTrue(ruleset.is_url_allowed("/b"))
+        ruleset.add_disallow_rule("/b")
+        self.assertFalse(ruleset.is_url_allowed("/b"))
+
+    def test_pickle(self):
+        """Ensure a parser with compiled rules survives a round trip through pickle"""
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse("User-agent: *\nAllow: /foo$\nDisallow: /foo\n")
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            clone = pickle.loads(pickle.dumps(parser, protocol))
+            self.assertTrue(clone.is_allowed("foobot", "/foo"))
+            self.assertFalse(clone.is_allowed("foobot", "/foo/bar.html"))
+
+
+class TestPrefixIndex(unittest.TestCase):
+    """Verify that the prefix index finds the same first matching rule as a linear scan"""
+    def setUp(self):
+        self.saved_min_rules = robotexclusionrulesparser.PREFIX_INDEX_MIN_RULES
+        robotexclusionrulesparser.PREFIX_INDEX_MIN_RULES = 1
+
+    def tearDown(self):
+        robotexclusionrulesparser.PREFIX_INDEX_MIN_RULES = self.saved_min_rules
+
+    def test_differential(self):
+        """Compare indexed rulesets to the reference implementation on random rules"""
+        rng = random.Random(7)
+        for _ in range(200):
+            rules = utils_for_tests.make_random_rules(rng, rng.randint(1, 40))
+            ruleset = robotexclusionrulesparser._Ruleset()
+            ruleset.rules = rules
+            ruleset.compile()
+            self.assertIsNotNone(ruleset._compiled[robotexclusionrulesparser.MK1996].prefix_index)
+            for url in utils_for_tests.make_random_urls(rng, 30):
+                for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+                    self.assertEqual(ruleset.is_url_allowed(url, syntax),
+                                     utils_for_tests.reference_is_url_allowed(rules, url, syntax),
+                                     (rules, url, syntax))
+
+    def test_file_order(self):
+        """Ensure the first rule in file order wins even when a longer path matches"""
+        lines = ["User-agent: *", "Allow: /public/images/"]
+        lines += ["Disallow: /private%d/" % i for i in range(100)]
+        lines += ["Disallow: /public/", "Allow: /public/images/logo.png"]
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse("\n".join(lines))
+
+        self.assertTrue(parser.is_allowed("foobot", "/public/images/logo.png"))
+        self.assertFalse(parser.is_allowed("foobot", "/public/index.html"))
+        self.assertFalse(parser.is_allowed("foobot", "/private42/index.html"))
+        self.assertTrue(parser.is_allowed("foobot", "/private/index.html"))
+
+
+class TestFrontCoding(unittest.TestCase):
+    """Verify that front-coded rulesets give the same answers as the reference implementation"""
+    def setUp(self):
+        self.saved_min_rules = (robotexclusionrulesparser.PREFIX_INDEX_MIN_RULES,
+                                robotexclusionrulesparser.FRONT_CODING_MIN_RULES)
+        robotexclusionrulesparser.PREFIX_INDEX_MIN_RULES = 1
+        robotexclusionrulesparser.FRONT_CODING_MIN_RULES = 1
+
+    def tearDown(self):
+        (robotexclusionrulesparser.PREFIX_INDEX_MIN_RULES,
+         robotexclusionrulesparser.FRONT_CODING_MIN_RULES) = self.saved_min_rules
+
+    def test_sequence(self):
+        """Ensure the store returns the paths in file order"""
+        rng = random.Random(11)
+        for _ in range(50):
+            paths = [path for _, path in utils_for_tests.make_random_rules(rng, rng.randint(1, 60))]
+            store = robotexclusionrulesparser._FrontCodedPaths(paths)
+            self.assertEqual(len(store), len(paths))
+            self.assertEqual(list(store), paths)
+            self.assertEqual([store[i] for i in range(len(paths))], paths)
+            self.assertEqual(store.sorted_paths(), sorted(set(paths)))
+            self.assertEqual(store, robotexclusionrulesparser._FrontCodedPaths(paths))
+
+    def test_floor(self):
+        """Compare floor() to bisecting the decoded paths"""
+        rng = random.Random(12)
+        for _ in range(50):
+            paths = [path for _, path in utils_for_tests.make_random_rules(rng, rng.randint(1, 60))]
+            store = robotexclusionrulesparser._FrontCodedPaths(paths)
+            distinct = store.sorted_paths()
+            for s in utils_for_tests.make_random_urls(rng, 30) + ["", "/"]:
+                position = bisect.bisect_right(distinct, s) - 1
+                path = distinct[position] if (position >= 0) else ""
+                m = len(os.path.commonprefix([path, s]))
+                self.assertEqual(store.floor(s), (position, m, len(path)), (distinct, s))
+
+    def test_differential(self):
+        """Compare front-coded rulesets to the reference implementation on random rules"""
+        rng = random.Random(13)
+        for _ in range(200):
+            rules = utils_for_tests.make_random_rules(rng, rng.randint(1, 40))
+            ruleset = robotexclusionrulesparser._Ruleset()
+            ruleset.rules = rules
+            ruleset.freeze()
+            self.assertIsInstance(ruleset._paths, robotexclusionrulesparser._FrontCodedPaths)
+            self.assertEqual(list(ruleset.rules), rules)
+            for url in utils_for_tests.make_random_urls(rng, 30):
+                for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+                    self.assertEqual(ruleset.is_url_allowed(url, syntax),
+                                     utils_for_tests.reference_is_url_allowed(rules, url, syntax),
+                                     (rules, url, syntax))
+
+    def test_parser(self):
+        """Exercise a front-coded parser's batch lookups, serialization and interning"""
+        lines = ["User-agent: *", "Allow: /public/images/"]
+        lines += ["Disallow: /private%d/" % i for i in range(100)]
+        lines += ["Disallow: /public/", "Allow: /public/images/logo.png"]
+        robots_txt = "\n".join(lines)
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.interner = robotexclusionrulesparser.RulesInterner()
+        parser.parse(robots_txt)
+        urls = ["/public/images/logo.png", "/public/index.html", "/private42/x", "/private/x"]
+        expected = [True, False, False, True]
+
+        self.assertEqual([parser.is_allowed("foobot", url) for url in urls], expected)
+        self.assertEqual(parser.is_allowed_many("foobot", urls), expected)
+
+        restored = robotexclusionrulesparser.RobotExclusionRulesParser.from_bytes(
+            parser.to_bytes())
+        self.assertEqual(restored.is_allowed_many("foobot", urls), expected)
+
+        other = robotexclusionrulesparser.RobotExclusionRulesParser()
+        other.interner = parser.interner
+        other.parse(robots_txt)
+        self.assertEqual(other.interner.file_hits, 1)
+
+    def test_interned_paths(self):
+        """Ensure parsers share the strings of paths that appear in many files"""
+        robotexclusionrulesparser.FRONT_CODING_MIN_RULES = None
+        parsers = []
+        for i in range(2):
+            parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+            parser.parse("User-agent: *\nDisallow: /cgi-bin/\nDisallow: /host%d/\n" % i)
+            parsers.append(parser)
+        paths = [parser._RobotExclusionRulesParser__rulesets[0]._paths for parser in parsers]
+
+        self.assertIs(paths[0][0], paths[1][0])
+
+
+class TestWildcardSet(unittest.TestCase):
+    """Verify that merged wildcard rules keep first-match semantics"""
+    def test_lowest_index_wins(self):
+        """Ensure the first matching wildcard rule in file order determines the answer"""
+        robots_txt = """
+User-agent: *
+Allow: /*?sessionid=*&keep=1
+Disallow: /*?sessionid=*
+Disallow: /*.php$
+Allow: /*.php
+"""
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(robots_txt)
+
+        self.assertTrue(parser.is_allowed("foobot", "/a?sessionid=5&keep=1"))
+        self.assertFalse(parser.is_allowed("foobot", "/a?sessionid=5&keep=0"))
+        self.assertFalse(parser.is_allowed("foobot", "/index.php"))
+        self.assertTrue(parser.is_allowed("foobot", "/index.php?x=1"))
+
+    def test_many_rules(self):
+        """Compare a ruleset with hundreds of wildcard rules to the reference"""
+        rng = random.Random(3)
+        rules = [(rng.choice((robotexclusionrulesparser._Ruleset.ALLOW,
+                              robotexclusionrulesparser._Ruleset.DISALLOW)),
+                  "/*" + "".join(rng.choice("ab/") for _ in range(rng.randint(1, 5))) + "*")
+                 for _ in range(300)]
+        ruleset = robotexclusionrulesparser._Ruleset()
+        ruleset.rules = rules
+        ruleset.compile()
+
+        for url in utils_for_tests.make_random_urls(rng, 300):
+            self.assertEqual(ruleset.is_url_allowed(url),
+                             utils_for_tests.reference_is_url_allowed(
+                                 rules, url, robotexclusionrulesparser.GYM2008))
+
+    def test_first_match(self):
+        """Compare the merged tree to matching each rule in turn with _glob_match()"""
+        rng = random.Random(5)
+        for _ in range(300):
+            paths = []
+            for i in range(rng.randint(1, 40)):
+                # A small alphabet makes rules share segments (and nodes) and gives the
+                # prefilters lots of siblings to rule out.
+                path = "".join(rng.choice(["a", "b", "/", "\n", "*", "?x="])
+                               for _ in range(rng.randint(0, 7)))
+                if ("*" not in path) or (rng.random() < .3):
+                    path += "$"
+                paths.append((i, path))
+            wildcards = robotexclusionrulesparser._WildcardSet(paths)
+            for _ in range(20):
+                url = "".join(rng.choice(["a", "b", "/", "\n", "?x="])
+                              for _ in range(rng.randint(0, 10)))
+                expected = None
+                for i, path in paths:
+                    segments, anchored = robotexclusionrulesparser._wildcard_segments(path)
+                    if robotexclusionrulesparser._glob_match(segments, anchored, url):
+                        expected = i
+                        break
+                self.assertEqual(wildcards.first_match(url), expected, (paths, url))
+
+    def test_one_scan(self):
+        """Ensure a URL that none of many sibling rules match is ruled out in one scan"""
+        paths = [(i, "/*?sessionid%d=*" % i) for i in range(40)]
+        wildcards = robotexclusionrulesparser._WildcardSet(paths)
+        url = utils_for_tests.ScanCountingStr("/catalog/item.html?color=red&size=large")
+
+        self.assertIsNone(wildcards.first_match(url))
+        # The first segment, /, is checked once; the prefilter's regex doesn't go through find().
+        self.assertEqual(url.scanned, 1)
+        self.assertEqual(wildcards.first_match("/a?sessionid39=1"), 39)
+
+    def test_many_segments(self):
+        """Ensure paths with thousands of segments don't exhaust the stack"""
+        path = "/" + "a*" * 5000 + "b"
+        wildcards = robotexclusionrulesparser._WildcardSet([(0, path)])
+        self.assertIsNone(wildcards.first_match("/" + "a" * 6000))
+        self.assertEqual(wildcards.first_match("/" + "a" * 5000 + "b"), 0)
+
+
+class TestGlobMatch(unittest.TestCase):
+    """Exercise the backtracking-free wildcard matcher"""
+    def _glob_match(self, path, url):
+        segments, anchored = robotexclusionrulesparser._wildcard_segments(path)
+        return robotexclusionrulesparser._glob_match(segments, anchored, url)
+
+    def test_newline_quirks(self):
+        """Ensure encoded newlines are treated exactly as the old regex treated them"""
+        rng = random.Random(11)
+        for _ in range(3000):
+            path = "".join(rng.choice("ab\n*") for _ in range(rng.randint(0, 5)))
+            if ("*" not in path) or (rng.random() < .5):
+                path += "$"
+            url = "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 8)))
+            self.assertEqual(self._glob_match(path, url),
+                             utils_for_tests.reference_wildcard_match(path, url), (path, url))
+
+    def test_adversarial_patterns(self):
+        """Ensure patterns that made the old regex backtrack polynomially scan each URL a bounded
+        number of times
+        """
+        # With the old regex, the first of these took several seconds against a URL of just a
+        # few hundred characters, and the time grew with the sixth power of the URL length.
+        # benchmarks/bench_wildcards.py times them.
+        paths = ("/a*b*c*d*e*f*z",
+                 "/*a*a*a*a*a*a*a*a*a*a*b$",
+                 "*/*/*/*/*/*/*/*/*/*/*/*.php$")
+        urls = ("/" + "abcdef" * 2000,
+                "/" + "a" * 10000,
+                "/" + "x/" * 5000 + "index.html")
+
+        for path in paths:
+            segments = robotexclusionrulesparser._wildcard_segments(path)[0]
+            for url in urls:
+                url = utils_for_tests.ScanCountingStr(url)
+                self.assertFalse(self._glob_match(path, url))
+                # Each segment is searched for once, plus once more for a newline in between.
+                self.assertLessEqual(url.scanned, 2 * (len(url) + len(path)) * len(segments))
+
+    def test_linear_growth(self):
+        """Ensure the matcher's work grows linearly with the URL length"""
+        path = "/a*b*c*d*e*f*z"
+
+        def scanned(length):
+            url = utils_for_tests.ScanCountingStr("/" + ("abcdef" * length))
+            self.assertFalse(self._glob_match(path, url))
+            return url.scanned
+
+        # 10x the input costs 10x the work (give or take the constant for the prefix).
+        self.assertLessEqual(scanned(50000), 10 * scanned(5000) + len(path))
+
+
+class TestIsAllowedMany(unittest.TestCase):
+    """Verify that is_allowed_many() agrees with is_allowed()"""
+    robots_txt = """
+User-agent: foobot
+Disallow: /private/
+Allow: /private/public/
+Disallow: /*.php$
+Disallow: /tmp
+
+User-agent: *
+Disallow:
+"""
+
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.parser.parse(self.robots_txt)
+
+    def _check_agreement(self, parser, urls):
+        for user_agent in ("foobot", "barbot"):
+            for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+                expected = [parser.is_allowed(user_agent, url, syntax) for url in urls]
+                self.assertEqual(parser.is_allowed_many(user_agent, urls, syntax), expected)
+
+    def test_agreement(self):
+        """Compare is_allowed_many() to is_allowed()"""
+        urls = ["/", "/private/", "/private/x.html", "/private/public/x.html", "/index.php",
+                "/index.php?x=1", "/tmp", "/tmpfile", "http://example.com/private/",
+                "/private%2Fx", "/%70rivate/", "", "/private/\0", "/tmp?", "/a;b", "//x/tmp"]
+        self._check_agreement(self.parser, urls)
+        self._check_agreement(self.parser, urls + ["/tmp%0A"])
+        self.assertEqual(self.parser.is_allowed_many("foobot", []), [])
+
+    def test_deep_paths(self):
+        """Ensure rules too deeply nested for one regex still give the right answers"""
+        lines = ["User-agent: *"]
+        lines += ["%s: /%s" % ("Allow" if (i % 2) else "Disallow", "a" * i) for i in range(800)]
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse("\n".join(lines))
+        self._check_agreement(parser, ["/" + "a" * i for i in range(0, 900, 7)])
+
+    def test_same_host(self):
+        """Compare is_allowed_many() to is_allowed() on batches of URLs from one host"""
+        paths = ["/", "/private/", "/private/public/x.html", "/index.php", "/tmp%2Fx",
+                 "/%74mp/", "/tmp?x=1"]
+        for origin in ("", "http://www.example.com", "https://user@example.com:8080"):
+            urls = [origin + path for path in paths]
+            self._check_agreement(self.parser, urls)
+            for odd_one in ("/tmp?", "/tmp#x", "//tmp", "/a;b", "tmp", "\n/tmp", "/tmp\t",
+                            ".example.net/tmp"):
+                self._check_agreement(self.parser, urls + [origin + odd_one])
+
+    def test_random_rules(self):
+        """Compare is_allowed_many() to is_allowed() on random rules"""
+        rng = random.Random(5)
+        for _ in range(50):
+            rules = utils_for_tests.make_random_rules(rng, rng.randint(1, 30))
+            lines = ["User-agent: foobot"]
+            lines += ["%s: %s" % ("Allow" if rule_type == robotexclusionrulesparser._Ruleset.ALLOW
+                                  else "Disallow", path) for rule_type, path in rules]
+            parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+            parser.parse("\n".join(lines))
+            self._check_agreement(parser, utils_for_tests.make_random_urls(rng, 50))
+
+    def test_url_normalization(self):
+        """Ensure the plain path shortcut in URL normalization agrees with urlparse()"""
+        rng = random.Random(9)
+        prefixes = ("", "http://", "https://", "HTTP://", "ftp://", "http:", "https://[")
+        for _ in range(5000):
+            url = rng.choice(prefixes) + "".join(rng.choice("/a?#;%2F\t:@[") for _ in
+                                                 range(rng.randint(0, 8)))
+            try:
+                _, _, path, parameters, query, fragment = \
+                    robotexclusionrulesparser.urllib_urlparse(url)
+            except ValueError:
+                # e.g. an unbalanced bracket in the host name
+                with self.assertRaises(ValueError):
+                    robotexclusionrulesparser._normalize_url(url)
+                continue
+            expected = robotexclusionrulesparser.urllib_urlunparse(("", "", path, parameters,
+                                                                    query, fragment))
+            expected = robotexclusionrulesparser._unquote_path(expected)
+            self.assertEqual(robotexclusionrulesparser._normalize_url(url), expected, url)
+
+
+class TestAgentPolicy(unittest.TestCase):
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.parser.parse("""
+User-agent: FooBot
+Disallow: /private
+Crawl-delay: 2.5
+
+User-agent: *
+Disallow: /
+""")
+
+    def test_agreement(self):
+        """Ensure a policy gives the same answers as the parser"""
+        urls = ["/", "/private", "/private/x", "/public", "http://example.com/private"]
+        for user_agent in ("FooBot", "foobot/1.0", "BarBot"):
+            policy = self.parser.for_agent(user_agent)
+            self.assertEqual(policy.user_agent, user_agent)
+            self.assertEqual(policy.crawl_delay, self.parser.get_crawl_delay(user_agent))
+            for url in urls:
+                for syntax in (robotexclusionrulesparser.MK1996,
+                               robotexclusionrulesparser.GYM2008):
+                    self.assertEqual(policy.is_allowed(url, syntax),
+                                     self.parser.is_allowed(user_agent, url, syntax))
+            self.assertEqual(policy.is_allowed_many(urls),
+                             [self.parser.is_allowed(user_agent, url) for url in urls])
+
+    def test_no_matching_ruleset(self):
+        """Ensure a policy allows everything when no ruleset applies"""
+        self.parser.parse("User-agent: FooBot\nDisallow: /\n")
+        policy = self.parser.for_agent("BarBot")
+        self.assertTrue(policy.is_allowed("/anything"))
+        self.assertEqual(policy.is_allowed_many(["/a", "/b"]), [True, True])
+        self.assertEqual(policy.crawl_delay, None)
+
+    def test_version(self):
+        """Ensure a policy keeps its rules but knows it's stale after parse() runs again"""
+        policy = self.parser.for_agent("FooBot")
+        self.assertTrue(policy.is_current)
+        self.parser.parse("User-agent: *\nDisallow:\n")
+        self.assertFalse(policy.is_current)
+        self.assertNotEqual(policy.version, self.parser.for_agent("FooBot").version)
+        self.assertFalse(policy.is_allowed("/private"))
+        self.assertTrue(self.parser.for_agent("FooBot").is_allowed("/private"))
+
+    def test_immutable(self):
+        """Ensure a policy can't be modified"""
+        policy = self.parser.for_agent("FooBot")
+        with self.assertRaises(AttributeError):
+            policy.crawl_delay = 5
+        with self.assertRaises(AttributeError):
+            policy.foo = 5
+
+    def test_bad_syntax(self):
+        """Ensure a policy rejects an unknown syntax"""
+        with self.assertRaises(ValueError):
+            self.parser.for_agent("FooBot").is_allowed("/", 42)
+
+
+class TestStreamingParser(unittest.TestCase):
+    """Compare feed()/close() and parse_file() to parse()."""
+    robots_txt = ("# A comment\r\nUser-agent: FooBot\r\nUser-agent: BarBot\rDisallow: /private\n"
+                  "Crawl-delay: 5\r\n\r\nUser-agent: *\rAllow: /public\r\rDisallow: /\n"
+                  "Sitemap: http://example.com/sitemap.xml\r\nUser-agent: BazBot\nDisallow: /baz")
+
+    def setUp(self):
+        self.expected = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.expected.parse(self.robots_txt)
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+
+    def test_chunk_sizes(self):
+        """Compare feed() in pieces of every size, including those that split CRLF, to parse()"""
+        for data in (self.robots_txt, self.robots_txt.encode("iso-8859-1")):
+            for size in range(1, len(data) + 1):
+                for i in range(0, len(data), size):
+                    self.parser.feed(data[i:i + size])
+                self.parser.close()
+                self.assertEqual(str(self.parser), str(self.expected))
+                self.assertEqual(self.parser.get_crawl_delay("BarBot"), 5)
+
+    def test_rules_change_on_close(self):
+        """Ensure the rules in effect don't change until close() is called"""
+        self.parser.parse("User-agent: *\nDisallow: /\n")
+        self.parser.feed("User-agent: *\nDisallow:\n")
+        self.assertFalse(self.parser.is_allowed("FooBot", "/"))
+        self.parser.close()
+        self.assertTrue(self.parser.is_allowed("FooBot", "/"))
+
+    def test_close_without_feed(self):
+        """Ensure close() without feed() is the same as parsing an empty file"""
+        self.parser.parse(self.robots_txt)
+        self.parser.close()
+        self.assertEqual(str(self.parser), "")
+        self.assertTrue(self.parser.is_allowed("FooBot", "/private"))
+
+    def test_max_filesize(self):
+        """Ensure feed() and parse_file() ignore data beyond max_filesize"""
+        self.parser.max_filesize = self.robots_txt.index("Crawl-delay")
+        for data in self.robots_txt:
+            self.parser.feed(data)
+        self.parser.close()
+        self.assertFalse(self.parser.is_allowed("FooBot", "/private"))
+        self.assertTrue(self.parser.is_allowed("FooBot", "/public"))
+        self.assertEqual(self.parser.get_crawl_delay("FooBot"), None)
+
+        f = io.BytesIO(self.robots_txt.encode("iso-8859-1"))
+        self.parser.parse_file(f)
+        self.assertEqual(self.parser.get_crawl_delay("FooBot"), None)
+        self.assertTrue(f.tell() <= self.parser.max_filesize)
+
+        # parse() doesn't have a limit.
+        self.parser.parse(self.robots_txt)
+        self.assertEqual(str(self.parser), str(self.expected))
+
+    def test_parse_file(self):
+        """Compare parse_file() of binary and text files to parse()"""
+        self.parser.parse_file(io.BytesIO(self.robots_txt.encode("utf-16")), "utf-16")
+        self.assertEqual(str(self.parser), str(self.expected))
+        self.parser.parse_file(io.StringIO(u"User-agent: *\nDisallow: /\n"))
+        self.assertFalse(self.parser.is_allowed("FooBot", "/"))
+
+        # A file bigger than the chunks read
+        robots_txt = "User-agent: *\n" + "".join(["Disallow: /private%d\n" % i
+                                                  for i in range(3000)])
+        self.parser.max_filesize = None
+        self.parser.parse_file(io.BytesIO(robots_txt.encode("ascii")))
+        self.expected.parse(robots_txt)
+        self.assertEqual(str(self.parser), str(self.expected))
+
+    def test_decoding_errors(self):
+        """Ensure close() raises UnicodeError for undecodable input and keeps the current rules"""
+        self.parser.parse("User-agent: *\nDisallow: /\n")
+        with self.assertRaises(UnicodeError):
+            self.parser.parse_file(io.BytesIO(b"User-agent: *\nDisallow: /\xff\n"), "utf-8")
+        with self.assertRaises(UnicodeError):
+            self.parser.parse_file(io.BytesIO(b"User-agent: *\n"), "no-such-encoding")
+        self.assertFalse(self.parser.is_allowed("FooBot", "/"))
+
+
+class TestTokenizer(unittest.TestCase):
+    """Compare _tokenize_line() to the per-line regexes it replaced."""
+    def test_random_lines(self):
+        """Compare tokens for a large corpus of random lines"""
+        rng = random.Random(42)
+        for line in utils_for_tests.make_random_lines(rng, 50000):
+            self.assertEqual(robotexclusionrulesparser._tokenize_line(line),
+                             utils_for_tests.reference_tokenize_line(line), repr(line))
+
+    def test_lenient_lines(self):
+        """Ensure lines that only the lenient regex understands are still tokenized"""
+        tests = ((u"\ufeffUser-agent: FooBot", ("user-agent", "FooBot")),
+                 ("Useragent:FooBot", ("user-agent", "FooBot")),
+                 ("DISALLOW:\t/foo\t# comment", ("disallow", "/foo")),
+                 ("Sitemap: http://example.com/sitemap.xml",
+                  ("sitemap", "http://example.com/sitemap.xml")),
+                 ("Disallow : /foo", None),
+                 ("   # Disallow: /foo", None),
+                 ("Foo: bar", None),
+                 (" \t ", (None, None)),
+                 )
+        for line, expected in tests:
+            self.assertEqual(robotexclusionrulesparser._tokenize_line(line), expected)
+            self.assertEqual(utils_for_tests.reference_tokenize_line(line), expected)
+
+    def test_case_folded_keywords(self):
+        """Ensure keywords that only match under Unicode case folding are Disallow lines"""
+        lines = (u"Di\u017fallow: /private", u"D\u0131sallow: /x", u"\u017fitemap: /x",
+                 u"U\u017fER-agent: x")
+        for line in lines:
+            data = line.split(":", 1)[1].strip()
+            self.assertEqual(robotexclusionrulesparser._tokenize_line(line), ("disallow", data))
+            self.assertEqual(utils_for_tests.reference_tokenize_line(line), ("disallow", data))
+
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(u"User-agent: *\n" + u"\n".join(lines))
+        self.assertEqual(str(parser), "User-agent: *\nDisallow: /private\nDisallow: /x\n"
+                                      "Disallow: /x\nDisallow: x\n")
+        self.assertFalse(parser.is_allowed("FooBot", "/private/a"))
+
+
+class TestSerialization(unittest.TestCase):
+    """Exercise to_bytes()/from_bytes() and to_json()/from_json()."""
+    robots_txt = u"""Sitemap: http://example.com/sitemap.xml
+Sitemap: http://example.com/sitemap2.xml
+
+User-agent: FooBot
+User-agent: BärBot
+Crawl-delay: 2.5
+Allow: /private/public.html
+Disallow: /private
+Disallow: /a%2Fb%3C
+Disallow: /*.php$
+
+User-agent: *
+Crawl-delay: 0
+Disallow: /
+"""
+
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.parser.parse(self.robots_txt)
+        self.parser._source_url = "http://example.com/robots.txt"
+        self.parser._response_code = 200
+        self.parser._etag = '"abc"'
+        self.parser.use_local_time = False
+
+    def _round_trips(self, parser):
+        rerp = robotexclusionrulesparser.RobotExclusionRulesParser
+        return [rerp.from_bytes(parser.to_bytes()), rerp.from_json(parser.to_json())]
+
+    def _assert_same(self, clone, parser):
+        self.assertEqual(str(clone), str(parser))
+        self.assertEqual(clone.source_url, parser.source_url)
+        self.assertEqual(clone.response_code, parser.response_code)
+        self.assertEqual(clone.expiration_date, parser.expiration_date)
+        self.assertEqual(clone.use_local_time, parser.use_local_time)
+        self.assertEqual(clone.etag, parser.etag)
+        self.assertEqual(clone.last_modified, parser.last_modified)
+        self.assertEqual(clone.sitemaps, parser.sitemaps)
+        for user_agent in (u"FooBot", u"BärBot", u"BazBot"):
+            self.assertEqual(clone.get_crawl_delay(user_agent),
+                             parser.get_crawl_delay(user_agent))
+            for url in ("/", "/private", "/private/public.html", "/a/b<", "/a%2Fb<",
+                        "/index.php", "/index.php?x=1", "/public"):
+                for syntax in (robotexclusionrulesparser.MK1996,
+                               robotexclusionrulesparser.GYM2008):
+                    self.assertEqual(clone.is_allowed(user_agent, url, syntax),
+                                     parser.is_allowed(user_agent, url, syntax))
+
+    def test_round_trip(self):
+        """Ensure rules and fetch details survive a round trip"""
+        for clone in self._round_trips(self.parser):
+            self._assert_same(clone, self.parser)
+        self.assertEqual(self.parser.get_crawl_delay("BazBot"), 0)
+
+        self.parser._etag = None
+        self.parser._last_modified = "Mon, 01 Jan 2018 00:00:00 GMT"
+        for clone in self._round_trips(self.parser):
+            self._assert_same(clone, self.parser)
+
+    def test_empty(self):
+        """Ensure a parser without rules survives a round trip"""
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        for clone in self._round_trips(parser):
+            self._assert_same(clone, parser)
+            self.assertTrue(clone.is_allowed("FooBot", "/"))
+
+    def test_subclass(self):
+        """Ensure loading with a subclass creates an instance of the subclass"""
+        lookalike = robotexclusionrulesparser.RobotFileParserLookalike
+        clone = lookalike.from_bytes(self.parser.to_bytes())
+        self.assertTrue(isinstance(clone, lookalike))
+        self.assertFalse(clone.can_fetch("FooBot", "/private"))
+
+    def test_compact(self):
+        """Ensure the binary format is smaller than a pickle"""
+        self.assertTrue(len(self.parser.to_bytes()) < len(pickle.dumps(self.parser, 2)) / 2)
+
+    def test_corrupt(self):
+        """Ensure damaged or foreign data raises ValueError"""
+        rerp = robotexclusionrulesparser.RobotExclusionRulesParser
+        data = self.parser.to_bytes()
+        for i in range(len(data)):
+            with self.assertRaises(ValueError):
+                rerp.from_bytes(data[:i])
+        # These are the rule types (ALLOW, then four DISALLOWs).
+        self.assertEqual(data.count(b"\x01\x02\x02\x02\x02"), 1)
+        bad_data = (b"XXXX" + data[4:],
+                    data[:4] + b"\xff" + data[5:],
+                    # A rule type that's neither ALLOW nor DISALLOW
+                    data.replace(b"\x01\x02\x02\x02\x02", b"\x01\x07\x02\x02\x02"),
+                    data + b"\nextra")
+        for data in bad_data:
+            with self.assertRaises(ValueError):
+                rerp.from_bytes(data)
+
+        for s in ("", "[]", "{}", '{"version": 99}', self.parser.to_json()[:-10]):
+            with self.assertRaises(ValueError):
+                rerp.from_json(s)
+
+    def test_newline(self):
+        """Ensure strings that would corrupt the binary format are rejected"""
+        self.parser._etag = '"a\nb"'
+        with self.assertRaises(ValueError):
+            self.parser.to_bytes()
+
+
+class TestRulesInterner(unittest.TestCase):
+    """Test sharing identical rules among parsers with a RulesInterner."""
+    ROBOTS_TXT = "User-agent: FooBot\nDisallow: /private\nAllow: /private/ok\n\n" \
+                 "User-agent: BarBot\nDisallow: /private\nAllow: /private/ok\n\n" \
+                 "User-agent: *\nCrawl-delay: 5\nDisallow: /cgi-bin\n"
+
+    def setUp(self):
+        self.interner = robotexclusionrulesparser.RulesInterner()
+
+    def _parse(self, s, interner=True):
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        if interner:
+            parser.interner = self.interner
+        parser.parse(s)
+        return parser
+
+    def _rulesets(self, parser):
+        return parser._RobotExclusionRulesParser__rulesets
+
+    def test_identical_files(self):
+        """Ensure parsers of equivalent robots.txt files share one list of rulesets"""
+        first = self._parse(self.ROBOTS_TXT)
+        # Comments, whitespace, directive case and line endings don't matter.
+        second = self._parse("# Hello\r\n" + self.ROBOTS_TXT.replace("\n", "\r\n")
+                             .replace("Disallow:", "DISALLOW:  ").replace("/ok", "/ok # okay"))
+        third = self._parse(self.ROBOTS_TXT + "Disallow: /tmp\n")
+
+        self.assertTrue(self._rulesets(first) is self._rulesets(second))
+        self.assertFalse(self._rulesets(first) is self._rulesets(third))
+        # The FooBot and BarBot rulesets are identical apart from the name.
+        self.assertTrue(self._rulesets(third)[0] is self._rulesets(first)[0])
+        self.assertTrue(self._rulesets(first)[0]._paths is self._rulesets(first)[1]._paths)
+        self.assertTrue(self._rulesets(first)[0]._compiled is self._rulesets(first)[1]._compiled)
+
+        self.assertEqual((self.interner.files, self.interner.file_hits), (3, 1))
+        self.assertEqual((self.interner.rulesets, self.interner.ruleset_hits), (9, 5))
+        self.assertEqual(self.interner.dedup_ratio, 1.5)
+        self.assertEqual(len(self.interner), 2)
+
+    def test_same_answers(self):
+        """Compare answers from interned and uninterned parsers"""
+        plain = self._parse(self.ROBOTS_TXT, False)
+        parsers = [self._parse(self.ROBOTS_TXT) for _ in range(3)]
+        for parser in parsers:
+            self.assertEqual(str(parser), str(plain))
+            for user_agent in ("FooBot", "BarBot", "BazBot"):
+                self.assertEqual(parser.get_crawl_delay(user_agent),
+                                 plain.get_crawl_delay(user_agent))
+                for path in ("/", "/private", "/private/ok", "/cgi-bin/x"):
+                    self.assertEqual(parser.is_allowed(user_agent, path),
+                                     plain.is_allowed(user_agent, path))
+            parser.expiration_date = plain.expiration_date
+            self.assertEqual(parser.to_bytes(), plain.to_bytes())
+            self.assertEqual(parser.to_json(), plain.to_json())
+
+    def test_reparse(self):
+        """Ensure parsing a new robots.txt doesn't affect other parsers that shared the rules"""
+        first = self._parse(self.ROBOTS_TXT)
+        second = self._parse(self.ROBOTS_TXT)
+        second.parse("User-agent: *\nDisallow: /\n")
+        self.assertTrue(first.is_allowed("BazBot", "/"))
+        self.assertFalse(second.is_allowed("BazBot", "/"))
+
+    def test_shared_rules_are_not_changed(self):
+        """Ensure a ruleset shared by two parsers can't be changed through either of them"""
+        first = self._parse(self.ROBOTS_TXT)
+        second = self._parse(self.ROBOTS_TXT)
+        ruleset = self._rulesets(first)[0]
+        self.assertTrue(ruleset is self._rulesets(second)[0])
+
+        self.assertRaises(TypeError, ruleset.add_disallow_rule, "/more")
+        self.assertRaises(TypeError, ruleset.add_allow_rule, "/more")
+        self.assertRaises(TypeError, ruleset.add_robot_name, "QuxBot")
+        for parser in (first, second):
+            self.assertTrue(parser.is_allowed("FooBot", "/more"))
+            self.assertTrue(parser.is_allowed("QuxBot", "/private"))
+        self.assertEqual(ruleset.robot_names, ("FooBot", ))
+        self.assertEqual(len(ruleset.rules), 2)
+
+    def test_unused_rules_are_freed(self):
+        """Ensure the interner doesn't keep rules that no parser uses"""
+        parsers = [self._parse(self.ROBOTS_TXT + "Disallow: /%d\n" % i) for i in range(10)]
+        self.assertEqual(len(self.interner), 10)
+        del parsers
+        gc.collect()
+        self.assertEqual(len(self.interner), 0)
+
+    def test_pickle(self):
+        """Ensure parsers that use an interner can be pickled"""
+        parsers = [self._parse(self.ROBOTS_TXT) for _ in range(2)]
+        clones = pickle.loads(pickle.dumps(parsers))
+        self.assertEqual(str(clones[0]), str(parsers[0]))
+        self.assertTrue(clones[0].interner is clones[1].interner)
+        self.assertFalse(clones[0].is_allowed("FooBot", "/private"))
+
+
+class TestTrivialPolicies(unittest.TestCase):
+    """Test recognizing robots.txt files that allow or disallow everything."""
+    URLS = ("http://example.com/", "http://example.com", "http://example.com?a=b", "/", "",
+            "/foo", "foo", "//foo/bar", "http://example.com/%2Fa", "http://example.com/#frag",
+            "http://example.com:8080/a;b?c", "https://user@example.com/a", "http://example.com?x",
+            "?x", "foo.html")
+
+    def _parse(self, s):
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(s)
+        return parser
+
+    def _assert_same_answers(self, parser):
+        """Compare the parser's answers with those of its rules."""
+        policy = parser.trivial_policy
+        parser._trivial_policy = None
+        try:
+            for user_agent in ("FooBot", "BarBot/1.0"):
+                for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+                    expected = [parser.is_allowed(user_agent, url, syntax) for url in self.URLS]
+                    self.assertEqual([policy.is_allowed(user_agent, url, syntax)
+                                      for url in self.URLS], expected)
+                    self.assertEqual(parser.is_allowed_many(user_agent, self.URLS, syntax),
+                                     expected)
+        finally:
+            parser._trivial_policy = policy
+
+    def test_allow_all(self):
+        """Ensure files that allow everything are recognized"""
+        for s in ("", "# Nothing here\n", "User-agent: *\nDisallow:\n",
+                  "User-agent: FooBot\nDisallow:\n\nUser-agent: *\nAllow: /\nAllow: /*.html$\n",
+                  "Sitemap: http://example.com/sitemap.xml\n"):
+            parser = self._parse(s)
+            self.assertTrue(parser.trivial_policy is robotexclusionrulesparser.ALLOW_ALL, s)
+            self._assert_same_answers(parser)
+            self.assertTrue(parser.for_agent("FooBot").is_allowed("/anything"))
+
+    def test_disallow_all(self):
+        """Ensure files that disallow everything are recognized"""
+        for s in ("User-agent: *\nDisallow: /\n",
+                  "User-agent: FooBot\nDisallow: /\n\nUser-agent: *\nDisallow: /\nAllow: /ok\n",
+                  "User-agent: *\nDisallow: /\nDisallow: /private\nDisallow: /\n"):
+            parser = self._parse(s)
+            self.assertTrue(parser.trivial_policy is robotexclusionrulesparser.DISALLOW_ALL, s)
+            self._assert_same_answers(parser)
+            self.assertEqual(parser.get_crawl_delay("FooBot"), None)
+
+    def test_not_trivial(self):
+        """Ensure files that give different answers to different URLs or agents aren't trivial"""
+        for s in ("User-agent: *\nDisallow: /private\n",
+                  "User-agent: *\nAllow:\n",
+                  "User-agent: *\nCrawl-delay: 5\nDisallow:\n",
+                  "User-agent: FooBot\nDisallow: /\n",
+                  "User-agent: *\nAllow: /ok\nDisallow: /\n",
+                  "User-agent: *\nDisallow: /\nDisallow: *\n",
+                  "User-agent: *\nDisallow: /\nAllow:\n",
+                  "User-agent: *\nDisallow: /\nAllow: ?a=b\n",
+                  "User-agent: *\nDisallow: /\nAllow: /*.html$\n"):
+            self.assertEqual(self._parse(s).trivial_policy, None, s)
+
+        # The rules after "Disallow: /" still decide URLs that don't start with "/".
+        for s in ("User-agent: *\nDisallow: /\nDisallow: *\n",
+                  "User-agent: *\nDisallow: /\nAllow:\n"):
+            parser = self._parse(s)
+            for url in ("http://example.com", "http://example.com?x", "?x"):
+                self.assertFalse(parser.is_allowed("FooBot", url), (s, url))
+
+    def test_shared_rules(self):
+        """Ensure parsers with identical trivial rules share them"""
+        first = self._parse("User-agent: *\nDisallow: /\n")
+        second = self._parse("User-agent: *\r\nDisallow: /   # Go away\r\n")
+        self.assertTrue(first._RobotExclusionRulesParser__rulesets is
+                        second._RobotExclusionRulesParser__rulesets)
+        self.assertEqual(str(first), "User-agent: *\nDisallow: /\n")
+
+    def test_serialization(self):
+        """Ensure trivial policies survive serialization and pickling"""
+        parser = self._parse("User-agent: *\nDisallow: /\n")
+        rerp = robotexclusionrulesparser.RobotExclusionRulesParser
+        for clone in (rerp.from_bytes(parser.to_bytes()), rerp.from_json(parser.to_json()),
+                      pickle.loads(pickle.dumps(parser))):
+            self.assertTrue(clone.trivial_policy is robotexclusionrulesparser.DISALLOW_ALL)
+        self.assertTrue(pickle.loads(pickle.dumps(robotexclusionrulesparser.ALLOW_ALL)) is
+                        robotexclusionrulesparser.ALLOW_ALL)
+
+    def test_fetch_failure(self):
+        """Ensure the disallow-all fallback after a failed fetch is trivial"""
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser._handle_failure({})
+        self.assertTrue(parser.trivial_policy is robotexclusionrulesparser.DISALLOW_ALL)
+        self.assertFalse(parser.is_allowed("FooBot", "http://example.com/"))
+
+
+class TestCompactRepresentation(unittest.TestCase):
+    """Test the slotted, frozen representation of parsers and rulesets."""
+    ROBOTS_TXT = "Sitemap: http://example.com/sitemap.xml\n\n" \
+                 "User-agent: FooBot\nCrawl-delay: 2\nDisallow: /private\nAllow: /private/ok\n"
+
+    def setUp(self):
+        self.parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.parser.parse(self.ROBOTS_TXT)
+        self.ruleset = self.parser._RobotExclusionRulesParser__rulesets[0]
+
+    def test_no_dict(self):
+        """Ensure parsers and rulesets don't have a __dict__"""
+        compiled = self.ruleset._compiled[robotexclusionrulesparser.GYM2008]
+        for o in (self.parser, self.ruleset, compiled):
+            self.assertFalse(hasattr(o, "__dict__"))
+        # Subclasses still can.
+        lookalike = robotexclusionrulesparser.RobotFileParserLookalike()
+        lookalike.extra = 42
+        self.assertEqual(lookalike.extra, 42)
+
+    def test_frozen(self):
+        """Ensure parse() leaves the rules in their compact, immutable form"""
+        self.assertEqual(self.ruleset.robot_names, ("FooBot", ))
+        self.assertEqual(self.ruleset._rule_types, b"\x02\x01")
+        self.assertEqual(self.ruleset._paths, ("/private", "/private/ok"))
+        self.assertEqual(self.ruleset.rules, ((robotexclusionrulesparser._Ruleset.DISALLOW,
+                                               "/private"),
+                                              (robotexclusionrulesparser._Ruleset.ALLOW,
+                                               "/private/ok")))
+        self.assertEqual(self.parser._sitemaps, ("http://example.com/sitemap.xml", ))
+        self.assertEqual(self.parser.sitemaps, ["http://example.com/sitemap.xml"])
+
+        self.assertRaises(TypeError, self.ruleset.add_disallow_rule, "/more")
+        self.assertEqual(len(self.ruleset.rules), 2)
+
+    def test_pickle_and_copy(self):
+        """Ensure parsers survive pickling and copying"""
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            clone = pickle.loads(pickle.dumps(self.parser, protocol))
+            self.assertEqual(str(clone), str(self.parser))
+            self.assertEqual(clone.sitemaps, self.parser.sitemaps)
+            self.assertEqual(clone.get_crawl_delay("FooBot"), 2)
+            self.assertFalse(clone.is_allowed("FooBot", "/private"))
+            self.assertTrue(clone.is_allowed("FooBot", "/public"))
+
+        clone = copy.copy(self.parser)
+        self.assertEqual(clone.expiration_date, self.parser.expiration_date)
+        self.assertFalse(clone.is_allowed("FooBot", "/private"))
+
+    def test_old_pickle_state(self):
+        """Ensure state in the format of older versions (with __dict__) can be restored"""
+        rerp = robotexclusionrulesparser.RobotExclusionRulesParser
+        ruleset = robotexclusionrulesparser._Ruleset.__new__(robotexclusionrulesparser._Ruleset)
+        ruleset.__setstate__({"robot_names": ["*"], "crawl_delay": None,
+                              "rules": [(robotexclusionrulesparser._Ruleset.DISALLOW, "/a")]})
+        parser = rerp.__new__(rerp)
+        parser.__setstate__({"_source_url": "", "_sitemaps": [],
+                             "_RobotExclusionRulesParser__rulesets": [ruleset]})
+        self.assertFalse(parser.is_allowed("FooBot", "/a"))
+        self.assertTrue(parser.is_allowed("FooBot", "/b"))
+
+
+class TestMinimize(unittest.TestCase):
+    """Verify that minimization removes dead rules without changing any verdict"""
+    def test_differential(self):
+        """Compare minimized rules to the originals with the reference implementation"""
+        rng = random.Random(17)
+        removed = 0
+        for _ in range(500):
+            rules = utils_for_tests.make_random_rules(rng, rng.randint(1, 30))
+            minimized = robotexclusionrulesparser._minimize_rules(rules)
+            removed += len(rules) - len(minimized)
+            urls = utils_for_tests.make_random_urls(rng, 30)
+            # Wildcards and anchors don't treat newlines like other characters.
+            urls += ["/a%0A", "/a/%0Ab", "%0A", "/%0A"]
+            for url in urls:
+                for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+                    self.assertEqual(
+                        utils_for_tests.reference_is_url_allowed(minimized, url, syntax),
+                        utils_for_tests.reference_is_url_allowed(rules, url, syntax),
+                        (rules, minimized, url, syntax))
+
+        self.assertGreater(removed, 0)
+
+    def test_dead_rules(self):
+        """Exercise the kinds of rules that are removed and kept"""
+        s = """
+        User-agent: *
+        Disallow: /private/
+        Disallow: /private/
+        Disallow: /private/secret
+        Disallow: /tmp*
+        Disallow: /tmp/cache
+        Disallow: /*.php$
+        Disallow: /*.php$
+        Disallow: /*.php
+        Disallow: /index.html$
+        Disallow: /index.html$
+        Allow: /public
+        Disallow: /
+        Disallow: /anything
+        Disallow: *.gif
+        Allow: /
+        """
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(s)
+        urls = ["/private/secret", "/tmp/cache", "/tmp", "/x.php", "/a.gif", "/public/a", "/",
+                "/index.html", ""]
+        expected = [parser.is_allowed("foobot", url, syntax) for url in urls
+                    for syntax in (robotexclusionrulesparser.MK1996,
+                                   robotexclusionrulesparser.GYM2008)]
+
+        # "Disallow: /tmp*" covers /tmp/cache under GYM2008 but not MK1996, and
+        # "Disallow: *.gif" is a literal path under MK1996 that "/" doesn't cover.
+        self.assertEqual(parser.minimize(), 6)
+        self.assertEqual(parser.eliminated_rules, 6)
+        self.assertEqual(str(parser), """User-agent: *
+Disallow: /private/
+Disallow: /tmp*
+Disallow: /tmp/cache
+Disallow: /*.php$
+Disallow: /*.php
+Disallow: /index.html$
+Allow: /public
+Disallow: /
+Disallow: *.gif
+""")
+        self.assertEqual([parser.is_allowed("foobot", url, syntax) for url in urls
+                          for syntax in (robotexclusionrulesparser.MK1996,
+                                         robotexclusionrulesparser.GYM2008)], expected)
+        self.assertEqual(parser.minimize(), 0)
+        self.assertEqual(parser.eliminated_rules, 6)
+
+    def test_trivial(self):
+        """Ensure minimized rules can become trivial policies"""
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.minimize_rules = True
+        parser.parse("User-agent: *\nDisallow: /\nDisallow: /a\nAllow: /b\n")
+        self.assertEqual(parser.eliminated_rules, 2)
+        self.assertIs(parser.trivial_policy, robotexclusionrulesparser.DISALLOW_ALL)
+
+        parser.parse("User-agent: *\nDisallow:\nDisallow: /a\n\nUser-agent: b\nAllow: /\n")
+        self.assertEqual(parser.eliminated_rules, 3)
+        self.assertIs(parser.trivial_policy, robotexclusionrulesparser.ALLOW_ALL)
+
+        parser.minimize_rules = False
+        parser.parse("User-agent: *\nDisallow: /\nDisallow: /a\n")
+        self.assertEqual(parser.eliminated_rules, 0)
+
+    def test_shared_rules(self):
+        """Ensure minimizing a parser doesn't change rules it shares with another parser"""
+        interner = robotexclusionrulesparser.RulesInterner()
+        s = "User-agent: *\nDisallow: /a\nDisallow: /a/b\n"
+        parsers = []
+        for _ in range(2):
+            parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+            parser.interner = interner
+            parser.parse(s)
+            parsers.append(parser)
+
+        self.assertEqual(parsers[0].minimize(), 1)
+        self.assertEqual(str(parsers[0]), "User-agent: *\nDisallow: /a\n")
+        self.assertEqual(str(parsers[1]), "User-agent: *\nDisallow: /a\nDisallow: /a/b\n")
+
+
+class TestSubtree(unittest.TestCase):
+    """Verify the answers of is_subtree_allowed()"""
+    def test_differential(self):
+        """Ensure uniform answers agree with the reference implementation for URLs in the subtree"""
+        rng = random.Random(19)
+        for _ in range(500):
+            rules = utils_for_tests.make_random_rules(rng, rng.randint(0, 12))
+            # URLs that start with // would be parsed as having a host name.
+            prefixes = [prefix for prefix in utils_for_tests.make_random_urls(rng, 5) + [""]
+                        if "//" not in prefix]
+            for prefix in prefixes:
+                urls = [prefix + "".join(rng.choice("ab/*$") for _ in range(rng.randint(0, 6)))
+                        for _ in range(20)]
+                urls += [prefix, prefix + "%0A", prefix + "a%0Ab"]
+                urls = [url for url in urls if "//" not in url]
+                for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+                    verdict = robotexclusionrulesparser._subtree_verdict(rules, prefix, syntax)
+                    answers = set([utils_for_tests.reference_is_url_allowed(rules, url, syntax)
+                                   for url in urls])
+                    if verdict == robotexclusionrulesparser.SUBTREE_ALLOWED:
+                        self.assertEqual(answers, set([True]), (rules, prefix, syntax))
+                    elif verdict == robotexclusionrulesparser.SUBTREE_DISALLOWED:
+                        self.assertEqual(answers, set([False]), (rules, prefix, syntax))
+                    else:
+                        self.assertEqual(verdict, robotexclusionrulesparser.SUBTREE_MIXED)
+
+    def test_subtrees(self):
+        """Exercise is_subtree_allowed() on typical rules"""
+        s = """
+        User-agent: *
+        Disallow: /archive/
+        Allow: /archive/2019/public/
+        Disallow: /tmp*
+        Disallow: /*.pdf$
+        Allow: /blog/drafts/ok/
+        Disallow: /blog/drafts/
+
+        User-agent: FooBot
+        Disallow: /
+        """
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(s)
+        ALLOWED = robotexclusionrulesparser.SUBTREE_ALLOWED
+        DISALLOWED = robotexclusionrulesparser.SUBTREE_DISALLOWED
+        MIXED = robotexclusionrulesparser.SUBTREE_MIXED
+
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "/archive/2019/"), DISALLOWED)
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "http://example.com/archive"),
+                         MIXED)
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "/tmp/cache/"), DISALLOWED)
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "/tmp/cache/",
+                                                   robotexclusionrulesparser.MK1996), ALLOWED)
+        # PDFs are disallowed everywhere under GYM2008.
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "/blog/drafts/ok/"), MIXED)
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "/blog/drafts/ok/",
+                                                   robotexclusionrulesparser.MK1996), ALLOWED)
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "/blog/drafts/"), MIXED)
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "/images/"), MIXED)
+        self.assertEqual(parser.is_subtree_allowed("BarBot", "/images/",
+                                                   robotexclusionrulesparser.MK1996), ALLOWED)
+        self.assertEqual(parser.is_subtree_allowed("FooBot", "/images/"), DISALLOWED)
+        self.assertEqual(parser.for_agent("BarBot").is_subtree_allowed("/archive/2019/"),
+                         DISALLOWED)
+        self.assertRaises(ValueError, parser.is_subtree_allowed, "BarBot", "/", 3)
+
+    def test_trivial_policies(self):
+        """Ensure trivial policies and parsers without rules answer for whole subtrees"""
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        self.assertEqual(parser.is_subtree_allowed("FooBot", "/"),
+                         robotexclusionrulesparser.SUBTREE_ALLOWED)
+
+        parser.parse("User-agent: *\nDisallow: /\n")
+        self.assertIs(parser.trivial_policy, robotexclusionrulesparser.DISALLOW_ALL)
+        self.assertEqual(parser.is_subtree_allowed("FooBot", "/a/"),
+                         robotexclusionrulesparser.SUBTREE_DISALLOWED)
+        # Only URLs that don't start with "/" are allowed.
+        self.assertEqual(parser.is_subtree_allowed("FooBot", ""),
+                         robotexclusionrulesparser.SUBTREE_MIXED)
+        self.assertEqual(parser.is_subtree_allowed("FooBot", "http://example.com?x"),
+                         robotexclusionrulesparser.SUBTREE_ALLOWED)
+        self.assertTrue(parser.is_allowed("FooBot", "http://example.com?x=1"))
+        # The general rules give the same answers.
+        prefixes = ("", "/", "/a/", "http://example.com", "http://example.com?x", "?x", "a",
+                    "http://example.com/a?x")
+        answers = [parser.is_subtree_allowed("FooBot", prefix) for prefix in prefixes]
+        parser._trivial_policy = None
+        self.assertEqual([parser.is_subtree_allowed("FooBot", prefix) for prefix in prefixes],
+                         answers)
+        self.assertEqual(robotexclusionrulesparser.ALLOW_ALL.is_subtree_allowed("FooBot", "/"),
+                         robotexclusionrulesparser.SUBTREE_ALLOWED)
@@ -6,6 +6,7 @@ import os
 import time
 import threading
 import datetime
+import zlib
 from wsgiref.handlers import format_date_time as format_as_rfc1123
 
 PY_MAJOR_VERSION = sys.version_info[0]
@@ -85,6 +86,9 @@ class MyHTTPRequestHandler(BaseHTTPRequestHandler):
     Internet, stop! It's fine for internal-use test code but full of assumptions that would
     break and/or be dangerous on the public Internet.
     """
+    # If this is set, '/conditional/' requests get a response with this code and no content.
+    conditional_response_code = None
+
     def do_GET(self):
         """Handle GET requests that start with one of the path prefixes that I expect."""
         if self.path.startswith('/encoding/'):
@@ -95,6 +99,18 @@ class MyHTTPRequestHandler(BaseHTTPRequestHandler):
             self._handle_sleep_request()
         elif self.path.startswith('/expires/'):
             self._handle_expires_request()
+        elif self.path.startswith('/redirect/'):
+            self._handle_redirect_request()
+        elif self.path.startswith('/big/'):
+            self._handle_big_request()
+        elif self.path.startswith('/conditional/'):
+            self._handle_conditional_request()
+        elif self.path.startswith('/cache_control/'):
+            self._handle_cache_control_request()
+        elif self.path.startswith('/retry_after/'):
+            self._handle_retry_after_request()
+        elif self.path.startswith('/compressed/'):
+            self._handle_compressed_request()
         elif self.path.startswith('/die_die_die/'):
             # It's time to quit. This uses code from here:
             # http://stackoverflow.com/questions/10085996/shutdown-socketserver-serve-forver-in-one-thread-python-application/22533929#22533929
@@ -119,11 +135,14 @@ class MyHTTPRequestHandler(BaseHTTPRequestHandler):
 
         # Read content from standard data file which is encoded as utf-8.
         filename = os.path.join(os.path.dirname(__file__), 'robots.txt')
-        with open(filename) as f:
+        with open(filename, 'rb') as f:
             content = f.read().decode('utf-8')
 
+        content = content.encode(encoding)
+
         self.send_response(200)
         self.send_header('Content-Type', 'text/plain; charset={}'.format(encoding))
+        self.send_header('Content-Length', str(len(content)))
         self.end_headers()
         self.wfile.write(content)
 
@@ -135,6 +154,7 @@ class MyHTTPRequestHandler(BaseHTTPRequestHandler):
         path_elements = self.path.split('/')
         response_code = int(path_elements[2])
         self.send_response(response_code)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def _handle_sleep_request(self):
@@ -147,6 +167,7 @@ class MyHTTPRequestHandler(BaseHTTPRequestHandler):
         sleep_time = float(path_elements[2])
         time.sleep(sleep_time)
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def _handle_expires_request(self):
@@ -179,4 +200,322 @@ class MyHTTPRequestHandler(BaseHTTPRequestHandler):
 
         self.send_response(200)
         self.send_header('Expires', expiration_date)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _handle_redirect_request(self):
+        """Redirect a number of times before responding with a robots.txt.
+
+        The path must be something like '/redirect/3/robots.txt' where the number of redirects
+        remaining can vary. When it reaches 0, the response is the same as for '/big/1/'.
+        """
+        path_elements = self.path.split('/')
+        count = int(path_elements[2])
+        if count:
+            self.send_response(302)
+            # A relative Location exercises the client's URL joining.
+            self.send_header('Location', '../{}/robots.txt'.format(count - 1))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self._send_rules(1)
+
+    def _handle_big_request(self):
+        """Respond with a robots.txt that contains a specific number of Disallow rules.
+
+        The path must be something like '/big/5000/robots.txt' where the number of rules can vary.
+        The rules are '/private0', '/private1', etc. for user agent 'FooBot'.
+        """
+        path_elements = self.path.split('/')
+        self._send_rules(int(path_elements[2]))
+
+    def _handle_conditional_request(self):
+        """Respond with 304 (Not Modified) if the request is conditional on the validators
+        that this sends, otherwise respond like '/big/2/'.
+
+        The path must be something like '/conditional/etag/robots.txt' where the validator can be
+        'etag', 'last_modified' or 'both'. The request's headers are saved in the class attribute
+        last_conditional_request so tests can inspect them. Tests can make the request fail by
+        setting the class attribute conditional_response_code.
+        """
+        path_elements = self.path.split('/')
+        validators = path_elements[2]
+        etag = '"v1"'
+        last_modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+
+        MyHTTPRequestHandler.last_conditional_request = (self.headers.get('If-None-Match'),
+                                                         self.headers.get('If-Modified-Since'))
+
+        if MyHTTPRequestHandler.conditional_response_code:
+            self.send_response(MyHTTPRequestHandler.conditional_response_code)
+            self.end_headers()
+            return
+
+        headers = []
+        if validators in ('etag', 'both'):
+            headers.append(('ETag', etag))
+        if validators in ('last_modified', 'both'):
+            headers.append(('Last-Modified', last_modified))
+
+        if (self.headers.get('If-None-Match') == etag) or \
+           (self.headers.get('If-Modified-Since') == last_modified):
+            self.send_response(304)
+            for header in headers:
+                self.send_header(*header)
+            self.end_headers()
+        else:
+            self._send_rules(2, headers)
+
+    def _handle_cache_control_request(self):
+        """Respond like '/big/2/' with a Cache-Control header, an optional Age header and an
+        Expires header for one day in the future.
+
+        The path must be something like '/cache_control/max-age=60,no-cache/0/robots.txt' where the
+        Cache-Control value and the age (in seconds) can vary. An age of '-' omits the Age header.
+        """
+        path_elements = self.path.split('/')
+        headers = [('Cache-Control', path_elements[2]),
+                   ('Expires', format_as_rfc1123(time.time() + 24 * 60 * 60))]
+        if path_elements[3] != '-':
+            headers.append(('Age', path_elements[3]))
+
+        self._send_rules(2, headers)
+
+    def _handle_retry_after_request(self):
+        """Respond with 503 (Service Unavailable) and a Retry-After header.
+
+        The path must be something like '/retry_after/120/robots.txt' where the number of seconds
+        can vary. If it's 'date', the Retry-After header is an HTTP date one hour in the future.
+        """
+        path_elements = self.path.split('/')
+        retry_after = path_elements[2]
+        if retry_after == 'date':
+            retry_after = format_as_rfc1123(time.time() + 60 * 60)
+
+        self.send_response(503)
+        self.send_header('Retry-After', retry_after)
+        self.send_header('Content-Length', '0')
         self.end_headers()
+
+    def _handle_compressed_request(self):
+        """Respond like '/big/N/' with a compressed body.
+
+        The path must be something like '/compressed/gzip/100/robots.txt' where the count can vary
+        and the compression is one of --
+           - gzip
+           - deflate (zlib wrapper, as RFC 9110 specifies)
+           - raw_deflate (no wrapper, as some servers send)
+           - bomb (gzip of a body far bigger than MAX_FILESIZE)
+           - corrupt (gzip with a mangled payload)
+        """
+        path_elements = self.path.split('/')
+        compression = path_elements[2]
+        count = int(path_elements[3])
+        content = self._make_rules(count)
+        if compression == 'bomb':
+            content += b'#' * (20 * 1024 * 1024)
+
+        if compression in ('gzip', 'bomb', 'corrupt'):
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            encoding = 'gzip'
+        elif compression == 'deflate':
+            compressor = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS)
+            encoding = 'deflate'
+        else:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+            encoding = 'deflate'
+        content = compressor.compress(content) + compressor.flush()
+        if compression == 'corrupt':
+            content = content[:10] + b'\xff' * 20 + content[30:]
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _make_rules(self, count):
+        content = 'User-agent: FooBot\n'
+        content += ''.join(['Disallow: /private{}\n'.format(i) for i in range(count)])
+        return content.encode('ascii')
+
+    def _send_rules(self, count, headers=()):
+        content = self._make_rules(count)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(content)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class KeepAliveHTTPRequestHandler(MyHTTPRequestHandler):
+    """Like MyHTTPRequestHandler, but speaks HTTP/1.1 and so keeps connections open between
+    requests. It also acts as a (very) minimal forward proxy by accepting absolute URLs.
+
+    Each request's (client port, path) is appended to the class-level requests list so tests can
+    tell how many connections were used.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Idle connections are closed after this many seconds.
+    timeout = 0.5
+    requests = []
+
+    def do_GET(self):
+        path = self.path
+        if path.startswith('http://'):
+            # Strip the scheme and host from a proxy request.
+            self.path = '/' + path.split('/', 3)[3]
+        KeepAliveHTTPRequestHandler.requests.append((self.client_address[1], path))
+        MyHTTPRequestHandler.do_GET(self)
+
+
+class ScanCountingStr(str):
+    """A str that counts how many of its characters find() and startswith() examine, so that
+    tests can check the wildcard matcher's work without timing it.
+    """
+    def __new__(cls, s):
+        self = str.__new__(cls, s)
+        self.scanned = 0
+        return self
+
+    def find(self, sub, start=0, end=None):
+        end = len(self) if (end is None) else end
+        i = str.find(self, sub, start, end)
+        stop = (i + len(sub)) if (i != -1) else end
+        self.scanned += max(stop - start, 0)
+        return i
+
+    def startswith(self, prefix, start=0, end=None):
+        end = len(self) if (end is None) else end
+        self.scanned += min(len(prefix), max(end - start, 0))
+        return str.startswith(self, prefix, start, end)
+
+
+def reference_wildcard_match(path, url):
+    """Match a (normalized) URL against a GYM2008 wildcard path with the regex that
+    _Ruleset.is_url_allowed() used before the backtracking-free matcher existed.
+    """
+    import re
+
+    if path.endswith("$"):
+        appendix = "$"
+        path = path[:-1]
+    else:
+        appendix = ""
+    path = re.sub(r'\*+', '*', path)
+    parts = path.split("*")
+    pattern = ".*".join([re.escape(p) for p in parts]) + appendix
+
+    return bool(re.match(pattern, url))
+
+
+def reference_is_url_allowed(rules, url, syntax):
+    """Evaluate a list of (rule_type, path) tuples the way _Ruleset.is_url_allowed() did before
+    rules were compiled. Tests use this as the reference for differential comparisons.
+    """
+    import robotexclusionrulesparser as rerp
+
+    _, _, path, parameters, query, fragment = rerp.urllib_urlparse(url)
+    url = rerp.urllib_urlunparse(("", "", path, parameters, query, fragment))
+    url = rerp._unquote_path(url)
+
+    for rule_type, path in rules:
+        if (syntax == rerp.GYM2008) and ("*" in path or path.endswith("$")):
+            if reference_wildcard_match(path, url):
+                return rule_type == rerp._Ruleset.ALLOW
+        else:
+            if url.startswith(path):
+                allowed = (rule_type == rerp._Ruleset.ALLOW)
+                return allowed if path else (not allowed)
+
+    return True
+
+
+def reference_tokenize_line(line):
+    """Classify a line of a robots.txt with the per-line regexes that parse() used before
+    _tokenize_line() existed. The return value has the same meaning as _tokenize_line()'s.
+    """
+    import re
+
+    directive_regex = re.compile("(allow|disallow|user[-]?agent|sitemap|crawl-delay):[ \t]*(.*)",
+                                 re.IGNORECASE)
+
+    def scrub_data(s):
+        s = re.sub(r"""[\000-\037]|\0177""", "", s)
+        s = s.replace("\t", " ")
+        return s.strip()
+
+    line = line.strip()
+    if line and line[0] == '#':
+        return None
+
+    i = line.find("#")
+    if i != -1:
+        line = line[:i]
+    line = line.strip()
+    if not line:
+        return (None, None)
+
+    matches = directive_regex.findall(line)
+    if not matches:
+        return None
+    field, data = matches[0]
+    field = field.lower()
+    if field in ("useragent", "user-agent"):
+        field = "user-agent"
+    elif field not in ("allow", "sitemap", "crawl-delay"):
+        # The old parser treated every other field as a Disallow, including
+        # those that the regex only matches because of Unicode case folding.
+        field = "disallow"
+
+    return field, scrub_data(data)
+
+
+def make_random_lines(rng, count):
+    """Return a list of random robots.txt lines built from fragments that exercise the parser's
+    lenient corners: odd capitalization, keywords with characters that only match under Unicode
+    case folding, byte order marks, comments, stray colons, control characters and Unicode
+    whitespace.
+    """
+    fragments = ["User-agent", "USERAGENT", "user-Agent", "Disallow", "disALLOW", "Allow",
+                 "Sitemap", "Crawl-delay", "crawl-DELAY", "Useragent", "Disallow ", "Foo",
+                 u"Di\u017fallow", u"D\u0131sallow", u"\u017fitemap", u"U\u017fER-agent",
+                 u"S\u0131temap", u"u\u017feragent",
+                 ":", ":", ": ", ":\t", "#", " # ", " ", "\t", "\x0b", "\x00", "\x1f", "\x7f",
+                 u"\ufeff", u"\u00a0", u"\u2003", u"\u0131", u"\u212a", u"\u0130", "*", "$",
+                 "/", "/foo", "%2F", "%41", "5", "1.5", "http://example.com/", u"\u00e9"]
+    lines = []
+    for _ in range(count):
+        lines.append(u"".join([rng.choice(fragments) for _ in range(rng.randint(0, 7))]))
+
+    return lines
+
+
+def make_random_rules(rng, count, wildcards=True):
+    """Return a list of random (rule_type, path) tuples drawn from a small alphabet so that
+    rules frequently overlap.
+    """
+    import robotexclusionrulesparser as rerp
+
+    alphabet = "ab/" + ("*" if wildcards else "")
+    rules = []
+    for _ in range(count):
+        path = "/" + "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 6)))
+        if rng.random() < .05:
+            path = ""
+        if wildcards and rng.random() < .15:
+            path += "$"
+        rule_type = rng.choice((rerp._Ruleset.ALLOW, rerp._Ruleset.DISALLOW))
+        rules.append((rule_type, path))
+
+    return rules
+
+
+def make_random_urls(rng, count):
+    """Return a list of random URL paths drawn from the same alphabet as make_random_rules()."""
+    return ["/" + "".join(rng.choice("ab/") for _ in range(rng.randint(0, 8)))
+            for _ in range(count)]